@@ -5,14 +5,17 @@ import operator
 import os
 import subprocess
 import time
+import zlib
 from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.db import connections, transaction
-from django.db.models import Q, F, Avg
+from django.db.models import Q, F
 
+import elasticutils
 import multidb
 import path
+import redisutils
 from lib import recommend
 from celery.task.sets import TaskSet
 from celeryutils import task
@@ -22,9 +25,9 @@ import cronjobs
 from amo.utils import chunked
 from addons import search
 from addons.models import Addon, FrozenAddon, AppSupport
-from addons.utils import ReverseNameLookup, FeaturedManager, CreaturedManager
+from addons.utils import (ReverseNameLookup, FeaturedManager,
+                          CreaturedManager, RecsScorer, Reindexing)
 from files.models import File
-from stats.models import UpdateCount
 from translations.models import Translation
 
 log = logging.getLogger('z.cron')
@@ -335,31 +338,67 @@ def deliver_hotness():
     b = avg(users three weeks before this week)
     hotness = (a-b) / b if a > 1000 and b > 1 else 0
     """
-    frozen = [f.id for f in FrozenAddon.objects.all()]
-    all_ids = list((Addon.objects.exclude(type=amo.ADDON_PERSONA)
-                   .values_list('id', flat=True)))
-    now = datetime.now()
-    one_week = now - timedelta(days=7)
-    four_weeks = now - timedelta(days=28)
-    for ids in chunked(all_ids, 300):
-        addons = Addon.uncached.filter(id__in=ids).no_transforms()
-        ids = [a.id for a in addons if a.id not in frozen]
-        qs = (UpdateCount.objects.filter(addon__in=ids)
-              .values_list('addon').annotate(Avg('count')))
-        thisweek = dict(qs.filter(date__gte=one_week))
-        threeweek = dict(qs.filter(date__range=(four_weeks, one_week)))
-        for addon in addons:
-            this, three = thisweek.get(addon.id, 0), threeweek.get(addon.id, 0)
-            if this > 1000 and three > 1:
-                addon.update(hotness=(this - three) / float(three))
-            else:
-                addon.update(hotness=0)
-        # Let the database catch its breath.
-        time.sleep(10)
+    from . import tasks
+    today = datetime.now().date()
+    one_week = today - timedelta(days=7)
+    four_weeks = today - timedelta(days=28)
+
+    cursor = connections['default'].cursor()
+    cursor.execute("""
+        CREATE TEMPORARY TABLE tmp_hotness
+        (addon_id INT PRIMARY KEY, hotness DOUBLE NOT NULL)""")
+    # Both averages come out of one scan of update_counts. Frozen add-ons
+    # get no averages, so their hotness is always 0.
+    cursor.execute("""
+        INSERT INTO tmp_hotness
+        SELECT addons.id,
+            IF(this > 1000 AND three > 1, (this - three) / three, 0)
+        FROM addons
+        LEFT JOIN (
+            SELECT addon_id,
+                AVG(IF(`date` >= %s, count, NULL)) AS this,
+                AVG(IF(`date` BETWEEN %s AND %s, count, NULL)) AS three
+            FROM update_counts
+            WHERE `date` >= %s
+            GROUP BY addon_id) counts
+            ON (counts.addon_id = addons.id AND addons.id NOT IN
+                (SELECT addon_id FROM frozen_addons))
+        WHERE addons.addontype_id != %s AND addons.status != %s""",
+                   [one_week, four_weeks, one_week, four_weeks,
+                    amo.ADDON_PERSONA, amo.STATUS_DELETED])
+
+    cursor.execute("""
+        SELECT addon_id FROM tmp_hotness
+        INNER JOIN addons ON addons.id = tmp_hotness.addon_id
+        WHERE addons.hotness != tmp_hotness.hotness""")
+    changed = [r[0] for r in cursor.fetchall()]
+    log.info('Updating hotness of %s add-ons.' % len(changed))
+    if changed:
+        cursor.execute("""
+            UPDATE addons INNER JOIN tmp_hotness
+                ON addons.id = tmp_hotness.addon_id
+            SET addons.hotness = tmp_hotness.hotness
+            WHERE addons.hotness != tmp_hotness.hotness""")
+    cursor.execute('DROP TEMPORARY TABLE tmp_hotness')
+    transaction.commit_unless_managed()
+
+    # All our updates were sql, so invalidate and reindex manually.
+    for chunk in chunked(changed, 150):
+        Addon.objects.invalidate(*Addon.uncached.filter(id__in=chunk)
+                                               .no_transforms())
+    ts = [tasks.index_addons.subtask(args=[chunk])
+          for chunk in chunked(changed, 150)]
+    TaskSet(ts).apply_async()
 
 
 @cronjobs.register
-def recs():
+def recs(incremental=False):
+    """
+    Calculate add-on recommendations from collection membership.
+
+    With `incremental` only the add-ons whose collections changed since the
+    last run are recalculated, along with the add-ons recommending them.
+    """
     start = time.time()
     cursor = connections[multidb.get_slave()].cursor()
     cursor.execute("""
@@ -387,53 +426,147 @@ def recs():
     except Exception:
         log.error('Could not call ps', exc_info=True)
 
-    sim = recommend.similarity  # Locals are faster.
+    fingerprints = RecsFingerprints()
+    changed, removed = fingerprints.diff(addons)
+    # Whether any rows were written, so the scorers need to reload.
+    written = [False]
+    if removed:
+        # Drop the recommendations of add-ons that fell out of the set.
+        written[0] = _dump_recs(dict((addon, []) for addon in removed))
+    keys = None
+    if incremental:
+        keys = changed | _recs_referencing(changed | removed)
+        keys &= set(addons)
+        recs_log.info('%s changed, %s removed, %s to update' %
+                      (len(changed), len(removed), len(keys)))
+        if not keys:
+            fingerprints.save(addons)
+            if written[0]:
+                RecsScorer.bump()
+            return
+
     sims, start, timers = {}, [time.time()], {'calc': [], 'sql': []}
+    # Add-ons whose rows couldn't be written, to recalculate next time.
+    failed = set()
 
     def write_recs():
         calc = time.time()
         timers['calc'].append(calc - start[0])
         try:
-            _dump_recs(sims)
+            if _dump_recs(sims):
+                written[0] = True
         except Exception:
             recs_log.error('Error dumping recommendations. SQL issue.',
                            exc_info=True)
+            failed.update(sims)
         sims.clear()
         timers['sql'].append(time.time() - calc)
         start[0] = time.time()
 
-    for idx, (addon, collections) in enumerate(addons.iteritems(), 1):
-        xs = [(other, sim(collections, cs))
-              for other, cs in addons.iteritems()]
-        # Sort by similarity and keep the top N.
-        others = sorted(xs, key=operator.itemgetter(1), reverse=True)
-        sims[addon] = [(k, v) for k, v in others[:11] if k != addon]
+    top = recommend.top_similar(addons, 10, keys=keys,
+                                processes=settings.RECS_PROCESSES)
+    for idx, (addon, others) in enumerate(top, 1):
+        sims[addon] = others
 
         if idx % 50 == 0:
             write_recs()
     else:
         write_recs()
 
+    # Leaving out the failed add-ons makes the next run see them as changed.
+    fingerprints.save(dict((addon, collections)
+                           for addon, collections in addons.iteritems()
+                           if addon not in failed))
+    if written[0]:
+        RecsScorer.bump()
+
     avg_len = sum(len(v) for v in addons.itervalues()) / float(len(addons))
     recs_log.info('%s addons: average length: %.2f' % (len(addons), avg_len))
     recs_log.info('Processing time: %.2fs' % sum(timers['calc']))
     recs_log.info('SQL time: %.2fs' % sum(timers['sql']))
 
 
+class RecsFingerprints(object):
+    """
+    A checksum of each add-on's collections from the last `recs` run, kept
+    in redis so the next run can tell which add-ons gained or lost
+    collections.
+    """
+
+    def __init__(self):
+        self.redis = redisutils.connections['master']
+        self.key = 'amo:recs:fingerprints'
+
+    @staticmethod
+    def fingerprint(collections):
+        return str(zlib.crc32(array.array('l', collections).tostring()))
+
+    def diff(self, addons):
+        """Returns sets of the changed or new add-ons and the removed ones."""
+        old = self.redis.hgetall(self.key) or {}
+        old = dict((int(k), v) for k, v in old.items())
+        changed = set(addon for addon, collections in addons.iteritems()
+                      if old.get(addon) != self.fingerprint(collections))
+        removed = set(old) - set(addons)
+        return changed, removed
+
+    def save(self, addons):
+        pipe = self.redis.pipeline()
+        pipe.delete(self.key)
+        for chunk in chunked(addons.items(), 1000):
+            pipe.hmset(self.key, dict((addon, self.fingerprint(collections))
+                                      for addon, collections in chunk))
+        pipe.execute()
+
+
+def _recs_referencing(addons):
+    # The add-ons that currently recommend any of `addons`.
+    if not addons:
+        return set()
+    cursor = connections[multidb.get_slave()].cursor()
+    referencing = set()
+    for chunk in chunked(list(addons), 1000):
+        cursor.execute("""
+            SELECT DISTINCT addon_id FROM addon_recommendations
+            WHERE other_addon_id IN %s""", [chunk])
+        referencing.update(r[0] for r in cursor.fetchall())
+    return referencing
+
+
 def _dump_recs(sims):
-    # Dump a dictionary of {addon: (other_addon, score)} into the
-    # addon_recommendations table.
+    # Write a dictionary of {addon: [(other_addon, score)]} into the
+    # addon_recommendations table. Only the rows that changed are written so
+    # the slaves don't have to replay a full DELETE and INSERT for every
+    # add-on. Returns whether anything was written.
+    if not sims:
+        return False
     cursor = connections['default'].cursor()
-    addons = sims.keys()
-    vals = [(addon, other, score) for addon, others in sims.items()
-                                  for other, score in others]
+    cursor.execute("""
+        SELECT addon_id, other_addon_id, score FROM addon_recommendations
+        WHERE addon_id IN %s""", [sims.keys()])
+    old = dict(((addon, other), score)
+               for addon, other, score in cursor.fetchall())
+    new = dict(((addon, other), score) for addon, others in sims.items()
+                                       for other, score in others)
+    # Don't rewrite scores that only differ by float noise.
+    upsert = [(addon, other, score) for (addon, other), score in new.items()
+              if (addon, other) not in old
+              or abs(old[addon, other] - score) > 1e-6 * score]
+    delete = [pair for pair in old if pair not in new]
+    if not (upsert or delete):
+        return False
     cursor.execute('BEGIN')
-    cursor.execute('DELETE FROM addon_recommendations WHERE addon_id IN %s',
-                   [addons])
-    cursor.executemany("""
-        INSERT INTO addon_recommendations (addon_id, other_addon_id, score)
-        VALUES (%s, %s, %s)""", vals)
+    for addon, other in delete:
+        cursor.execute("""
+            DELETE FROM addon_recommendations
+            WHERE addon_id=%s AND other_addon_id=%s""", [addon, other])
+    if upsert:
+        cursor.executemany("""
+            INSERT INTO addon_recommendations (addon_id, other_addon_id, score)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE score=VALUES(score)""", upsert)
     cursor.execute('COMMIT')
+    return True
 
 
 def _group_addons(qs):
@@ -466,16 +599,57 @@ def give_personas_versions():
 
 
 @cronjobs.register
-def reindex_addons():
+def reindex_addons(mode=None):
+    """
+    Reindex the add-ons in the live index.
+
+    With `aliased`, build a new index instead and point the add-ons alias at
+    it once every chunk is in, so searches keep using the complete live index
+    meanwhile. Writes made during the build are replayed into the new index.
+    `status` shows how far along the build is and `abort` drops it.
+    """
     from . import tasks
-    # Make sure our mapping is up to date.
-    search.setup_mapping()
-    ids = (Addon.objects.values_list('id', flat=True)
-           .filter(_current_version__isnull=False,
-                   status__in=amo.VALID_STATUSES,
-                   disabled_by_user=False))
-    ts = [tasks.index_addons.subtask(args=[chunk])
-          for chunk in chunked(sorted(list(ids)), 150)]
+    reindexing = Reindexing()
+    if mode == 'status':
+        progress = reindexing.progress()
+        if not progress:
+            print 'No reindex going on.'
+        else:
+            print ('Reindexing into %(index)s: %(done)s/%(total)s add-ons in '
+                   '%(elapsed)ds.' % progress)
+            if progress['eta'] is not None:
+                print 'About %ds left.' % progress['eta']
+        return
+    if mode == 'abort':
+        progress = reindexing.progress()
+        if progress:
+            reindexing.finish()
+            elasticutils.get_es().delete_index_if_exists(progress['index'])
+            log.info('Dropped the reindex into %s.' % progress['index'])
+        return
+    if mode and mode != 'aliased':
+        raise ValueError('Unknown reindex mode: %s' % mode)
+
+    ids = sorted(Addon.objects.values_list('id', flat=True)
+                 .filter(_current_version__isnull=False,
+                         status__in=amo.VALID_STATUSES,
+                         disabled_by_user=False))
+    chunks = list(chunked(ids, 150))
+    kw = {}
+    if mode == 'aliased':
+        if reindexing.is_reindexing():
+            log.error('A reindex is already going on, see '
+                      '`reindex_addons status`.')
+            return
+        kw['index'] = search.timestamped_index(settings.ES_INDEXES['addons'])
+        search.setup_mapping(kw['index'])
+        reindexing.start(kw['index'], len(chunks), len(ids))
+        log.info('Reindexing %s add-ons into %s.' % (len(ids), kw['index']))
+    else:
+        # Make sure our mapping is up to date.
+        search.setup_mapping()
+    ts = [tasks.index_addons.subtask(args=[chunk], kwargs=kw)
+          for chunk in chunks]
     TaskSet(ts).apply_async()
 
 
@@ -10,6 +10,7 @@ import time
 from datetime import datetime, timedelta
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models, transaction
 from django.dispatch import receiver
 from django.db.models import Q, Max, signals as dbsignals
@@ -18,7 +19,9 @@ from jinja2.filters import do_dictsort
 
 import caching.base as caching
 import commonware.log
+import elasticutils
 import json_field
+import pyes.exceptions as pyes
 from tower import ugettext_lazy as _
 import waffle
 
@@ -406,6 +409,29 @@ class Addon(amo.models.OnChangeMixin, amo.models.ModelBase):
         tasks.unindex_addons.delay([id])
         return True
 
+    # Caches whether add-ons are behind their alias yet, see _get_index.
+    es_index_key = 'addons:es-index:%s'
+
+    @classmethod
+    def _get_index(cls):
+        # Add-ons only leave the default index for their own alias with the
+        # first `reindex_addons aliased`, so keep to the default until then.
+        alias = settings.ES_INDEXES['addons']
+        key = cls.es_index_key % alias
+        index = cache.get(key)
+        if index is None:
+            try:
+                elasticutils.get_es().get_alias(alias)
+                index = alias
+            except pyes.IndexMissingException:
+                index = settings.ES_INDEXES['default']
+            except pyes.ElasticSearchException:
+                # Don't remember anything while elasticsearch is having
+                # trouble, searching will fail the usual way.
+                return alias
+            cache.set(key, index, 60)
+        return index
+
     @classmethod
     def from_upload(cls, upload, platforms):
         from files.utils import parse_addon
@@ -1238,7 +1264,11 @@ def version_changed(sender, **kw):
 def update_search_index(sender, instance, **kw):
     from . import tasks
 
-    if not kw.get('raw'):
+    if kw.get('raw'):
+        return
+    if settings.ADDON_REINDEX_DEBOUNCE:
+        tasks.queue_index([instance.id])
+    else:
         tasks.index_addons.delay([instance.id])
 
 
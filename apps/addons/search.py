@@ -1,10 +1,12 @@
 import logging
+from datetime import datetime
 from operator import attrgetter
 
 import elasticutils
 import pyes.exceptions as pyes
 
 import amo
+from amo.utils import extract_trans
 from .models import Addon
 from bandwagon.models import Collection
 from compat.models import AppCompat
@@ -23,12 +25,11 @@ def extract(addon):
     d = dict(zip(attrs, attrgetter(*attrs)(addon)))
     # Coerce the Translation into a string.
     d['name_sort'] = unicode(addon.name).lower()
+    # Also fills the name_<analyzer>, etc. fields for each language.
     translations = addon.translations
-    d['name'] = list(set(string for _, string in translations[addon.name_id]))
-    d['description'] = list(set(string for _, string
-                                in translations[addon.description_id]))
-    d['summary'] = list(set(string for _, string
-                            in translations[addon.summary_id]))
+    extract_trans(d, 'name', translations[addon.name_id])
+    extract_trans(d, 'description', translations[addon.description_id])
+    extract_trans(d, 'summary', translations[addon.summary_id])
     d['device'] = getattr(addon, 'device_ids', [])
     # This is an extra query, not good for perf.
     d['category'] = getattr(addon, 'category_ids', [])
@@ -59,25 +60,14 @@ def extract(addon):
     # Double the boost if the add-on is public.
     if addon.status == amo.STATUS_PUBLIC:
         d['_boost'] = max(d['_boost'], 1) * 4
-
-    # Indices for each language. languages is a list of locales we want to
-    # index with analyzer if the string's locale matches.
-    for analyzer, languages in amo.SEARCH_ANALYZER_MAP.iteritems():
-        d['name_' + analyzer] = list(
-            set(string for locale, string in translations[addon.name_id]
-                if locale.lower() in languages))
-        d['summary_' + analyzer] = list(
-            set(string for locale, string in translations[addon.summary_id]
-                if locale.lower() in languages))
-        d['description_' + analyzer] = list(
-            set(string for locale, string in translations[addon.description_id]
-                if locale.lower() in languages))
-
     return d
 
 
-def setup_mapping():
-    """Set up the addons index mapping."""
+def setup_mapping(index=None):
+    """
+    Set up the addons index mapping. Given an `index`, only set up the add-on
+    mapping in that index, for a reindex in a new index.
+    """
     # Mapping describes how elasticsearch handles a document during indexing.
     # Most fields are detected and mapped automatically.
     appver = {'dynamic': False, 'properties': {'max': {'type': 'long'},
@@ -122,8 +112,12 @@ def setup_mapping():
     # Adjust the mapping for all models at once because fields are shared
     # across all doc types in an index. If we forget to adjust one of them
     # we'll get burned later on.
-    for model in Addon, AppCompat, Collection, UserProfile:
-        index = model._get_index()
+    if index:
+        indexes = [(Addon, index)]
+    else:
+        indexes = [(model, model._get_index()) for model in
+                   (Addon, AppCompat, Collection, UserProfile)]
+    for model, index in indexes:
         try:
             es.create_index_if_missing(index)
         except pyes.ElasticSearchException:
@@ -132,3 +126,29 @@ def setup_mapping():
             es.put_mapping(model._meta.db_table, mapping, index)
         except pyes.ElasticSearchException, e:
             log.error(e)
+
+
+def timestamped_index(alias):
+    """Names a new index to put behind `alias`."""
+    return '%s-%s' % (alias, datetime.now().strftime('%Y%m%d%H%M%S'))
+
+
+def point_alias(alias, index):
+    """
+    Points `alias` at `index` alone, in one atomic change, and returns the
+    indexes it pointed at before.
+    """
+    es = elasticutils.get_es()
+    try:
+        old = es.get_alias(alias)
+    except pyes.IndexMissingException:
+        old = []
+    if alias in old:
+        # The live index was made before we used an alias. It has to go
+        # before the alias can take its name.
+        log.warning('Deleting the %s index to make it an alias.' % alias)
+        es.delete_index(alias)
+        old.remove(alias)
+    actions = [('remove', i, alias) for i in old if i != index]
+    es.change_aliases(actions + [('add', index, alias)])
+    return [i for i in old if i != index]
@@ -1,23 +1,30 @@
 import os
 import logging
+import socket
+import time
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.storage import default_storage as storage
 from django.db import connection, transaction
 
 from celeryutils import task
+from django_statsd.clients import statsd
 import elasticutils
 from PIL import Image
+import pyes.exceptions as pyes
+import redis as redislib
 
 import amo
 from amo.decorators import set_modified_on, write
-from amo.utils import attach_trans_dict, sorted_groupby
+from amo.utils import attach_trans_dict, chunked, sorted_groupby
 from market.models import AddonPremium
 from tags.models import Tag
 from versions.models import Version
 from . import cron, search  # Pull in tasks from cron.
 from .models import (Addon, Category, CompatOverride, DeviceType,
                      IncompatibleVersions, Preview)
+from .utils import IndexQueue, Reindexing
 
 log = logging.getLogger('z.task')
 
@@ -93,7 +100,15 @@ def delete_preview_files(id, **kw):
 
 @task
 def index_addons(ids, **kw):
+    """
+    Indexes `ids` in the live index, or in the new index of an aliased
+    reindex given as `index`. With `replay`, `ids` were written during the
+    reindex and aren't one of its chunks.
+    """
     es = elasticutils.get_es()
+    index = kw.get('index')
+    if not index:
+        Reindexing().record(ids)
     log.info('Indexing addons %s-%s. [%s]' % (ids[0], ids[-1], len(ids)))
     qs = Addon.uncached.filter(id__in=ids)
     transforms = (attach_categories, attach_devices, attach_prices,
@@ -101,8 +116,54 @@ def index_addons(ids, **kw):
     for t in transforms:
         qs = qs.transform(t)
     for addon in qs:
-        Addon.index(search.extract(addon), bulk=True, id=addon.id)
+        Addon.index(search.extract(addon), bulk=True, id=addon.id,
+                    index=index)
     es.flush_bulk(forced=True)
+    if index and not kw.get('replay'):
+        reindexing = Reindexing()
+        if reindexing.chunk_done(len(ids)):
+            finish_reindex.delay(index)
+        else:
+            progress = reindexing.progress()
+            if progress and progress['eta'] is not None:
+                log.info('Reindexing into %s: %s/%s add-ons, %ds left.' % (
+                    index, progress['done'], progress['total'],
+                    progress['eta']))
+    if kw.get('queued'):
+        # Time from the first save in the batch to being searchable.
+        statsd.timing('addons.reindex.lag',
+                      int((time.time() - kw['queued']) * 1000))
+
+
+def queue_index(ids):
+    """
+    Queues `ids` for reindexing with the next drain of the IndexQueue,
+    scheduling one if needed.
+    """
+    try:
+        scheduled = IndexQueue().add(ids)
+    except (redislib.RedisError, socket.error), e:
+        # This runs in post_save, don't break saves while redis is down.
+        log.error('Could not queue add-ons %s for reindexing: %s' % (ids, e))
+        index_addons.delay(ids)
+        return
+    if scheduled:
+        drain_index_queue.apply_async(
+            countdown=settings.ADDON_REINDEX_DEBOUNCE)
+
+
+@task
+def drain_index_queue(**kw):
+    ids, queued, saves = IndexQueue().drain()
+    if not ids:
+        return
+    # saves / indexed is how many saves each reindex stands for.
+    statsd.incr('addons.reindex.saves', saves)
+    statsd.incr('addons.reindex.indexed', len(ids))
+    log.info('Reindexing %s add-ons for %s saves.' % (len(ids), saves))
+    for chunk in chunked(ids, 150):
+        first = min(queued.get(id, time.time()) for id in chunk)
+        index_addons.delay(chunk, queued=first)
 
 
 def attach_devices(addons):
@@ -147,9 +208,46 @@ def attach_tags(addons):
 
 @task
 def unindex_addons(ids, **kw):
+    index = kw.get('index')
+    if not index:
+        Reindexing().record(ids)
     for addon in ids:
         log.info('Removing addon [%s] from search index.' % addon)
-        Addon.unindex(addon)
+        Addon.unindex(addon, index=index)
+
+
+@task
+def finish_reindex(index, **kw):
+    """
+    Points the add-ons alias at the new `index` and writes the add-ons saved
+    or deleted since the reindex started to it.
+    """
+    alias = settings.ES_INDEXES['addons']
+    old = search.point_alias(alias, index)
+    # Stop writing to the default index right away if add-ons were there.
+    cache.set(Addon.es_index_key % alias, alias, 60)
+    ids = Reindexing().finish()
+    log.info('Add-ons alias now points at %s, replaying %s writes.' %
+             (index, len(ids)))
+    existing = set(Addon.uncached.filter(id__in=ids)
+                   .values_list('id', flat=True))
+    for chunk in chunked(sorted(existing), 150):
+        index_addons.delay(chunk, index=index, replay=True)
+    gone = [id for id in ids if id not in existing]
+    if gone:
+        unindex_addons.delay(gone, index=index)
+    es = elasticutils.get_es()
+    for name in old:
+        log.info('Deleting the old add-ons index %s.' % name)
+        es.delete_index(name)
+    if not old:
+        # The first aliased reindex leaves add-ons in the default index.
+        default = settings.ES_INDEXES['default']
+        log.info('Deleting the add-ons left in %s.' % default)
+        try:
+            es.delete_mapping(default, Addon._meta.db_table)
+        except pyes.ElasticSearchException, e:
+            log.error(e)
 
 
 @task
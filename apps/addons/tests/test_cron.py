@@ -1,13 +1,19 @@
+import datetime
 import os.path
+
+from django.conf import settings
+
 from nose.tools import eq_
 import mock
 
 import amo
 import amo.tests
-from addons import cron
-from addons.models import Addon, AppSupport
-from addons.utils import ReverseNameLookup
+from addons import cron, tasks
+from addons.models import (Addon, AddonRecommendation, AppSupport,
+                           FrozenAddon)
+from addons.utils import ReverseNameLookup, RecsScorer, Reindexing
 from files.models import File, Platform
+from stats.models import UpdateCount
 from versions.models import Version
 
 
@@ -220,6 +226,209 @@ class AvgDailyUserCountTestCase(amo.tests.TestCase):
         eq_(addon.average_daily_users, addon.total_downloads)
 
 
+@mock.patch('addons.tasks.index_addons')
+class TestDeliverHotness(amo.tests.TestCase):
+    fixtures = ['base/addon_3615']
+
+    def setUp(self):
+        today = datetime.date.today()
+        for days in range(28):
+            count = 2000 if days < 7 else 1000
+            UpdateCount.objects.create(
+                addon_id=3615, count=count,
+                date=today - datetime.timedelta(days=days))
+
+    def hotness(self):
+        return Addon.objects.no_cache().get(pk=3615).hotness
+
+    def test_hotness(self, index_addons):
+        cron.deliver_hotness()
+        # A week ago counts towards both averages.
+        eq_(self.hotness(), (7 * 2000 + 1000) / 8. / 1000 - 1)
+        eq_(index_addons.subtask.call_args[1]['args'], [[3615]])
+
+    def test_below_threshold(self, index_addons):
+        Addon.objects.get(pk=3615).update(hotness=5)
+        UpdateCount.objects.update(count=10)
+        cron.deliver_hotness()
+        eq_(self.hotness(), 0)
+
+    def test_frozen(self, index_addons):
+        FrozenAddon.objects.create(addon_id=3615)
+        cron.deliver_hotness()
+        eq_(self.hotness(), 0)
+
+    def test_unchanged(self, index_addons):
+        cron.deliver_hotness()
+        index_addons.reset_mock()
+        cron.deliver_hotness()
+        assert not index_addons.subtask.called
+
+
+class TestRecs(amo.tests.TestCase):
+    fixtures = ['base/addon-recs']
+
+    def setUp(self):
+        self.addons = {1843: [1, 2, 3, 4], 2108: [1, 2, 3, 5],
+                       249: [2, 3, 4, 6], 59: [7, 8, 9, 10]}
+        patcher = mock.patch.object(cron, '_group_addons')
+        self.group_addons = patcher.start()
+        self.group_addons.side_effect = lambda qs: dict(
+            (k, list(v)) for k, v in self.addons.items())
+        self.addCleanup(patcher.stop)
+
+    def recs(self, addon):
+        return dict(AddonRecommendation.objects.filter(addon=addon)
+                    .values_list('other_addon', 'score'))
+
+    def test_dump_recs_upserts(self):
+        rec = AddonRecommendation.objects.get(addon=1843, other_addon=2108)
+        cron._dump_recs({1843: [(2108, .5), (59, .25)]})
+        eq_(self.recs(1843), {2108: .5, 59: .25})
+        # The existing row was updated in place.
+        eq_(AddonRecommendation.objects.get(addon=1843, other_addon=2108).pk,
+            rec.pk)
+
+    def test_dump_recs_unchanged(self):
+        cron._dump_recs({1843: [(2108, .5)]})
+        with self.assertNumQueries(1):
+            cron._dump_recs({1843: [(2108, .5)]})
+
+    def test_fingerprints(self):
+        fingerprints = cron.RecsFingerprints()
+        eq_(fingerprints.diff(self.addons), (set(self.addons), set()))
+        fingerprints.save(self.addons)
+        eq_(fingerprints.diff(self.addons), (set(), set()))
+        self.addons[59] = [7, 8, 9, 11]
+        del self.addons[249]
+        eq_(fingerprints.diff(self.addons), (set([59]), set([249])))
+
+    def test_full(self):
+        cron.recs()
+        for addon in self.addons:
+            eq_(sorted(self.recs(addon)),
+                sorted(a for a in self.addons if a != addon))
+
+    @mock.patch.object(cron.recommend, 'top_similar')
+    def test_incremental_unchanged(self, top_similar):
+        cron.recs()
+        top_similar.reset_mock()
+        cron.recs(incremental=True)
+        assert not top_similar.called
+
+    def test_incremental(self):
+        cron.recs()
+        self.addons[59] = [1, 2, 8, 9]
+        with mock.patch.object(cron.recommend, 'top_similar') as top_similar:
+            top_similar.return_value = []
+            cron.recs(incremental=True)
+        # 59 changed and everyone recommends it.
+        eq_(top_similar.call_args[1]['keys'], set(self.addons))
+
+    def test_incremental_after_failed_write(self):
+        with mock.patch.object(cron, '_dump_recs') as dump_recs:
+            dump_recs.side_effect = Exception
+            cron.recs()
+        # Nothing was written, so the next run does it all again.
+        with mock.patch.object(cron.recommend, 'top_similar') as top_similar:
+            top_similar.return_value = []
+            cron.recs(incremental=True)
+        eq_(top_similar.call_args[1]['keys'], set(self.addons))
+
+    def test_incremental_removed(self):
+        cron.recs()
+        del self.addons[59]
+        cron.recs(incremental=True)
+        eq_(AddonRecommendation.objects.filter(addon=59).count(), 0)
+        eq_(AddonRecommendation.objects.filter(
+            addon__in=self.addons, other_addon=59).count(), 0)
+
+    def test_bumps_scorer_version(self):
+        cron.recs()
+        version = RecsScorer.redis().get(RecsScorer.version_key)
+        assert version
+        with mock.patch.object(RecsScorer, 'bump') as bump:
+            cron.recs(incremental=True)
+            # Nothing was written, the scorers can keep what they have.
+            assert not bump.called
+            del self.addons[59]
+            cron.recs(incremental=True)
+            assert bump.called
+
+
+@mock.patch('addons.tasks.index_addons')
+@mock.patch('addons.cron.search.setup_mapping')
+class TestAliasedReindex(amo.tests.TestCase):
+    fixtures = ['base/addon_3615']
+
+    def test_aliased(self, setup_mapping, index_addons):
+        cron.reindex_addons('aliased')
+        index = setup_mapping.call_args[0][0]
+        assert index.startswith(settings.ES_INDEXES['addons'] + '-')
+        eq_(index_addons.subtask.call_args[1],
+            {'args': [[3615]], 'kwargs': {'index': index}})
+        progress = Reindexing().progress()
+        eq_(progress['index'], index)
+        eq_(progress['total'], 1)
+
+    def test_already_reindexing(self, setup_mapping, index_addons):
+        Reindexing().start('amo_addons-1', chunks=1, total=1)
+        cron.reindex_addons('aliased')
+        assert not setup_mapping.called
+        assert not index_addons.subtask.called
+
+    @mock.patch('addons.cron.elasticutils')
+    def test_abort(self, es, setup_mapping, index_addons):
+        Reindexing().start('amo_addons-1', chunks=1, total=1)
+        cron.reindex_addons('abort')
+        assert not Reindexing().is_reindexing()
+        es.get_es().delete_index_if_exists.assert_called_with('amo_addons-1')
+
+    def test_live(self, setup_mapping, index_addons):
+        cron.reindex_addons()
+        eq_(setup_mapping.call_args[0], ())
+        eq_(index_addons.subtask.call_args[1],
+            {'args': [[3615]], 'kwargs': {}})
+        assert not Reindexing().is_reindexing()
+
+
+@mock.patch('addons.tasks.elasticutils')
+@mock.patch('addons.tasks.search.point_alias')
+@mock.patch('addons.tasks.unindex_addons.delay')
+@mock.patch('addons.tasks.index_addons.delay')
+class TestFinishReindex(amo.tests.TestCase):
+    fixtures = ['base/addon_3615']
+
+    def test_finish(self, index, unindex, point_alias, es):
+        point_alias.return_value = ['amo_addons-0']
+        reindexing = Reindexing()
+        reindexing.start('amo_addons-1', chunks=1, total=1)
+        reindexing.record([3615, 999])
+        tasks.finish_reindex('amo_addons-1')
+        point_alias.assert_called_with(settings.ES_INDEXES['addons'],
+                                       'amo_addons-1')
+        index.assert_called_with([3615], index='amo_addons-1', replay=True)
+        unindex.assert_called_with([999], index='amo_addons-1')
+        es.get_es().delete_index.assert_called_with('amo_addons-0')
+        assert not es.get_es().delete_mapping.called
+        assert not reindexing.is_reindexing()
+
+    def test_finish_first(self, index, unindex, point_alias, es):
+        point_alias.return_value = []
+        Reindexing().start('amo_addons-1', chunks=1, total=1)
+        tasks.finish_reindex('amo_addons-1')
+        # Add-ons go to the alias from now on, and leave the default index.
+        eq_(Addon._get_index(), settings.ES_INDEXES['addons'])
+        es.get_es().delete_mapping.assert_called_with(
+            settings.ES_INDEXES['default'], 'addons')
+
+    def test_replay_not_a_chunk(self, index, unindex, point_alias, es):
+        reindexing = Reindexing()
+        reindexing.start('amo_addons-1', chunks=2, total=2)
+        tasks.index_addons([3615], index='amo_addons-1', replay=True)
+        eq_(reindexing.progress()['done'], 0)
+
+
 class TestReindex(amo.tests.ESTestCase):
 
     @mock.patch('addons.models.update_search_index', new=mock.Mock)
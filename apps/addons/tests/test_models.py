@@ -11,11 +11,13 @@ from django import forms
 from django.contrib.auth.models import AnonymousUser
 from django.conf import settings
 from django.core import mail
+from django.core.cache import cache
 from django.db import IntegrityError
 from django.utils import translation
 
 from mock import patch, Mock
 from nose.tools import eq_, assert_not_equal, raises
+import pyes.exceptions as pyes
 import waffle
 
 import amo
@@ -1791,6 +1793,24 @@ class TestSearchSignals(amo.tests.ESTestCase):
         eq_(Addon.search().count(), 0)
 
 
+@patch('addons.models.elasticutils.get_es')
+class TestGetIndex(amo.tests.TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_alias(self, get_es):
+        eq_(Addon._get_index(), settings.ES_INDEXES['addons'])
+        get_es().get_alias.assert_called_with(settings.ES_INDEXES['addons'])
+
+    def test_no_alias(self, get_es):
+        get_es().get_alias.side_effect = pyes.IndexMissingException('nope')
+        eq_(Addon._get_index(), settings.ES_INDEXES['default'])
+        eq_(Webapp._get_index(), settings.ES_INDEXES['default'])
+        # It's only looked up once in a while.
+        eq_(get_es().get_alias.call_count, 1)
+
+
 class TestLanguagePack(TestLanguagePack):
 
     def setUp(self):
@@ -8,6 +8,7 @@ from django.db import connection
 from django.utils.encoding import smart_str
 
 from nose.tools import eq_
+import mock
 
 import amo
 import amo.tests
@@ -19,6 +20,12 @@ import settings_local
 from versions.models import ApplicationsVersions, Version
 
 
+def get_index():
+    index = update.UpdateIndex()
+    index.build(connection.cursor())
+    return index
+
+
 class TestDataValidate(amo.tests.TestCase):
     fixtures = ['base/addon_3615',
                 'base/platforms',
@@ -134,14 +141,18 @@ class TestLookup(amo.tests.TestCase):
         # Allow version to be optional.
         if args[0]:
             data['version'] = args[0]
-        up = update.Update(data)
-        up.cursor = connection.cursor()
+        up = self.make_update(data)
         assert up.is_valid()
         up.data['version_int'] = args[1]
         up.get_update()
         return (up.data['row'].get('version_id'),
                 up.data['row'].get('file_id'))
 
+    def make_update(self, data):
+        up = update.Update(data)
+        up.cursor = connection.cursor()
+        return up
+
     def change_status(self, version, status):
         version = Version.objects.get(pk=version)
         file = version.files.all()[0]
@@ -428,15 +439,19 @@ class TestDefaultToCompat(amo.tests.TestCase):
             for file in version.files.all():
                 file.update(**kw)
 
+    def make_update(self, data):
+        up = update.Update(data)
+        up.cursor = connection.cursor()
+        return up
+
     def get(self, **kw):
-        up = update.Update({
+        up = self.make_update({
             'reqVersion': 1,
             'id': self.addon.guid,
             'version': kw.get('item_version', '1.0'),
             'appID': self.app.guid,
             'appVersion': kw.get('app_version', '3.0'),
         })
-        up.cursor = connection.cursor()
         assert up.is_valid()
         up.compat_mode = kw.get('compat_mode', 'strict')
         up.get_update()
@@ -805,3 +820,313 @@ class TestResponse(amo.tests.TestCase):
         data['appVersion'] = '5.0.1'
         upd = self.get(data)
         eq_(upd.get_rdf(), upd.get_no_updates_rdf())
+
+
+class TestDataValidateIndex(TestDataValidate):
+    """Validates against the in-process index instead of MySQL."""
+
+    def get(self, data):
+        return update.Update(data, index=get_index())
+
+    def test_guid_case(self):
+        data = self.good_data.copy()
+        data['id'] = data['id'].upper()
+        assert self.get(data).is_valid()
+
+
+class TestLookupIndex(TestLookup):
+    """Runs the lookups against the in-process index instead of MySQL."""
+
+    def make_update(self, data):
+        return update.Update(data, index=get_index())
+
+
+class TestDefaultToCompatIndex(TestDefaultToCompat):
+    """Runs the default to compatible checks against the index."""
+
+    def make_update(self, data):
+        return update.Update(data, index=get_index())
+
+
+class TestDefaultToCompatOverrides(TestDefaultToCompat):
+    """Filters compat overrides with the preloaded ranges."""
+
+    def make_update(self, data):
+        overrides = update.CompatOverrides()
+        overrides.load(connection.cursor())
+        up = update.Update(data, overrides=overrides)
+        up.cursor = connection.cursor()
+        return up
+
+
+class TestCompatOverrides(amo.tests.TestCase):
+    fixtures = ['addons/default-to-compat']
+
+    def setUp(self):
+        self.addon = Addon.objects.get(id=337203)
+        self.app = Application.objects.get(id=1)
+        self.app_version_int_4_0 = 4000000200100
+        self.app_version_int_5_0 = 5000000200100
+        self.app_version_int_8_0 = 8000000200100
+        self.ver_1_0 = 1268881
+        self.ver_1_2 = 1268883
+        self.ver_1_3 = 1268884
+
+    def create_override(self, **kw):
+        co = CompatOverride.objects.create(
+            name='test', guid=self.addon.guid, addon=self.addon
+        )
+        default = dict(compat=co, app=self.app, min_version='0',
+                       max_version='*', min_app_version='0',
+                       max_app_version='*')
+        default.update(kw)
+        CompatOverrideRange.objects.create(**default)
+
+    def get_overrides(self):
+        overrides = update.CompatOverrides()
+        overrides.load(connection.cursor())
+        return overrides
+
+    def test_incompatible(self):
+        self.create_override(min_version='1.2', max_version='1.3',
+                             min_app_version='5.0', max_app_version='6.*')
+        overrides = self.get_overrides()
+        eq_(overrides.incompatible(self.app.id, self.addon.id,
+                                   self.app_version_int_4_0), [])
+        eq_(sorted(overrides.incompatible(self.app.id, self.addon.id,
+                                          self.app_version_int_5_0)),
+            [self.ver_1_2, self.ver_1_3])
+        eq_(overrides.incompatible(self.app.id + 1, self.addon.id,
+                                   self.app_version_int_5_0), [])
+
+    def test_wildcards(self):
+        self.create_override()
+        overrides = self.get_overrides()
+        assert overrides.is_incompatible(self.app.id, self.addon.id,
+                                         self.ver_1_0, 0)
+        assert overrides.is_incompatible(self.app.id, self.addon.id,
+                                         self.ver_1_0,
+                                         self.app_version_int_8_0)
+
+    def test_refresh(self):
+        overrides = self.get_overrides()
+        assert not overrides.refresh(connection.cursor())
+        self.create_override()
+        assert overrides.refresh(connection.cursor())
+        assert overrides.incompatible(self.app.id, self.addon.id,
+                                      self.app_version_int_5_0)
+
+
+class TestResponseIndex(TestResponse):
+    """Builds the responses from the in-process index instead of MySQL."""
+
+    def get(self, data):
+        return update.Update(data, index=get_index())
+
+
+class TestUpdateIndex(amo.tests.TestCase):
+    fixtures = ['base/addon_3615',
+                'base/platforms']
+
+    def setUp(self):
+        self.index = get_index()
+        self.addon = Addon.objects.get(pk=3615)
+
+    def test_refresh_changed(self):
+        file = File.objects.get(pk=67442)
+        File.objects.filter(pk=67442).update(status=amo.STATUS_DISABLED,
+                                             modified=datetime.now())
+        self.index.refresh(connection.cursor())
+        files = self.index.files[self.addon.pk]
+        assert not [k for k in files if k[2] == file.status]
+        assert [k for k in files if k[2] == amo.STATUS_DISABLED]
+
+    def test_refresh_removes_inactive(self):
+        self.addon.update(disabled_by_user=True, modified=datetime.now())
+        self.index.refresh(connection.cursor())
+        eq_(self.index.get_addon(self.addon.guid), None)
+
+    def test_refresh_unchanged(self):
+        files = self.index.files[self.addon.pk]
+        self.index.since = datetime.now() + timedelta(days=1)
+        self.index.refresh(connection.cursor())
+        assert self.index.files[self.addon.pk] is files
+
+    def test_get_index_disabled(self):
+        eq_(update.get_index(), None)
+
+
+class TestResponseCache(amo.tests.TestCase):
+    fixtures = ['base/addon_3615',
+                'base/platforms']
+
+    def setUp(self):
+        self.addon = Addon.objects.get(pk=3615)
+        self.cache = update.ResponseCache(10)
+        self.good_data = {
+            'id': '{2fa4ed95-0317-4c6a-a74c-5f3e3912c1f9}',
+            'version': '2.0.58',
+            'reqVersion': 1,
+            'appID': '{ec8030f7-c20a-464f-9b0e-13a3a9e97384}',
+            'appVersion': '3.7a1pre',
+        }
+        File.objects.filter(pk=67442).update(
+            datestatuschanged=datetime.now() - timedelta(days=1))
+
+    def get(self, data):
+        up = update.Update(data, cache=self.cache)
+        up.cursor = connection.cursor()
+        return up
+
+    def test_hit(self):
+        rdf = self.get(self.good_data).get_rdf()
+        eq_(len(self.cache.entries), 1)
+        up = self.get(self.good_data)
+        with mock.patch.object(up, 'get_update') as get_update:
+            eq_(up.get_rdf(), rdf)
+            assert not get_update.called
+
+    def test_version_int(self):
+        self.get(self.good_data).get_rdf()
+        data = self.good_data.copy()
+        data['appVersion'] = '3.7.0.0a1pre'
+        self.get(data).get_rdf()
+        eq_(len(self.cache.entries), 1)
+
+    def test_no_updates(self):
+        data = self.good_data.copy()
+        data['appVersion'] = '5.0.1'
+        up = self.get(data)
+        eq_(up.get_rdf(), up.get_no_updates_rdf())
+        eq_(self.cache.entries.values(), [up.get_no_updates_rdf()])
+
+    def test_bad_not_cached(self):
+        data = self.good_data.copy()
+        data['id'] = 'garbage'
+        self.get(data).get_rdf()
+        eq_(len(self.cache.entries), 0)
+
+    def test_premium_not_cached(self):
+        self.addon.update(premium_type=amo.ADDON_PREMIUM)
+        self.get(self.good_data).get_rdf()
+        eq_(len(self.cache.entries), 0)
+
+    def test_mirror_delay_not_cached(self):
+        File.objects.filter(pk=67442).update(datestatuschanged=datetime.now())
+        self.get(self.good_data).get_rdf()
+        eq_(len(self.cache.entries), 0)
+
+    def test_lru(self):
+        for i in range(12):
+            self.cache.set((i,), str(i))
+        eq_(len(self.cache.entries), 10)
+        eq_(self.cache.get((0,)), None)
+        eq_(self.cache.get((2,)), '2')
+        self.cache.set((12,), '12')
+        eq_(self.cache.get((2,)), '2')
+        eq_(self.cache.get((3,)), None)
+
+    def test_invalidate(self):
+        self.cache.set((1, 'a'), 'one')
+        self.cache.set((2, 'a'), 'two')
+        self.cache.invalidate(set([1]))
+        eq_(self.cache.entries.keys(), [(2, 'a')])
+        self.cache.invalidate(None)
+        eq_(len(self.cache.entries), 0)
+
+    def test_refresh_file_status(self):
+        self.get(self.good_data).get_rdf()
+        self.cache.since = datetime.now() - timedelta(minutes=1)
+        File.objects.filter(pk=67442).update(status=amo.STATUS_DISABLED,
+                                             datestatuschanged=datetime.now())
+        self.cache.refresh(connection.cursor())
+        eq_(len(self.cache.entries), 0)
+
+    def test_index_refresh_invalidates(self):
+        self.get(self.good_data).get_rdf()
+        index = update.UpdateIndex(on_change=self.cache.invalidate)
+        index.build(connection.cursor())
+        eq_(len(self.cache.entries), 0)
+
+
+class TestBulkUpdate(amo.tests.TestCase):
+    fixtures = ['base/addon_3615',
+                'base/platforms',
+                'base/seamonkey']
+
+    def setUp(self):
+        self.defaults = {
+            'reqVersion': 1,
+            'appID': '{ec8030f7-c20a-464f-9b0e-13a3a9e97384}',
+            'appVersion': '3.7a1pre',
+        }
+        self.items = [
+            {'id': '{2fa4ed95-0317-4c6a-a74c-5f3e3912c1f9}',
+             'version': '2.0.58'},
+            {'id': 'bettergmail2@ginatrapani.org', 'version': '1',
+             'appID': '{92650c4d-4b8e-4d2a-b7eb-24ecf4f6b63a}',
+             'appVersion': '1.0'},
+        ]
+
+    def get(self, items, compat_mode='strict'):
+        up = update.BulkUpdate(items, self.defaults, compat_mode)
+        up.cursor = connection.cursor()
+        return up
+
+    def test_combined(self):
+        rdf = self.get(self.items).get_rdf()
+        eq_(rdf.count('<?xml'), 1)
+        eq_(rdf.count('</RDF:RDF>'), 1)
+        assert 'urn:mozilla:extension:%s:2.0.58' % self.items[0]['id'] in rdf
+        assert 'urn:mozilla:extension:%s:0.5.2' % self.items[1]['id'] in rdf
+        assert '{92650c4d-4b8e-4d2a-b7eb-24ecf4f6b63a}' in rdf
+
+    def test_same_as_single(self):
+        data = dict(self.defaults, **self.items[0])
+        single = update.Update(data)
+        single.cursor = connection.cursor()
+        eq_(self.get(self.items[:1]).get_rdf(), single.get_rdf())
+
+    def test_no_updates(self):
+        items = [dict(self.items[0], appVersion='5.0.1')]
+        rdf = self.get(items).get_rdf()
+        assert '<RDF:li' not in rdf
+        assert 'urn:mozilla:extension:%s' % self.items[0]['id'] in rdf
+
+    def test_invalid_skipped(self):
+        items = [{'id': 'garbage'}, 'garbage', self.items[0]]
+        rdf = self.get(items).get_rdf()
+        assert 'garbage' not in rdf
+        assert self.items[0]['id'] in rdf
+
+    def test_bad_values_skipped(self):
+        items = [{'id': 123}, {'id': ['a']}, {'id': {'a': 1}},
+                 dict(self.items[0], version=None), self.items[0]]
+        up = self.get(items)
+        eq_(len(up.items), 2)
+        eq_(up.items[0]['id'], u'123')
+        rdf = up.get_rdf()
+        assert self.items[0]['id'] in rdf
+
+    def test_numeric_values(self):
+        items = [dict(self.items[0], version=2, appOS=1)]
+        up = self.get(items)
+        eq_(up.items[0]['version'], u'2')
+        assert '<?xml' in up.get_rdf()
+
+    def test_empty(self):
+        eq_(self.get([]).get_rdf(), update.bad_rdf)
+
+    def test_queries(self):
+        up = self.get(self.items * 10)
+        with self.assertNumQueries(6):
+            up.get_rdf()
+
+    def test_application(self):
+        environ = {'QUERY_STRING': urllib.urlencode(self.defaults),
+                   'CONTENT_LENGTH': '2',
+                   'wsgi.input': mock.Mock()}
+        environ['wsgi.input'].read.return_value = '{}'
+        start_response = mock.Mock()
+        eq_(update.bulk_application(environ, start_response), [''])
+        eq_(start_response.call_args[0][0], '400 Bad Request')
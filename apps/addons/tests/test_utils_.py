@@ -1,8 +1,17 @@
+import array
+import socket
+
 import mock
 from nose.tools import eq_
 
-from addons.utils import FeaturedManager, CreaturedManager
+from django.conf import settings
+
+from addons import tasks
+from addons.utils import (FeaturedManager, CreaturedManager, IndexQueue,
+                          RecsScorer, Reindexing)
+from versions.compare import version_int
 
+import amo
 import amo.tests
 
 
@@ -98,3 +107,156 @@ class TestCreaturedManager(amo.tests.TestCase):
                                           for v in self.values]
         self.cm.build()
         eq_(set(self.cm.creatured_ids(self.category, 'xx')), set([2]))
+
+
+class TestIndexQueue(amo.tests.TestCase):
+
+    def setUp(self):
+        self.queue = IndexQueue()
+
+    def test_add(self):
+        assert self.queue.add([3])
+        # The first add schedules the drain, the others don't.
+        assert not self.queue.add([3, 4])
+        ids, queued, saves = self.queue.drain()
+        eq_(ids, [3, 4])
+        eq_(sorted(queued), [3, 4])
+        eq_(saves, 3)
+
+    def test_lock_without_ttl(self):
+        # A lock left without a TTL gets one, so it can't block forever.
+        self.queue.redis.set(self.queue.lock, 1)
+        assert not self.queue.add([3])
+        assert 0 < self.queue.redis.ttl(self.queue.lock) <= 60
+
+    def test_drain_empties(self):
+        self.queue.add([3])
+        self.queue.drain()
+        eq_(self.queue.drain(), ([], {}, 0))
+        # The next add needs a new drain.
+        assert self.queue.add([3])
+
+    def test_first_queued(self):
+        with mock.patch('addons.utils.time.time') as time:
+            time.return_value = 10
+            self.queue.add([3])
+            time.return_value = 20
+            self.queue.add([3, 4])
+        eq_(self.queue.drain()[1], {3: 10, 4: 20})
+
+    @mock.patch.object(settings, 'ADDON_REINDEX_DEBOUNCE', 5)
+    @mock.patch('addons.tasks.drain_index_queue.apply_async')
+    def test_queue_index(self, drain):
+        tasks.queue_index([3])
+        tasks.queue_index([3])
+        drain.assert_called_once_with(countdown=5)
+
+    @mock.patch('addons.tasks.index_addons.delay')
+    @mock.patch('addons.tasks.drain_index_queue.apply_async')
+    @mock.patch.object(IndexQueue, 'add')
+    def test_queue_index_redis_down(self, add, drain, index):
+        add.side_effect = socket.error
+        tasks.queue_index([3])
+        index.assert_called_with([3])
+        assert not drain.called
+
+    @mock.patch('addons.tasks.index_addons.delay')
+    def test_drain_task(self, index):
+        self.queue.add(range(1, 201))
+        self.queue.add([5])
+        tasks.drain_index_queue()
+        eq_(index.call_count, 2)
+        eq_(index.call_args_list[0][0][0], range(1, 151))
+        eq_(index.call_args_list[1][0][0], range(151, 201))
+        assert index.call_args_list[0][1]['queued']
+
+    @mock.patch('addons.tasks.index_addons.delay')
+    def test_drain_task_empty(self, index):
+        tasks.drain_index_queue()
+        assert not index.called
+
+
+class TestReindexing(amo.tests.TestCase):
+
+    def setUp(self):
+        self.reindexing = Reindexing()
+
+    def test_record_only_while_reindexing(self):
+        self.reindexing.record([3])
+        self.reindexing.start('amo_addons-1', chunks=2, total=300)
+        self.reindexing.record([4, 5])
+        eq_(self.reindexing.finish(), [4, 5])
+        assert not self.reindexing.is_reindexing()
+
+    def test_chunk_done(self):
+        self.reindexing.start('amo_addons-1', chunks=2, total=300)
+        assert not self.reindexing.chunk_done(150)
+        assert self.reindexing.chunk_done(150)
+
+    @mock.patch('addons.utils.time.time')
+    def test_progress(self, time):
+        eq_(self.reindexing.progress(), None)
+        time.return_value = 100
+        self.reindexing.start('amo_addons-1', chunks=2, total=300)
+        eq_(self.reindexing.progress()['eta'], None)
+        time.return_value = 110
+        self.reindexing.chunk_done(100)
+        progress = self.reindexing.progress()
+        eq_(progress['index'], 'amo_addons-1')
+        eq_(progress['done'], 100)
+        eq_(progress['eta'], 20)
+
+
+class TestRecsScorer(amo.tests.TestCase):
+
+    def setUp(self):
+        RecsScorer.reset()
+        self.scorer = RecsScorer()
+        for addon, others in [(1, [(3, .5), (4, .25)]),
+                              (2, [(3, .5), (5, .75), (1, .5)])]:
+            self.scorer.offsets.append(len(self.scorer.others))
+            self.scorer.addons.append(addon)
+            for other, score in others:
+                self.scorer.others.append(other)
+                self.scorer.scores.append(score)
+        self.scorer.offsets.append(len(self.scorer.others))
+        # Add-on 5 only supports up to 3.6, 6 has no max.
+        self.scorer.support[amo.FIREFOX.id] = (
+            array.array('l', [1, 3, 4, 5, 6]),
+            array.array('l', [0] * 5),
+            array.array('l', [version_int('5.0')] * 3 +
+                        [version_int('3.6'), -1]))
+
+    def test_recs(self):
+        eq_(list(self.scorer.recs(2)), [(3, .5), (5, .75), (1, .5)])
+        eq_(list(self.scorer.recs(7)), [])
+
+    def test_score(self):
+        eq_(self.scorer.score([1, 2], amo.FIREFOX, '3.6'), [3, 5, 4])
+        eq_(self.scorer.score([2], amo.FIREFOX, '3.6', limit=2), [5, 3])
+
+    def test_score_app_support(self):
+        eq_(self.scorer.score([1, 2], amo.FIREFOX, '4.0'), [3, 4])
+        eq_(self.scorer.score([1, 2], amo.FIREFOX, '4.0', 'ignore'),
+            [3, 5, 4])
+        eq_(self.scorer.score([1, 2], amo.THUNDERBIRD, '3.6'), [])
+
+    @mock.patch.object(RecsScorer, 'load', lambda self: self)
+    def test_reload_on_bump(self):
+        one = RecsScorer.get()
+        eq_(RecsScorer.get(), one)
+        RecsScorer.bump()
+        # The version is only checked every `check_interval` seconds.
+        eq_(RecsScorer.get(), one)
+        RecsScorer._checked = 0
+        two = RecsScorer.get()
+        assert two is not one
+        eq_(two.version, RecsScorer.redis().get(RecsScorer.version_key))
+
+    @mock.patch.object(RecsScorer, 'load', lambda self: self)
+    @mock.patch.object(RecsScorer, 'redis')
+    def test_redis_down(self, redis):
+        redis().get.side_effect = socket.error
+        one = RecsScorer.get()
+        RecsScorer._checked = 0
+        eq_(RecsScorer.get(), one)
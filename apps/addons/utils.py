@@ -1,16 +1,28 @@
+import array
+import bisect
+import collections
 import hashlib
+import heapq
+import itertools
 import logging
 import random
+import socket
+import threading
+import time
 from operator import itemgetter
 
 from django.conf import settings
+from django.db import connections
 from django.utils.encoding import smart_str
 
 import commonware.log
-from lib.misc import lru_cache
+import multidb
+import redis as redislib
 import redisutils
 
+import amo
 from amo.utils import sorted_groupby, memoize
+from versions.compare import version_int
 from translations.models import Translation
 
 safe_key = lambda x: hashlib.md5(smart_str(x).lower().strip()).hexdigest()
@@ -66,6 +78,124 @@ class ReverseNameLookup(object):
             self.redis.delete(key)
 
 
+class IndexQueue(object):
+    """
+    Add-on ids waiting to be reindexed, kept in redis.
+
+    Saves add ids to a set and the first save schedules a drain a few seconds
+    later, so a burst of saves to the same add-ons ends up as a few
+    `index_addons` calls. Alongside the ids we keep when each one was first
+    queued and how many saves were queued, to measure the lag and how well
+    the saves coalesce.
+    """
+    # The drain lock expires in case the drain task gets lost.
+    lock_timeout = 60
+
+    def __init__(self):
+        self.redis = redisutils.connections['master']
+        self.key = 'amo:addons:reindex'
+        self.queued = self.key + ':queued'
+        self.saves = self.key + ':saves'
+        self.lock = self.key + ':lock'
+
+    def add(self, ids):
+        """Queues `ids`. Returns True if a drain needs to be scheduled."""
+        now = time.time()
+        pipe = self.redis.pipeline()
+        for id in ids:
+            pipe.sadd(self.key, id)
+            pipe.hsetnx(self.queued, id, now)
+        pipe.incr(self.saves, len(ids))
+        pipe.setnx(self.lock, now)
+        pipe.ttl(self.lock)
+        locked, ttl = pipe.execute()[-2:]
+        # The lock gets its TTL separately, so if whoever took it died before
+        # setting it, set it now instead of waiting on it forever.
+        if locked or ttl is None or ttl < 0:
+            self.redis.expire(self.lock, self.lock_timeout)
+        return bool(locked)
+
+    def drain(self):
+        """
+        Empties the queue and returns (ids, first queued time, saves). Ids
+        queued after this need a new drain.
+        """
+        pipe = self.redis.pipeline()
+        pipe.delete(self.lock)
+        pipe.smembers(self.key)
+        pipe.hgetall(self.queued)
+        pipe.getset(self.saves, 0)
+        pipe.delete(self.key, self.queued)
+        _, ids, queued, saves, _ = pipe.execute()
+        queued = dict((int(k), float(v)) for k, v in (queued or {}).items())
+        return sorted(int(i) for i in ids or []), queued, int(saves or 0)
+
+
+class Reindexing(object):
+    """
+    The state of an aliased add-ons reindex, kept in redis.
+
+    While a new index is being built, the ids of add-ons written to the live
+    index are remembered so they can be written to the new index again once
+    the alias points at it.
+    """
+
+    def __init__(self):
+        self.redis = redisutils.connections['master']
+        self.key = 'amo:addons:reindexing'
+        self.writes = self.key + ':writes'
+
+    def start(self, index, chunks, total):
+        pipe = self.redis.pipeline()
+        pipe.delete(self.writes)
+        pipe.hmset(self.key, {'index': index, 'chunks': chunks,
+                              'total': total, 'started': time.time()})
+        pipe.execute()
+
+    def is_reindexing(self):
+        return bool(self.redis.exists(self.key))
+
+    def record(self, ids):
+        """Remembers `ids` if a reindex is going on."""
+        if not self.is_reindexing():
+            return
+        pipe = self.redis.pipeline()
+        for id in ids:
+            pipe.sadd(self.writes, id)
+        pipe.execute()
+
+    def chunk_done(self, size):
+        """Returns True once every chunk of the new index is done."""
+        pipe = self.redis.pipeline()
+        pipe.hincrby(self.key, 'chunks_done', 1)
+        pipe.hincrby(self.key, 'done', size)
+        pipe.hget(self.key, 'chunks')
+        chunks_done, _, chunks = pipe.execute()
+        return chunks is not None and int(chunks_done) >= int(chunks)
+
+    def progress(self):
+        """
+        Returns a dict with the new index, the add-ons indexed out of the
+        total, and the seconds left at the current rate, or None.
+        """
+        state = self.redis.hgetall(self.key)
+        if not state:
+            return None
+        total, done = int(state['total']), int(state.get('done', 0))
+        elapsed = time.time() - float(state['started'])
+        eta = elapsed / done * (total - done) if done else None
+        return {'index': state['index'], 'total': total, 'done': done,
+                'elapsed': elapsed, 'eta': eta}
+
+    def finish(self):
+        """Ends the reindex and returns the ids written during it."""
+        pipe = self.redis.pipeline()
+        pipe.smembers(self.writes)
+        pipe.delete(self.key, self.writes)
+        ids = pipe.execute()[0]
+        return sorted(int(i) for i in ids or [])
+
+
 #TODO(davedash): remove after remora
 class ActivityLogMigrationTracker(object):
     """This tracks what id of the addonlog we're on."""
@@ -163,8 +293,7 @@ class FeaturedManager(object):
         pipe.execute()
 
     @classmethod
-    @lru_cache.lru_cache(maxsize=100)
-    @memoize(prefix, time=60 * 10)
+    @memoize(prefix, time=60 * 10, local=100)
     def featured_ids(cls, app, lang=None, type=None):
         redis = cls.redis()
         base = (cls.by_id, cls.by_app(app.id))
@@ -248,8 +377,7 @@ class CreaturedManager(object):
         pipe.execute()
 
     @classmethod
-    @lru_cache.lru_cache(maxsize=100)
-    @memoize(prefix, time=60 * 10)
+    @memoize(prefix, time=60 * 10, local=100)
     def creatured_ids(cls, category, lang):
         redis = cls.redis()
         all_ = redis.smembers(cls.by_cat(category.id, category.application_id))
@@ -260,3 +388,146 @@ class CreaturedManager(object):
         random.shuffle(others)
         random.shuffle(per_locale)
         return map(int, filter(None, per_locale + others))
+
+
+class RecsScorer(object):
+    """
+    The addon_recommendations graph and the public add-ons' AppSupport
+    ranges, kept in flat arrays in each process so a set of add-ons can be
+    scored without touching the db.
+
+    The graph is stored like a sparse matrix: the recommendations of
+    `addons[i]` are `others[offsets[i]:offsets[i + 1]]` with their `scores`.
+    The `recs` cron bumps the version in redis when it writes new rows, and
+    processes check it every `check_interval` seconds to know when to reload.
+    """
+    version_key = 'amo:recs:version'
+    check_interval = 60
+    # Reload at least this often to pick up new AppSupport ranges.
+    max_age = 60 * 60
+    _instance = None
+    _checked = 0
+    _lock = threading.Lock()
+
+    def __init__(self, version=None):
+        self.version = version
+        self.loaded = time.time()
+        self.addons, self.offsets = array.array('l'), array.array('l')
+        self.others, self.scores = array.array('l'), array.array('d')
+        # {app id: (ids, mins, maxs)}, sorted by id. A NULL max is -1.
+        self.support = {}
+
+    @classmethod
+    def redis(cls):
+        return redisutils.connections['master']
+
+    @classmethod
+    def get(cls):
+        """The loaded scorer, reloaded if the recs changed."""
+        now = time.time()
+        if cls._instance and now - cls._checked < cls.check_interval:
+            return cls._instance
+        with cls._lock:
+            if cls._instance and now - cls._checked < cls.check_interval:
+                return cls._instance
+            scorer = cls._instance
+            try:
+                version = cls.redis().get(cls.version_key)
+            except (redislib.RedisError, socket.error), e:
+                # Keep serving what we have until redis is back.
+                log.error('Could not check the recs version: %s' % e)
+                version = scorer.version if scorer else None
+            if (not scorer or scorer.version != version
+                or now - scorer.loaded > cls.max_age):
+                cls._instance = cls(version).load()
+            cls._checked = now
+        return cls._instance
+
+    @classmethod
+    def bump(cls):
+        """Tell the processes to reload the recs."""
+        cls.redis().set(cls.version_key, repr(time.time()))
+
+    @classmethod
+    def reset(cls):
+        cls._instance, cls._checked = None, 0
+
+    def load(self):
+        cursor = connections[multidb.get_slave()].cursor()
+        cursor.execute("""
+            SELECT addon_id, other_addon_id, score FROM addon_recommendations
+            ORDER BY addon_id""")
+        for addon, other, score in _fetch(cursor):
+            if not self.addons or self.addons[-1] != addon:
+                self.offsets.append(len(self.others))
+                self.addons.append(addon)
+            self.others.append(other)
+            self.scores.append(score)
+        self.offsets.append(len(self.others))
+
+        cursor.execute("""
+            SELECT app_id, addon_id, min, max FROM appsupport
+            INNER JOIN addons ON
+                (appsupport.addon_id=addons.id AND inactive=0 AND status=%s
+                 AND current_version IS NOT NULL)
+            WHERE min IS NOT NULL
+            ORDER BY app_id, addon_id""", [amo.STATUS_PUBLIC])
+        for app, addon, min_, max_ in _fetch(cursor):
+            if app not in self.support:
+                self.support[app] = tuple(array.array('l') for _ in range(3))
+            ids, mins, maxs = self.support[app]
+            ids.append(addon)
+            mins.append(min_)
+            maxs.append(-1 if max_ is None else max_)
+        log.info('Loaded %s recommendations for %s add-ons.' %
+                 (len(self.others), len(self.addons)))
+        return self
+
+    def recs(self, addon):
+        """Yields the (other add-on, score) pairs recommended for `addon`."""
+        idx = bisect.bisect_left(self.addons, addon)
+        if idx == len(self.addons) or self.addons[idx] != addon:
+            return iter([])
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return itertools.izip(self.others[start:end], self.scores[start:end])
+
+    def supports(self, addon, app, vint, compat_mode='strict'):
+        if app not in self.support:
+            return False
+        ids, mins, maxs = self.support[app]
+        idx = bisect.bisect_left(ids, addon)
+        if idx == len(ids) or ids[idx] != addon or mins[idx] > vint:
+            return False
+        return compat_mode != 'strict' or maxs[idx] >= vint
+
+    def score(self, addon_ids, app, version, compat_mode='strict',
+              limit=None):
+        """
+        The ids of the public add-ons recommended for `addon_ids` that support
+        `version` of `app`, best first, like
+        `RecommendedCollection.build_recs`.
+        """
+        vint = version_int(version)
+        totals = collections.defaultdict(float)
+        for addon in set(addon_ids):
+            for other, score in self.recs(addon):
+                totals[other] += score
+        exclude = set(addon_ids)
+        totals = ((addon, score) for addon, score in totals.iteritems()
+                  if addon not in exclude
+                  and self.supports(addon, app.id, vint, compat_mode))
+        if limit is None:
+            ranked = sorted(totals, key=itemgetter(1), reverse=True)
+        else:
+            ranked = heapq.nlargest(limit, totals, key=itemgetter(1))
+        return [addon for addon, score in ranked]
+
+
+def _fetch(cursor, size=5000):
+    # Stream the rows of a big result instead of one fetchall() list.
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        for row in rows:
+            yield row
@@ -16,7 +16,7 @@ from constants.platforms import *
 from constants.search import *
 from .log import (LOG, LOG_BY_ID, LOG_ADMINS, LOG_EDITORS,
                   LOG_HIDE_DEVELOPER, LOG_KEEP, LOG_REVIEW_QUEUE,
-                  LOG_REVIEW_EMAIL_USER, log)
+                  LOG_REVIEW_EMAIL_USER, log, log_batch)
 
 logger_log = commonware.log.getLogger('z.amo')
 
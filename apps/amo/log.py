@@ -1,3 +1,6 @@
+import functools
+import threading
+from datetime import datetime
 from inspect import isclass
 
 from celery.datastructures import AttributeDict
@@ -447,18 +450,19 @@ LOG_HIDE_DEVELOPER = [l.id for l in LOGS
                                or l.id in LOG_ADMINS)]
 
 
+_local = threading.local()
+
+
 def log(action, *args, **kw):
     """
     e.g. amo.log(amo.LOG.CREATE_ADDON, []),
          amo.log(amo.LOG.ADD_FILE_TO_VERSION, file, version)
+
+    Inside a `log_batch` block the log is written when the block ends, and
+    the returned ActivityLog isn't saved yet.
     """
-    from addons.models import Addon
     from amo import get_user, logger_log
-    from devhub.models import (ActivityLog, AddonLog, AppLog, UserLog,
-                               CommentLog, VersionLog)
-    from mkt.webapps.models import Webapp
-    from users.models import UserProfile
-    from versions.models import Version
+    from devhub.models import ActivityLog
 
     user = kw.get('user', get_user())
 
@@ -470,39 +474,140 @@ def log(action, *args, **kw):
     al.arguments = args
     if 'details' in kw:
         al.details = kw['details']
-    al.save()
-
-    if 'details' in kw and 'comments' in al.details:
-        CommentLog(comments=al.details['comments'], activity_log=al).save()
-
     # TODO(davedash): post-remora this may not be necessary.
     if 'created' in kw:
         al.created = kw['created']
-        # Double save necessary since django resets the created date on save.
-        al.save()
 
+    entry = (al, _log_index(args, user))
+    batch = getattr(_local, 'batch', None)
+    if batch is not None:
+        batch.append(entry)
+    else:
+        write_logs([entry])
+    return al
+
+
+def _log_index(args, user):
+    """The (index model, column, id) rows to write for a log of `args`."""
+    from addons.models import Addon
+    from devhub.models import AddonLog, AppLog, UserLog, VersionLog
+    from mkt.webapps.models import Webapp
+    from users.models import UserProfile
+    from versions.models import Version
+
+    rows = []
     for arg in args:
         if isinstance(arg, tuple):
             if arg[0] == Webapp:
-                AppLog(addon_id=arg[1], activity_log=al).save()
+                rows.append((AppLog, 'addon_id', arg[1]))
             elif arg[0] == Addon:
-                AddonLog(addon_id=arg[1], activity_log=al).save()
+                rows.append((AddonLog, 'addon_id', arg[1]))
             elif arg[0] == Version:
-                VersionLog(version_id=arg[1], activity_log=al).save()
+                rows.append((VersionLog, 'version_id', arg[1]))
             elif arg[0] == UserProfile:
-                UserLog(user_id=arg[1], activity_log=al).save()
+                rows.append((UserLog, 'user_id', arg[1]))
 
         # Webapp first since Webapp subclasses Addon.
         if isinstance(arg, Webapp):
-            AppLog(addon=arg, activity_log=al).save()
+            rows.append((AppLog, 'addon_id', arg.pk))
         elif isinstance(arg, Addon):
-            AddonLog(addon=arg, activity_log=al).save()
+            rows.append((AddonLog, 'addon_id', arg.pk))
         elif isinstance(arg, Version):
-            VersionLog(version=arg, activity_log=al).save()
+            rows.append((VersionLog, 'version_id', arg.pk))
         elif isinstance(arg, UserProfile):
             # Index by any user who is mentioned as an argument.
-            UserLog(activity_log=al, user=arg).save()
+            rows.append((UserLog, 'user_id', arg.pk))
 
     # Index by every user
-    UserLog(activity_log=al, user=user).save()
-    return al
+    rows.append((UserLog, 'user_id', user.pk))
+    return rows
+
+
+def write_logs(entries):
+    """
+    Saves the ActivityLogs of (log, index rows) `entries` and writes the
+    index rows with one multi-row INSERT per table.
+    """
+    from django.db import connection, transaction
+    from amo.utils import chunked
+    from devhub.models import CommentLog
+
+    rows = {}
+    for al, index in entries:
+        created = al.created
+        al.save()
+        if created:
+            # Django resets the created date on the first save.
+            al.update(created=created)
+        details = al.details
+        if details and 'comments' in details:
+            rows.setdefault(CommentLog, []).append(
+                CommentLog(comments=details['comments'], activity_log=al))
+        for model, column, pk in index:
+            rows.setdefault(model, []).append(
+                model(activity_log=al, **{column: pk}))
+
+    cursor = connection.cursor()
+    now = datetime.now()
+    for model, objs in rows.items():
+        fields = [f for f in model._meta.local_fields if not f.primary_key]
+        for obj in objs:
+            obj.created = obj.modified = now
+        for chunk in chunked(objs, 500):
+            values = '(%s)' % ', '.join(['%s'] * len(fields))
+            cursor.execute('INSERT INTO %s (%s) VALUES %s' % (
+                model._meta.db_table, ', '.join(f.column for f in fields),
+                ', '.join([values] * len(chunk))),
+                [getattr(obj, f.attname) for obj in chunk for f in fields])
+        # The rows skipped save(), so invalidate what it would have.
+        model.objects.invalidate(*objs)
+    transaction.commit_unless_managed()
+
+
+class log_batch(object):
+    """
+    Collects the amo.log calls in a block, or a function, and writes them
+    together when it ends. With `async` they're written by a celery task.
+
+        with amo.log_batch():
+            for addon in addons:
+                amo.log(amo.LOG.CHANGE_STATUS, addon.get_status_display(),
+                        addon)
+
+    The logs are written even if the block raises, since the changes they
+    describe may already be in the db. Nested batches join the outer one.
+    """
+
+    def __init__(self, async=False):
+        self.async = async
+        self.batch = None
+
+    def __enter__(self):
+        if getattr(_local, 'batch', None) is None:
+            _local.batch = self.batch = []
+
+    def __exit__(self, *exc_info):
+        batch, self.batch = self.batch, None
+        if batch is None:
+            return
+        _local.batch = None
+        if batch and self.async:
+            from amo.tasks import write_activity_logs
+            write_activity_logs.delay([_serialize(e) for e in batch])
+        elif batch:
+            write_logs(batch)
+
+    def __call__(self, f):
+        @functools.wraps(f)
+        def wrapper(*args, **kw):
+            with log_batch(self.async):
+                return f(*args, **kw)
+        return wrapper
+
+
+def _serialize(entry):
+    # Only send the fields to the task, not the cached user and arguments.
+    al, index = entry
+    return (dict(user_id=al.user_id, action=al.action,
+                 _arguments=al._arguments, _details=al._details,
+                 created=al.created), index)
@@ -15,6 +15,7 @@ import amo
 from addons.models import Addon
 from applications.models import Application, AppVersion
 from bandwagon.models import Collection
+from amo.log import write_logs
 from devhub.models import ActivityLog, LegacyAddonLog
 from editors.models import EventLog
 from reviews.models import Review
@@ -96,6 +97,15 @@ def delete_incomplete_addons(items, **kw):
 
 
 @task
+def write_activity_logs(entries, **kw):
+    """Writes the logs of an async `amo.log_batch`."""
+    log.info('[%s@%s] Writing activity logs' %
+             (len(entries), write_activity_logs.rate_limit))
+    write_logs([(ActivityLog(**fields), index) for fields, index in entries])
+
+
+@task
+@amo.log_batch()
 def migrate_admin_logs(items, **kw):
     print 'Processing: %d..%d' % (items[0], items[-1])
     for item in LegacyAddonLog.objects.filter(pk__in=items):
@@ -105,6 +115,7 @@ def migrate_admin_logs(items, **kw):
 
 
 @task
+@amo.log_batch()
 def migrate_editor_eventlog(items, **kw):
     log.info('[%s@%s] Migrating eventlog items' %
              (len(items), migrate_editor_eventlog.rate_limit))
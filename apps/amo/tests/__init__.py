@@ -463,7 +463,11 @@ class ESTestCase(TestCase):
 
     @classmethod
     def refresh(cls, index='default'):
-        cls.es.refresh(settings.ES_INDEXES[index], timesleep=0)
+        indexes = [settings.ES_INDEXES[index]]
+        if index == 'default' and Addon._get_index() not in indexes:
+            # Add-ons have their own index once they're behind their alias.
+            indexes.append(Addon._get_index())
+        cls.es.refresh(indexes, timesleep=0)
 
     @classmethod
     def reindex(cls, model):
@@ -1,17 +1,22 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import os
 import shutil
 import tempfile
 import unittest
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.validators import ValidationError
 from django.utils import translation
 
+import mock
 from nose.tools import eq_, assert_raises, raises
 
+import amo
 from amo.utils import (slug_validator, slugify, resize_image, to_language,
-                       no_translation, LocalFileStorage, rm_local_tmp_dir)
+                       no_translation, LocalFileStorage, rm_local_tmp_dir,
+                       extract_trans, memoize, memoize_key, LocalCache)
 from product_details import product_details
 
 
@@ -107,6 +112,21 @@ def test_no_translation():
     translation.activate(lang)
 
 
+def test_extract_trans():
+    d = {}
+    extract_trans(d, 'name', [('en-US', 'foo'), ('fr', 'le foo'),
+                              ('ja', 'ja foo'), ('ko', 'ko foo'),
+                              ('de', 'foo'), ('pl', 'pl foo')])
+    eq_(sorted(d['name']), ['foo', 'ja foo', 'ko foo', 'le foo', 'pl foo'])
+    eq_(d['name_english'], ['foo'])
+    eq_(d['name_french'], ['le foo'])
+    eq_(d['name_german'], ['foo'])
+    eq_(sorted(d['name_cjk']), ['ja foo', 'ko foo'])
+    # Every analyzer gets a field, empty or not.
+    eq_(d['name_russian'], [])
+    eq_(len(d), len(amo.SEARCH_ANALYZER_MAP) + 1)
+
+
 class TestLocalFileStorage(unittest.TestCase):
 
     def setUp(self):
@@ -181,3 +201,87 @@ class TestLocalFileStorage(unittest.TestCase):
         self.stor.delete(fn)
         eq_(os.path.exists(fn), False)
         eq_(os.path.exists(dp), True)
+
+
+class TestMemoize(unittest.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+        @memoize('test-memoize', time=60)
+        def double(x):
+            self.calls.append(x)
+            return x * 2
+        self.double = double
+
+    def test_cached(self):
+        eq_(self.double(2), 4)
+        eq_(self.double(2), 4)
+        eq_(self.calls, [2])
+
+    def test_none_not_cached(self):
+        nothing = memoize('test-memoize')(lambda: self.calls.append(1))
+        nothing()
+        nothing()
+        eq_(self.calls, [1, 1])
+
+    @mock.patch('amo.utils.time.time')
+    def test_stale_recomputed(self, time):
+        time.return_value = 100
+        self.double(2)
+        time.return_value = 200
+        eq_(self.double(2), 4)
+        eq_(self.calls, [2, 2])
+
+    @mock.patch('amo.utils.time.time')
+    def test_stale_while_locked(self, time):
+        time.return_value = 100
+        self.double(2)
+        time.return_value = 200
+        # Someone else is recomputing it, keep using the old value.
+        cache.add(memoize_key('test-memoize', 2) + ':lock', 1)
+        eq_(self.double(2), 4)
+        eq_(self.calls, [2])
+
+    def test_old_format_ignored(self):
+        # Values memoized before they had an expiry time weren't versioned.
+        old = '%s:memoize:%s:%s' % (settings.CACHE_PREFIX, 'test-memoize',
+                                    hashlib.md5('2').hexdigest())
+        cache.set(old, ([4], ['keys']))
+        assert memoize_key('test-memoize', 2) != old
+        eq_(self.double(2), 4)
+        eq_(self.calls, [2])
+
+    def test_local(self):
+        triple = memoize('test-memoize-local', local=10)(
+            lambda x: self.calls.append(x) or x * 3)
+        eq_(triple(2), 6)
+        with mock.patch('amo.utils.cache') as cache_mock:
+            eq_(triple(2), 6)
+            assert not cache_mock.get.called
+        triple.clear()
+        eq_(triple(2), 6)
+        eq_(self.calls, [2])
+
+
+class TestLocalCache(unittest.TestCase):
+
+    def test_lru(self):
+        local = LocalCache(2)
+        local.set('a', 1, 0)
+        local.set('b', 2, 0)
+        local.get('a')
+        local.set('c', 3, 0)
+        eq_(local.get('a'), 1)
+        eq_(local.get('b'), None)
+        eq_(local.get('c'), 3)
+
+    @mock.patch('amo.utils.time.time')
+    def test_expires(self, time):
+        local = LocalCache(2)
+        time.return_value = 100
+        local.set('a', 1, 150)
+        eq_(local.get('a'), 1)
+        time.return_value = 200
+        eq_(local.get('a'), None)
@@ -1,17 +1,20 @@
 """Tests for the activitylog."""
 from datetime import datetime
 
+import mock
 from nose.tools import eq_
 
 import amo
+import amo.tasks
 import amo.tests
 from addons.models import Addon
+from devhub.models import ActivityLog, AddonLog, CommentLog, UserLog
 from users.models import UserProfile
 
 
 class LogTest(amo.tests.TestCase):
     def setUp(self):
-        u = UserProfile.objects.create(username='foo')
+        self.user = u = UserProfile.objects.create(username='foo')
         amo.set_user(u)
 
     def test_details(self):
@@ -34,3 +37,55 @@ class LogTest(amo.tests.TestCase):
         al = amo.log(amo.LOG.CUSTOM_TEXT, 'hi', created=datetime(2009, 1, 1))
 
         eq_(al.created, datetime(2009, 1, 1))
+
+    def test_index_rows(self):
+        a = Addon.objects.create(type=amo.ADDON_EXTENSION)
+        other = UserProfile.objects.create(username='bar')
+        with self.assertNumQueries(4):
+            al = amo.log(amo.LOG.CUSTOM_TEXT, a, other,
+                         details={'comments': 'hi'})
+        eq_(AddonLog.objects.get().activity_log, al)
+        eq_(sorted(UserLog.objects.filter(activity_log=al)
+                   .values_list('user', flat=True)),
+            [self.user.id, other.id])
+        eq_(CommentLog.objects.get(activity_log=al).comments, 'hi')
+        eq_(len(ActivityLog.objects.for_addons(a)), 1)
+
+    def test_batch(self):
+        addons = [Addon.objects.create(type=amo.ADDON_EXTENSION)
+                  for _ in range(3)]
+        with amo.log_batch():
+            for addon in addons:
+                al = amo.log(amo.LOG.CUSTOM_TEXT, 'hi', addon)
+            with amo.log_batch():
+                amo.log(amo.LOG.CUSTOM_TEXT, 'nested')
+            eq_(al.id, None)
+            eq_(ActivityLog.uncached.count(), 0)
+        eq_(ActivityLog.uncached.count(), 4)
+        eq_(AddonLog.uncached.count(), 3)
+        eq_(UserLog.uncached.count(), 4)
+        for addon in addons:
+            eq_(ActivityLog.objects.for_addons(addon)[0].arguments,
+                ['hi', addon])
+
+    def test_batch_raises(self):
+        with self.assertRaises(ValueError):
+            with amo.log_batch():
+                amo.log(amo.LOG.CUSTOM_TEXT, 'hi')
+                raise ValueError
+        eq_(ActivityLog.uncached.count(), 1)
+
+    @mock.patch('amo.tasks.write_activity_logs.delay')
+    def test_batch_async(self, delay):
+        a = Addon.objects.create(type=amo.ADDON_EXTENSION)
+        with amo.log_batch(async=True):
+            amo.log(amo.LOG.CUSTOM_TEXT, 'hi', a,
+                    created=datetime(2009, 1, 1))
+        eq_(ActivityLog.uncached.count(), 0)
+        entries = delay.call_args[0][0]
+        amo.tasks.write_activity_logs(entries)
+        al = ActivityLog.objects.get()
+        eq_(al.created, datetime(2009, 1, 1))
+        eq_(al.arguments, ['hi', a])
+        eq_(al.user, self.user)
+        eq_(AddonLog.objects.get().addon, a)
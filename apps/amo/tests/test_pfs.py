@@ -0,0 +1,61 @@
+from nose.tools import eq_
+
+from services import pfs
+
+
+def get(**kw):
+    data = dict(mimetype='application/x-shockwave-flash', appID='x',
+                appVersion='1', clientOS='Windows NT 5.1',
+                chromeLocale='en-US')
+    data.update(kw)
+    return pfs.get_output(data)
+
+
+def test_flash_win32():
+    output = get()
+    assert 'Adobe Flash Player' in output
+    assert 'FP_PL_PFS_INSTALLER_32bit.exe' in output
+
+
+def test_flash_win64():
+    output = get(clientOS='Windows NT 6.1; Win64; x64')
+    assert 'FP_PL_PFS_INSTALLER_64bit.exe' in output
+
+
+def test_shockwave_locale():
+    output = get(mimetype='application/x-director', chromeLocale='ja-JP')
+    assert 'eula_shockwaveplayer_jp' in output
+    output = get(mimetype='application/x-director')
+    assert 'eula_shockwaveplayer_jp' not in output
+
+
+def test_regex_mimetype():
+    output = get(mimetype='application/x-java-applet;version=1.4.2')
+    assert '{92a550f2-dfd2-4d2f-a35d-a98cfda73595}' in output
+    output = get(mimetype='application/x-java-applet;version=1.4.2',
+                 clientOS='Windows NT 6.0')
+    assert '{fbe640ef-4375-4f45-8d79-767d60bf75b8}' in output
+
+
+def test_second_rule_for_mimetype():
+    assert 'DivXWebPlayerMac.xpi' in get(mimetype='video/divx',
+                                         clientOS='Intel Mac OS X 10.6')
+
+
+def test_unknown():
+    output = get(mimetype='text/foo')
+    assert '<pfs:name>-1</pfs:name>' in output
+
+
+def test_missing_required():
+    output = pfs.get_output({'mimetype': 'application/pdf'})
+    assert '<pfs:name>-1</pfs:name>' in output
+
+
+def test_memoized():
+    pfs.outputs.clear()
+    get()
+    get(clientOS='Windows NT 6.1')
+    eq_(len(pfs.outputs), 1)
+    get(clientOS='Linux i686')
+    eq_(len(pfs.outputs), 2)
@@ -9,6 +9,7 @@ import os
 import random
 import re
 import shutil
+import threading
 import time
 import unicodedata
 import urllib
@@ -35,6 +36,7 @@ from django.utils.encoding import smart_str, smart_unicode
 
 import bleach
 from cef import log_cef as _log_cef
+from django_statsd.clients import statsd
 from easy_thumbnails import processors
 import html5lib
 from html5lib.serializer.htmlserializer import HTMLSerializer
@@ -551,39 +553,120 @@ class HttpResponseSendFile(http.HttpResponse):
             return wrapper()
 
 
+# Seconds one caller has to recompute a stale memoized value.
+MEMOIZE_LOCK_TIMEOUT = 30
+# Bump when the format of memoized values changes, so old ones aren't read.
+MEMOIZE_VERSION = 2
+
+
 def memoize_key(prefix, *args, **kwargs):
     """Returns the memoize key."""
     key = hashlib.md5()
     for arg in itertools.chain(args, sorted(kwargs.items())):
         key.update(str(arg))
-    return '%s:memoize:%s:%s' % (settings.CACHE_PREFIX,
-                                 prefix, key.hexdigest())
+    return '%s:memoize:%s:%s:%s' % (settings.CACHE_PREFIX, MEMOIZE_VERSION,
+                                    prefix, key.hexdigest())
 
 
 def memoize_get(prefix, *args, **kwargs):
     """Returns the content of the cache given the key."""
-    return cache.get(memoize_key(prefix, *args, **kwargs))
+    cached = cache.get(memoize_key(prefix, *args, **kwargs))
+    return cached[0] if cached is not None else None
+
+
+class LocalCache(object):
+    """
+    An in-process LRU cache holding up to `size` values, each with the time
+    it expires at (0 for never).
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.data = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                value, expires = self.data.pop(key)
+            except KeyError:
+                return None
+            if expires and expires < time.time():
+                return None
+            # Put it back as the most recently used.
+            self.data[key] = value, expires
+            return value
+
+    def set(self, key, value, expires):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value, expires
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
 
 
-def memoize(prefix, time=60):
+def memoize(prefix, time=60, local=0):
     """
     A simple memoize that caches into memcache, using a simple
     key based on stringing args and kwargs. Keep args simple.
+
+    Values stay in memcache for another `time` seconds after they expire.
+    Then the first caller to take a lock recomputes the value while the
+    others keep getting the old one, instead of all of them recomputing it
+    at once. With `local`, up to that many values are also kept in the
+    process until they expire.
     """
     def decorator(func):
+        local_cache = LocalCache(local) if local else None
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             key = memoize_key(prefix, *args, **kwargs)
-            data = cache.get(key)
-            if data is not None:
-                return data
-            data = func(*args, **kwargs)
-            cache.set(key, data, time)
-            return data
+            return _memoized(key, prefix, time, local_cache,
+                             lambda: func(*args, **kwargs))
+        wrapper.clear = local_cache.clear if local_cache else lambda: None
         return wrapper
     return decorator
 
 
+def _memoized(key, prefix, timeout, local, compute):
+    stat = 'memoize.%s.' % prefix
+    if local:
+        data = local.get(key)
+        if data is not None:
+            statsd.incr(stat + 'local_hit')
+            return data
+
+    cached = cache.get(key)
+    if cached is not None:
+        data, expires = cached
+        fresh = not expires or expires > time.time()
+        # Only one caller gets the lock to recompute a stale value.
+        if fresh or not cache.add(key + ':lock', 1, MEMOIZE_LOCK_TIMEOUT):
+            statsd.incr(stat + ('hit' if fresh else 'stale'))
+            if local and fresh:
+                local.set(key, data, expires)
+            return data
+        statsd.incr(stat + 'refresh')
+    else:
+        statsd.incr(stat + 'miss')
+
+    data = compute()
+    if data is not None:
+        # A timeout of 0 uses the cache's default and never goes stale.
+        expires = time.time() + timeout if timeout else 0
+        cache.set(key, (data, expires), timeout * 2)
+        if cached is not None:
+            cache.delete(key + ':lock')
+        if local:
+            local.set(key, data, expires)
+    return data
+
+
 class Message:
     """
     A simple message class for when you don't have a session, but wish
@@ -839,9 +922,27 @@ def attach_trans_dict(model, addons):
     qs = (Translation.objects
           .filter(id__in=ids, localized_string__isnull=False)
           .values_list('id', 'locale', 'localized_string'))
-    for id, translations in sorted_groupby(qs, lambda x: x[0]):
-        ids[id].translations[id] = [(locale, string)
-                                    for id, locale, string in translations]
+    # Rows are appended as they come in, no need to sort or cache them.
+    for id, locale, string in qs.iterator():
+        ids[id].translations[id].append((locale, string))
+
+
+def extract_trans(d, field, translations):
+    """
+    Fills `d[field]` with the strings of `translations`, a list of (locale,
+    string), and `d[field_<analyzer>]` with the strings in the languages of
+    each analyzer in SEARCH_ANALYZER_MAP, in one pass over `translations`.
+    """
+    strings = set()
+    analyzed = dict((analyzer, set()) for analyzer in amo.SEARCH_ANALYZER_MAP)
+    for locale, string in translations:
+        strings.add(string)
+        analyzer = amo.SEARCH_LANGUAGE_TO_ANALYZER.get(locale.lower())
+        if analyzer:
+            analyzed[analyzer].add(string)
+    d[field] = list(strings)
+    for analyzer, strings in analyzed.iteritems():
+        d['%s_%s' % (field, analyzer)] = list(strings)
 
 
 def rm_local_tmp_dir(path):
@@ -777,6 +777,23 @@ class TestGuidSearch(TestCase):
         eq_(dom('application min_version').text(), cr.min_app_version)
         eq_(dom('application max_version').text(), cr.max_app_version)
 
+    @patch.object(Addon, 'transformer', wraps=Addon.transformer)
+    def test_misses_batched(self, transformer):
+        r = make_call(self.good)
+        eq_(len(pq(r.content)('addon')), 2)
+        eq_(transformer.call_count, 1)
+        # They're all cached now.
+        make_call(self.good)
+        eq_(transformer.call_count, 1)
+
+    @patch('api.views.cache.set_many')
+    def test_miss_timeout(self, set_many):
+        make_call('search/guid:nope@nope')
+        empty = [c for c in set_many.call_args_list
+                 if c[0][0] and c[0][0].values() == ['']]
+        eq_(len(empty), 1)
+        eq_(empty[0][0][1], api.views.GUID_MISS_TIMEOUT)
+
 
 class SearchTest(ESTestCase):
     fixtures = ('base/apps', 'base/addon_6113', 'base/addon_40',
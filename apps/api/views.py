@@ -56,6 +56,9 @@ MAX_LIMIT, BUFFER = 30, 10
 # "New" is arbitrarily defined as 10 days old.
 NEW_DAYS = 10
 
+# How long guid_search caches that a GUID isn't a searchable add-on.
+GUID_MISS_TIMEOUT = 60 * 5
+
 log = commonware.log.getLogger('z.api')
 
 
@@ -251,30 +254,30 @@ def guid_search(request, api_version, guids):
 
     guids = [g.strip() for g in guids.split(',')] if guids else []
 
-    addons_xml = cache.get_many([guid_search_cache_key(g) for g in guids])
-    dirty_keys = set()
-
-    for g in guids:
-        key = guid_search_cache_key(g)
-        if key not in addons_xml:
-            dirty_keys.add(key)
-            try:
-                addon = Addon.objects.get(guid=g, disabled_by_user=False,
-                                          status__in=SEARCHABLE_STATUSES)
-
-            except Addon.DoesNotExist:
-                addons_xml[key] = ''
-
+    keys = dict((g, guid_search_cache_key(g)) for g in guids)
+    addons_xml = cache.get_many(keys.values())
+    misses = [g for g in guids if keys[g] not in addons_xml]
+
+    if misses:
+        # Look up all the misses at once, with a single run of the
+        # transformer. GUIDs compare without case in MySQL.
+        qs = Addon.objects.filter(guid__in=misses, disabled_by_user=False,
+                                  status__in=SEARCHABLE_STATUSES)
+        found = dict((a.guid.lower(), a) for a in qs)
+        hits, empty = {}, {}
+        for g in misses:
+            addon = found.get(g.lower())
+            if addon is None:
+                empty[keys[g]] = ''
             else:
-                addon_xml = render_xml_to_string(request,
-                                                 'api/includes/addon.xml',
-                                                 {'addon': addon,
-                                                  'api_version': api_version,
-                                                  'api': api})
-                addons_xml[key] = addon_xml
-
-    cache.set_many(dict((k, v) for k, v in addons_xml.iteritems()
-                                                    if k in dirty_keys))
+                hits[keys[g]] = render_xml_to_string(
+                    request, 'api/includes/addon.xml',
+                    {'addon': addon, 'api_version': api_version, 'api': api})
+        cache.set_many(hits)
+        # Unknown GUIDs could show up any time, don't remember them long.
+        cache.set_many(empty, GUID_MISS_TIMEOUT)
+        addons_xml.update(hits)
+        addons_xml.update(empty)
 
     compat = (CompatOverride.objects.filter(guid__in=guids)
               .transform(CompatOverride.transformer))
@@ -1,5 +1,6 @@
 from datetime import date, timedelta
 import itertools
+from operator import itemgetter
 
 from django.db import connection, transaction
 from django.db.models import Count
@@ -9,9 +10,10 @@ from celery.task.sets import TaskSet
 from celeryutils import task
 
 import amo
-from amo.utils import chunked, slugify
+from amo.utils import chunked, slugify, sorted_groupby
 from bandwagon.models import (Collection, SyncedCollection, CollectionUser,
                               CollectionVote, CollectionWatcher)
+from bandwagon.utils import SyncedCollectionQueue
 import cronjobs
 
 task_log = commonware.log.getLogger('z.task')
@@ -171,6 +173,74 @@ def _cleanup_synced_collections(**kw):
         _cleanup_synced_collections.delay()
 
 
+@cronjobs.register
+def flush_synced_collections():
+    """Write the SyncedCollection counts queued by the discovery pane."""
+    queue = SyncedCollectionQueue()
+    counts, addons = queue.drain()
+    if not counts:
+        return
+    try:
+        _flush_synced_collections(counts, addons)
+    except Exception:
+        # Keep them for the next run.
+        queue.restore(counts, addons)
+        raise
+    task_log.info('Flushed %s synced collection counts.' % len(counts))
+
+
+@transaction.commit_on_success
+def _flush_synced_collections(counts, addons):
+    cursor = connection.cursor()
+
+    # The bags that aren't in the db yet need their add-ons written.
+    existing = set()
+    for chunk in chunked(addons.keys(), 1000):
+        cursor.execute("""
+            SELECT addon_index FROM synced_collections
+            WHERE addon_index IN %s""", [chunk])
+        existing.update(r[0] for r in cursor.fetchall())
+
+    # Bags that gained users are created or bumped in one statement.
+    insert = [(index, count) for index, count in counts.items()
+              if count > 0 and index in addons]
+    for chunk in chunked(insert, 1000):
+        cursor.execute("""
+            INSERT INTO synced_collections
+                (addon_index, count, created, modified)
+            VALUES %s
+            ON DUPLICATE KEY UPDATE
+                count=count+VALUES(count), modified=NOW()"""
+            % ','.join(['(%s, %s, NOW(), NOW())'] * len(chunk)),
+            list(itertools.chain(*chunk)))
+
+    # The others only change existing rows, grouped by the change.
+    update = [(count, index) for index, count in counts.items()
+              if count < 0 or (count and index not in addons)]
+    for count, group in sorted_groupby(update, itemgetter(0)):
+        for chunk in chunked([index for _, index in group], 1000):
+            cursor.execute("""
+                UPDATE synced_collections
+                SET count=GREATEST(CAST(count AS SIGNED) + %s, 0),
+                    modified=NOW()
+                WHERE addon_index IN %s""", [count, chunk])
+
+    new = [index for index, count in insert if index not in existing]
+    ids = {}
+    for chunk in chunked(new, 1000):
+        cursor.execute("""
+            SELECT addon_index, id FROM synced_collections
+            WHERE addon_index IN %s""", [chunk])
+        ids.update(cursor.fetchall())
+    values = [(addon, ids[index]) for index in new for addon in addons[index]]
+    for chunk in chunked(values, 1000):
+        cursor.execute("""
+            INSERT IGNORE INTO synced_addons_collections
+                (addon_id, collection_id)
+            VALUES %s""" % ','.join(['(%s, %s)'] * len(chunk)),
+            list(itertools.chain(*chunk)))
+
+
 @cronjobs.register
 def drop_collection_recs():
     _drop_collection_recs.delay()
@@ -1,6 +1,6 @@
 from operator import attrgetter
 
-import amo
+from amo.utils import extract_trans
 
 
 def extract(collection):
@@ -10,11 +10,10 @@ def extract(collection):
     d = dict(zip(attrs, attrgetter(*attrs)(collection)))
     d['app'] = d.pop('application_id')
     d['name_sort'] = unicode(collection.name).lower()
+    # Also fills the name_<analyzer>, etc. fields for each language.
     translations = collection.translations
-    d['name'] = list(set(string for _, string
-                         in translations[collection.name_id]))
-    d['description'] = list(set(string for _, string
-                                in translations[collection.description_id]))
+    extract_trans(d, 'name', translations[collection.name_id])
+    extract_trans(d, 'description', translations[collection.description_id])
 
     # Boost by the number of subscribers.
     d['_boost'] = collection.subscribers ** .2
@@ -22,16 +21,4 @@ def extract(collection):
     # Double the boost if the collection is public.
     if collection.listed:
         d['_boost'] = max(d['_boost'], 1) * 4
-
-    # Indices for each language. languages is a list of locales we want to
-    # index with analyzer if the string's locale matches.
-    for analyzer, languages in amo.SEARCH_ANALYZER_MAP.iteritems():
-        d['name_' + analyzer] = list(
-            set(string for locale, string in translations[collection.name_id]
-                if locale.lower() in languages))
-        d['description_' + analyzer] = list(
-            set(string for locale, string
-                in translations[collection.description_id]
-                if locale.lower() in languages))
-
     return d
@@ -0,0 +1,55 @@
+import mock
+from nose.tools import eq_
+
+import amo.tests
+from bandwagon import cron
+from bandwagon.models import SyncedCollection
+from bandwagon.utils import SyncedCollectionQueue
+
+
+class TestFlushSyncedCollections(amo.tests.TestCase):
+    fixtures = ['base/addon-recs']
+
+    def setUp(self):
+        self.queue = SyncedCollectionQueue()
+
+    def addons(self, index):
+        c = SyncedCollection.objects.get(addon_index=index)
+        return sorted(c.addons.values_list('id', flat=True))
+
+    def test_create(self):
+        self.queue.add('a', [1843, 2464])
+        self.queue.add('a', [1843, 2464])
+        self.queue.add('b', [5299])
+        cron.flush_synced_collections()
+        eq_(SyncedCollection.objects.get(addon_index='a').count, 2)
+        eq_(self.addons('a'), [1843, 2464])
+        eq_(SyncedCollection.objects.get(addon_index='b').count, 1)
+        eq_(self.addons('b'), [5299])
+        # The queue is empty now.
+        eq_(self.queue.drain(), ({}, {}))
+
+    def test_update(self):
+        self.queue.add('a', [1843, 2464])
+        cron.flush_synced_collections()
+        self.queue.add('a', [1843, 2464])
+        self.queue.add('b', [5299], old_index='a')
+        self.queue.add('b', [5299], old_index='a')
+        self.queue.add('c', [7661], old_index='missing')
+        with self.assertNumQueries(5):
+            cron.flush_synced_collections()
+        # The add-ons aren't written again and the count doesn't go below 0.
+        eq_(SyncedCollection.objects.get(addon_index='a').count, 0)
+        eq_(self.addons('a'), [1843, 2464])
+        eq_(SyncedCollection.objects.get(addon_index='b').count, 2)
+        eq_(SyncedCollection.objects.filter(addon_index='missing').count(), 0)
+
+    @mock.patch.object(cron, '_flush_synced_collections')
+    def test_restore_on_error(self, flush):
+        flush.side_effect = ValueError
+        self.queue.add('a', [1843, 2464])
+        self.queue.add('b', [5299], old_index='a')
+        with self.assertRaises(ValueError):
+            cron.flush_synced_collections()
+        eq_(self.queue.drain(), ({'a': 0, 'b': 1},
+                                 {'a': [1843, 2464], 'b': [5299]}))
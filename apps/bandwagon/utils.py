@@ -0,0 +1,49 @@
+import redisutils
+
+
+class SyncedCollectionQueue(object):
+    """
+    SyncedCollection counts waiting to be written, kept in redis.
+
+    The discovery pane adds a +1 for the user's bag of add-ons and a -1 for
+    the bag they had before. The add-on ids of each bag are kept next to its
+    count so the flush can create the collections it hasn't seen. The
+    `flush_synced_collections` cron drains it into the db.
+    """
+
+    def __init__(self):
+        self.redis = redisutils.connections['master']
+        self.key = 'amo:synced:counts'
+        self.addons = 'amo:synced:addons'
+
+    def add(self, index, addon_ids, old_index=None):
+        pipe = self.redis.pipeline()
+        pipe.hincrby(self.key, index, 1)
+        pipe.hsetnx(self.addons, index, ','.join(map(str, addon_ids)))
+        if old_index:
+            pipe.hincrby(self.key, old_index, -1)
+        pipe.execute()
+
+    def drain(self):
+        """
+        Empties the queue and returns ({index: count change},
+        {index: addon ids}).
+        """
+        pipe = self.redis.pipeline()
+        pipe.hgetall(self.key)
+        pipe.hgetall(self.addons)
+        pipe.delete(self.key, self.addons)
+        counts, addons, _ = pipe.execute()
+        counts = dict((k, int(v)) for k, v in (counts or {}).items())
+        addons = dict((k, map(int, filter(None, v.split(','))))
+                      for k, v in (addons or {}).items())
+        return counts, addons
+
+    def restore(self, counts, addons):
+        """Puts back what `drain` returned, if it couldn't be written."""
+        pipe = self.redis.pipeline()
+        for index, count in counts.items():
+            pipe.hincrby(self.key, index, count)
+        for index, ids in addons.items():
+            pipe.hsetnx(self.addons, index, ','.join(map(str, ids)))
+        pipe.execute()
@@ -1,15 +1,20 @@
 import base64
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from xml.dom import minidom
 
 from django.conf import settings
 from django.core.cache import cache
+from django.utils.http import http_date
 
+import mock
 from nose.tools import eq_
+import redisutils
 
 import amo
 import amo.tests
 from amo.urlresolvers import reverse
+from . import views
 from .models import (BlocklistApp, BlocklistCA, BlocklistDetail,
                      BlocklistItem, BlocklistGfx, BlocklistPlugin)
 
@@ -427,3 +432,126 @@ class BlocklistCATest(BlocklistTest):
         dom = minidom.parseString(r.content)
         ca = dom.getElementsByTagName('caBlocklistEntry')[0]
         eq_(base64.b64decode(ca.childNodes[0].toxml()), self.ca.data)
+
+
+class BlocklistSectionsTest(BlocklistTest):
+
+    def setUp(self):
+        super(BlocklistSectionsTest, self).setUp()
+        self.item = BlocklistItem.objects.create(guid='guid@addon.com',
+                                                 details=self.details)
+
+    def items(self, url):
+        return self.dom(url).getElementsByTagName('emItem')
+
+    @mock.patch('blocklist.views.get_items', wraps=views.get_items)
+    def test_fragments_cached(self, get_items):
+        self.client.get(self.fx4_url)
+        self.client.get(self.fx4_url)
+        eq_(get_items.call_count, 1)
+        # The items don't depend on the app version.
+        self.client.get(reverse('blocklist',
+                                args=[3, amo.FIREFOX.guid, '5.0']))
+        eq_(get_items.call_count, 1)
+
+    @mock.patch('blocklist.views.get_items', wraps=views.get_items)
+    def test_only_changed_section(self, get_items):
+        self.client.get(self.fx4_url)
+        BlocklistGfx.objects.create(guid=amo.FIREFOX.guid)
+        eq_(len(self.dom(self.fx4_url)
+                .getElementsByTagName('gfxBlacklistEntry')), 1)
+        eq_(get_items.call_count, 1)
+
+    def test_item_change(self):
+        eq_(len(self.items(self.fx4_url)), 1)
+        BlocklistItem.objects.create(guid='other@addon.com',
+                                     details=self.details)
+        eq_(len(self.items(self.fx4_url)), 2)
+
+    @mock.patch('blocklist.views.get_plugins', wraps=views.get_plugins)
+    def test_plugins_by_version(self, get_plugins):
+        self.client.get(self.fx4_url)
+        self.client.get(reverse('blocklist',
+                                args=[3, amo.FIREFOX.guid, '5.0']))
+        eq_(get_plugins.call_count, 1)
+        # Below API version 3 the plugins depend on the app version.
+        self.client.get(self.fx2_url)
+        self.client.get(reverse('blocklist',
+                                args=[2, amo.FIREFOX.guid, '3.0']))
+        eq_(get_plugins.call_count, 3)
+
+
+class BlocklistConditionalTest(BlocklistTest):
+
+    def setUp(self):
+        super(BlocklistConditionalTest, self).setUp()
+        self.item = BlocklistItem.objects.create(guid='guid@addon.com',
+                                                 details=self.details)
+        self.app = BlocklistApp.objects.create(blitem=self.item,
+                                               guid=amo.FIREFOX.guid)
+
+    def test_etag(self):
+        etag = self.client.get(self.fx4_url)['ETag']
+        r = self.client.get(self.fx4_url, HTTP_IF_NONE_MATCH=etag)
+        eq_(r.status_code, 304)
+        self.app.update(max='5.0')
+        r = self.client.get(self.fx4_url, HTTP_IF_NONE_MATCH=etag)
+        eq_(r.status_code, 200)
+
+    def test_etag_per_version(self):
+        eq_(self.client.get(self.fx4_url)['ETag'],
+            self.client.get(reverse('blocklist', args=[3, amo.FIREFOX.guid,
+                                                       '5.0']))['ETag'])
+        assert (self.client.get(self.fx4_url)['ETag'] !=
+                self.client.get(self.fx2_url)['ETag'])
+
+    def test_last_modified(self):
+        modified = self.client.get(self.fx4_url)['Last-Modified']
+        r = self.client.get(self.fx4_url, HTTP_IF_MODIFIED_SINCE=modified)
+        eq_(r.status_code, 304)
+
+    def test_last_modified_is_gmt(self):
+        changed = int(time.time()) + 60 * 60
+        cache.set(views.CHANGED_KEY, changed * 1000)
+        eq_(self.client.get(self.fx4_url)['Last-Modified'], http_date(changed))
+
+    def delta(self, since):
+        url = '%s?since=%s' % (self.fx4_url, since)
+        return minidom.parseString(self.client.get(url).content)
+
+    def test_delta(self):
+        hour_ago = datetime.now() - timedelta(hours=1)
+        BlocklistItem.objects.filter(id=self.item.id).update(
+            modified=hour_ago - timedelta(hours=1))
+        plugin = BlocklistPlugin.objects.create(
+            guid=amo.FIREFOX.guid, details=BlocklistDetail.objects.create())
+        gfx = BlocklistGfx.objects.create(
+            guid=amo.FIREFOX.guid, details=BlocklistDetail.objects.create())
+        gfx.delete()
+
+        dom = self.delta(views.to_ms(hour_ago))
+        bl = dom.getElementsByTagName('blocklist')[0]
+        eq_(bl.getAttribute('since'), str(views.to_ms(hour_ago)))
+        eq_([p.getAttribute('blockID') for p in
+             dom.getElementsByTagName('pluginItem')], [plugin.block_id])
+        eq_([r.getAttribute('blockID') for r in
+             dom.getElementsByTagName('removedItem')], [gfx.block_id])
+
+    def test_delta_app_change(self):
+        hour_ago = datetime.now() - timedelta(hours=1)
+        BlocklistItem.objects.filter(id=self.item.id).update(
+            modified=hour_ago - timedelta(hours=1))
+        # Forget that the app was added in setUp.
+        redisutils.connections['master'].delete(views.REMOVED_KEY)
+        eq_(self.delta(views.to_ms(hour_ago))
+            .getElementsByTagName('emItem'), [])
+        self.app.update(max='5.0')
+        dom = self.delta(views.to_ms(hour_ago))
+        eq_([i.getAttribute('id') for i in
+             dom.getElementsByTagName('emItem')], ['guid@addon.com'])
+
+    def test_delta_too_old(self):
+        dom = self.delta(1)
+        eq_(dom.getElementsByTagName('blocklist')[0].getAttribute('since'),
+            '')
+        eq_(len(dom.getElementsByTagName('emItem')), 1)
@@ -10,8 +10,10 @@ from django.db.models import Q, signals as db_signals
 from django.shortcuts import get_object_or_404
 from django.utils.cache import patch_cache_control
 from django.utils.encoding import smart_str
+from django.views.decorators.http import condition
 
 import jingo
+import jinja2
 import redisutils
 
 from amo.utils import sorted_groupby
@@ -25,62 +27,260 @@ App = collections.namedtuple('App', 'guid min max')
 BlItem = collections.namedtuple('BlItem', 'rows os modified block_id')
 
 
+# The XML is put together from a fragment for each section, cached
+# separately so a change only re-renders the section it touches.
+SECTIONS = ('items', 'plugins', 'gfxs', 'cas')
+# The sections each model shows up in.
+MODEL_SECTIONS = {
+    BlocklistItem: ['items'],
+    BlocklistApp: ['items'],
+    BlocklistPlugin: ['plugins'],
+    BlocklistGfx: ['gfxs'],
+    BlocklistCA: ['cas'],
+    BlocklistDetail: ['items', 'plugins', 'gfxs'],
+}
+FRAGMENT_TIMEOUT = 60 * 60
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+# When anything in the blocklist last changed, in ms.
+CHANGED_KEY = 'blocklist:changed'
+# How long we remember removals for deltas. Asking for the changes since
+# before that gets the whole blocklist.
+REMOVED_TIMEOUT = 60 * 60 * 24 * 60
+REMOVED_KEY = 'blocklist:removed'
+
+
+def blocklist_state(request, apiver, app, appver):
+    """
+    Returns the fragment keys and the fragments for the request, worked out
+    once for the conditional GET checks and the view.
+    """
+    if not hasattr(request, '_blocklist'):
+        request._blocklist = get_fragments(request, int(apiver), app, appver)
+    return request._blocklist
+
+
+def blocklist_etag(request, apiver, app, appver):
+    # The keys change with the version of each section.
+    keys = blocklist_state(request, apiver, app, appver)[0]
+    return hashlib.md5('%s:%s' % (':'.join(keys),
+                                  get_since(request))).hexdigest()
+
+
+def blocklist_last_modified(request, apiver, app, appver):
+    fragments = blocklist_state(request, apiver, app, appver)[1]
+    # Deletes and target app changes don't show up in the modified dates.
+    modified = [m for _, m in fragments if m] + [get_or_now(CHANGED_KEY)]
+    return datetime.utcfromtimestamp(max(modified) / 1000)
+
+
+def get_since(request):
+    """
+    Returns the `since` of a delta request, in ms, if we still know what was
+    removed since then.
+    """
+    try:
+        since = int(request.GET.get('since', ''))
+    except ValueError:
+        return None
+    if since < (time.time() - REMOVED_TIMEOUT) * 1000:
+        return None
+    return since
+
+
+@condition(etag_func=blocklist_etag,
+           last_modified_func=blocklist_last_modified)
 def blocklist(request, apiver, app, appver):
-    key = 'blocklist:%s:%s:%s' % (apiver, app, appver)
-    # Use md5 to make sure the memcached key is clean.
-    key = hashlib.md5(smart_str(key)).hexdigest()
-    response = cache.get(key)
-    if response is None:
+    since = get_since(request)
+    if since is None:
         response = _blocklist(request, apiver, app, appver)
-        cache.set(key, response, 60 * 60)
-        # This gets cleared with the clear_blocklist signal handler.
-        try:
-            redisutils.connections['master'].sadd('blocklist:keys', key)
-        except Exception:
-            pass  # Don't crash me bro.
+    else:
+        response = _blocklist_delta(request, apiver, app, appver, since)
     patch_cache_control(response, max_age=60 * 60)
     return response
 
 
 def _blocklist(request, apiver, app, appver):
+    fragments = blocklist_state(request, apiver, app, appver)[1]
+    data = dict(last_update=get_last_update(fragments),
+                sections=[jinja2.Markup(xml) for xml, _ in fragments])
+    return jingo.render(request, 'blocklist/blocklist.xml', data,
+                        content_type='text/xml')
+
+
+def _blocklist_delta(request, apiver, app, appver, since):
+    """
+    The entries added or changed since `since`, as in the full blocklist,
+    and the blockIDs of the entries removed since.
+    """
     apiver = int(apiver)
-    items = get_items(apiver, app, appver)[0]
-    plugins = get_plugins(apiver, app, appver)
-    gfxs = BlocklistGfx.objects.filter(Q(guid__isnull=True) | Q(guid=app))
-    cas = None
+    removed, guids = get_removed(since)
+    changed = lambda obj: to_ms(obj.modified) >= since
+    items = dict((guid, item) for guid, item
+                 in get_items(apiver, app, appver)[0].items()
+                 if changed(item) or guid in guids)
+    plugins = [p for p in get_plugins(apiver, app, appver) if changed(p)]
+    gfxs = [g for g in get_gfxs(app) if changed(g)]
+    ca = get_ca()
+    sections = [
+        ('items', {'items': items}),
+        ('plugins', {'plugins': plugins, 'apiver': apiver}),
+        ('gfxs', {'gfxs': gfxs}),
+        ('cas', {'cas': base64.b64encode(ca.data)
+                        if ca and changed(ca) else None}),
+    ]
+    fragments = blocklist_state(request, apiver, app, appver)[1]
+    data = dict(last_update=get_last_update(fragments), since=since,
+                removed=removed,
+                sections=[jinja2.Markup(jingo.render_to_string(
+                    request, 'blocklist/%s.xml' % section, ctx))
+                    for section, ctx in sections])
+    return jingo.render(request, 'blocklist/blocklist.xml', data,
+                        content_type='text/xml')
 
-    try:
-        cas = BlocklistCA.objects.all()[0]
-        cas = base64.b64encode(cas.data)
-    except IndexError:
-        pass
 
+def get_last_update(fragments):
     # Find the latest created/modified date across all sections.
-    all_ = list(items.values()) + list(plugins) + list(gfxs)
-    last_update = max(x.modified for x in all_) if all_ else datetime.now()
+    modified = [m for _, m in fragments if m]
+    return max(modified) if modified else to_ms(datetime.now())
+
+
+def to_ms(dt):
     # The client expects milliseconds, Python's time returns seconds.
-    last_update = int(time.mktime(last_update.timetuple()) * 1000)
-    data = dict(items=items, plugins=plugins, gfxs=gfxs, apiver=apiver,
-                appguid=app, appver=appver, last_update=last_update, cas=cas)
-    return jingo.render(request, 'blocklist/blocklist.xml', data,
-                        content_type='text/xml')
+    return int(time.mktime(dt.timetuple()) * 1000)
 
 
-def clear_blocklist(*args, **kw):
-    # Something in the blocklist changed; invalidate all responses.
-    redis = redisutils.connections['master']
-    keys = redis.smembers('blocklist:keys')
-    cache.delete_many(keys)
-    redis.delete('blocklist:keys')
+def get_or_now(key):
+    """
+    Returns the number in `key`, starting it at the time in ms if it's not
+    in the cache.
+    """
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, int(time.time() * 1000), VERSION_TIMEOUT)
+        value = cache.get(key)
+    return value
+
+
+def section_version(section):
+    # Starting from the time we don't go back to a version that could still
+    # have fragments in the cache.
+    return get_or_now('blocklist:version:%s' % section)
+
+
+def get_fragments(request, apiver, app, appver):
+    """
+    Returns the cache keys and a (xml, last modified in ms) fragment for
+    each section, rendering the ones that aren't cached.
+    """
+    # Only plugins depend on the API version, and on the app version below 3.
+    buckets = {'items': [app], 'gfxs': [app], 'cas': [],
+               'plugins': [app, 3 if apiver > 2 else '%s:%s' % (apiver,
+                                                                appver)]}
+    keys = []
+    for section in SECTIONS:
+        key = 'blocklist:%s:%s:%s' % (section, section_version(section),
+                                      ':'.join(map(smart_str,
+                                                   buckets[section])))
+        # Use md5 to make sure the memcached key is clean.
+        keys.append(hashlib.md5(key).hexdigest())
+    cached = cache.get_many(keys)
+    fragments = []
+    for section, key in zip(SECTIONS, keys):
+        fragment = cached.get(key)
+        if fragment is None:
+            fragment = render_section(request, section, apiver, app, appver)
+            cache.set(key, fragment, FRAGMENT_TIMEOUT)
+        fragments.append(fragment)
+    return keys, fragments
+
+
+def render_section(request, section, apiver, app, appver):
+    if section == 'items':
+        items = get_items(apiver, app, appver)[0]
+        data, modified = {'items': items}, [i.modified for i in
+                                            items.values()]
+    elif section == 'plugins':
+        plugins = get_plugins(apiver, app, appver)
+        data, modified = ({'plugins': plugins, 'apiver': apiver},
+                          [p.modified for p in plugins])
+    elif section == 'gfxs':
+        gfxs = get_gfxs(app)
+        data, modified = {'gfxs': gfxs}, [g.modified for g in gfxs]
+    else:
+        ca = get_ca()
+        data, modified = {'cas': base64.b64encode(ca.data) if ca else None}, []
+    xml = jingo.render_to_string(request, 'blocklist/%s.xml' % section, data)
+    return xml, to_ms(max(modified)) if modified else None
+
+
+def get_removed(since):
+    """
+    Returns the blockIDs removed since `since` and the guids of the items
+    that lost a version range or had their apps changed since.
+    """
+    removed, guids = [], set()
+    changes = redisutils.connections['master'].hgetall(REMOVED_KEY) or {}
+    for field, when in changes.items():
+        if int(when) >= since:
+            kind, value = field.split(':', 1)
+            if kind == 'block':
+                removed.append(value)
+            else:
+                guids.add(value)
+    return sorted(removed), guids
+
+
+def clear_blocklist(sender, *args, **kw):
+    # Something in the blocklist changed; move the sections it's in to a new
+    # version so they get rendered again.
+    for section in MODEL_SECTIONS[sender]:
+        key = 'blocklist:version:%s' % section
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), VERSION_TIMEOUT)
+    cache.set(CHANGED_KEY, int(time.time() * 1000), VERSION_TIMEOUT)
     flush_front_end_cache_urls.delay(['/blocklist/*'])
 
 
-for m in (BlocklistItem, BlocklistPlugin, BlocklistGfx, BlocklistApp,
-          BlocklistCA, BlocklistDetail):
+def remember_removed(sender, instance, **kw):
+    """Keeps what was removed from items, plugins and gfx for deltas."""
+    fields = []
+    if sender is BlocklistApp:
+        try:
+            fields.append('guid:%s' % instance.blitem.guid)
+        except BlocklistItem.DoesNotExist:
+            pass
+    else:
+        fields.append('block:%s' % instance.block_id)
+        if sender is BlocklistItem:
+            # Other version ranges of the item have to be sent again.
+            fields.append('guid:%s' % instance.guid)
+    now = int(time.time() * 1000)
+    oldest = now - REMOVED_TIMEOUT * 1000
+    redis = redisutils.connections['master']
+    pipe = redis.pipeline()
+    for field, when in (redis.hgetall(REMOVED_KEY) or {}).items():
+        if int(when) < oldest:
+            pipe.hdel(REMOVED_KEY, field)
+    for field in fields:
+        pipe.hset(REMOVED_KEY, field, now)
+    pipe.execute()
+
+
+for m in MODEL_SECTIONS:
     db_signals.post_save.connect(clear_blocklist, sender=m,
                                  dispatch_uid='save_%s' % m)
     db_signals.post_delete.connect(clear_blocklist, sender=m,
                                    dispatch_uid='delete_%s' % m)
+for m in (BlocklistItem, BlocklistPlugin, BlocklistGfx):
+    db_signals.post_delete.connect(remember_removed, sender=m,
+                                   dispatch_uid='removed_%s' % m)
+# Changing the apps of an item doesn't change its modified date.
+db_signals.post_save.connect(remember_removed, sender=BlocklistApp,
+                             dispatch_uid='removed_save_blapp')
+db_signals.post_delete.connect(remember_removed, sender=BlocklistApp,
+                               dispatch_uid='removed_delete_blapp')
 
 
 def get_items(apiver, app, appver=None):
@@ -124,6 +324,18 @@ def get_plugins(apiver, app, appver=None):
     return list(plugins)
 
 
+def get_gfxs(app):
+    return list(BlocklistGfx.objects.filter(Q(guid__isnull=True) |
+                                            Q(guid=app)))
+
+
+def get_ca():
+    try:
+        return BlocklistCA.objects.all()[0]
+    except IndexError:
+        return None
+
+
 def blocked_list(request, apiver=3):
     app = request.APP.guid
     objs = get_items(apiver, app)[1].values() + get_plugins(apiver, app)
@@ -22,7 +22,8 @@ class ActivityFeedRSS(Feed):
             addons = key.user.addons.exclude(type=amo.ADDON_WEBAPP)
 
         return (ActivityLog.objects.for_addons(addons)
-                           .exclude(action__in=amo.LOG_HIDE_DEVELOPER))[:20]
+                           .exclude(action__in=amo.LOG_HIDE_DEVELOPER)
+                           .transform(ActivityLog.transformer))[:20]
 
     def item_title(self, item):
         return strip_html(item.to_string())
@@ -1,3 +1,4 @@
+import collections
 from copy import copy
 from datetime import datetime
 import json
@@ -151,10 +152,9 @@ class ActivityLogManager(amo.models.ManagerBase):
         vals = (AddonLog.objects.filter(addon__in=addons)
                 .values_list('activity_log', flat=True))
 
-        if vals:
-            return self.filter(pk__in=list(vals))
-        else:
-            return self.none()
+        # An empty pk__in skips the query like none(), but the result can
+        # still be transformed.
+        return self.filter(pk__in=list(vals))
 
     def for_apps(self, apps):
         if isinstance(apps, Webapp):
@@ -163,10 +163,7 @@ class ActivityLogManager(amo.models.ManagerBase):
         vals = (AppLog.objects.filter(addon__in=apps)
                 .values_list('activity_log', flat=True))
 
-        if vals:
-            return self.filter(pk__in=list(vals))
-        else:
-            return self.none()
+        return self.filter(pk__in=list(vals))
 
     def for_version(self, version):
         vals = (VersionLog.objects.filter(version=version)
@@ -242,9 +239,8 @@ class ActivityLog(amo.models.ModelBase):
         # SafeFormatter escapes everything so this is safe.
         return jinja2.Markup(self.formatter.format(*args, **kw))
 
-    @property
-    def arguments(self):
-
+    def _parse_arguments(self):
+        """Returns a list of (model name, pk or value) pairs, or None."""
         try:
             # d is a structure:
             # ``d = [{'addons.addon'=12}, {'addons.addon'=1}, ... ]``
@@ -252,19 +248,14 @@ class ActivityLog(amo.models.ModelBase):
         except:
             log.debug('unserializing data from addon_log failed: %s' % self.id)
             return None
+        # Each item has only one element.
+        return [item.items()[0] for item in d]
 
-        objs = []
-        for item in d:
-            # item has only one element.
-            model_name, pk = item.items()[0]
-            if model_name in ('str', 'int', 'null'):
-                objs.append(pk)
-            else:
-                (app_label, model_name) = model_name.split('.')
-                model = models.loading.get_model(app_label, model_name)
-                objs.extend(model.objects.filter(pk=pk))
-
-        return objs
+    @property
+    def arguments(self):
+        if not hasattr(self, '_resolved_arguments'):
+            ActivityLog.attach_arguments([self])
+        return self._resolved_arguments
 
     @arguments.setter
     def arguments(self, args=[]):
@@ -293,6 +284,64 @@ class ActivityLog(amo.models.ModelBase):
                 serialize_me.append(dict(((unicode(arg._meta), arg.pk),)))
 
         self._arguments = json.dumps(serialize_me)
+        self.__dict__.pop('_resolved_arguments', None)
+
+    @staticmethod
+    def attach_arguments(logs):
+        """
+        Resolves the arguments of `logs` with one query per model. The default
+        managers are used, so add-ons and collections get their transformers.
+        """
+        parsed = [(al, al._parse_arguments()) for al in logs]
+        pks = collections.defaultdict(set)
+        for al, items in parsed:
+            for model_name, pk in items or []:
+                if model_name not in ('str', 'int', 'null'):
+                    pks[model_name].add(pk)
+
+        objs = {}
+        for model_name, ids in pks.items():
+            model = models.loading.get_model(*model_name.split('.'))
+            objs.update(((model_name, unicode(obj.pk)), obj)
+                        for obj in model.objects.filter(pk__in=ids))
+
+        # Versions and reviews link through their add-on, so give them the
+        # add-ons we have and fetch the rest together.
+        addons = dict((obj.id, obj) for obj in objs.values()
+                      if isinstance(obj, Addon))
+        linked = [obj for obj in objs.values()
+                  if isinstance(obj, (Version, Review))]
+        missing = set(obj.addon_id for obj in linked) - set(addons)
+        if missing:
+            addons.update((a.id, a) for a in
+                          Addon.objects.filter(id__in=missing))
+        for obj in linked:
+            if obj.addon_id in addons:
+                obj.addon = addons[obj.addon_id]
+
+        for al, items in parsed:
+            if items is None:
+                al._resolved_arguments = None
+                continue
+            args = []
+            for model_name, pk in items:
+                if model_name in ('str', 'int', 'null'):
+                    args.append(pk)
+                elif (model_name, unicode(pk)) in objs:
+                    args.append(objs[model_name, unicode(pk)])
+            al._resolved_arguments = args
+
+    @staticmethod
+    def transformer(logs):
+        """Attaches the arguments and users of `logs` in bulk."""
+        ActivityLog.attach_arguments(logs)
+        users = collections.defaultdict(list)
+        for al in logs:
+            if al.user_id:
+                users[al.user_id].append(al)
+        for user in UserProfile.objects.filter(id__in=users.keys()):
+            for al in users[user.id]:
+                al.user = user
 
     @property
     def details(self):
@@ -143,6 +143,29 @@ class TestActivityLog(amo.tests.TestCase):
         eq_(len(versions[0].all_activity), 1)
         eq_(len(versions[1].all_activity), 1)
 
+    def test_transformer(self):
+        addon = Addon.objects.get()
+        version = addon.latest_version
+        review = Review.objects.create(user=self.user, addon=addon)
+        amo.log(amo.LOG.REJECT_VERSION, addon, version, user=self.user)
+        amo.log(amo.LOG.ADD_REVIEW, addon, review, user=self.user)
+        amo.log(amo.LOG.CUSTOM_TEXT, 'hi', (Addon, 999999), user=self.user)
+        logs = list(ActivityLog.objects.order_by('id')
+                    .transform(ActivityLog.transformer))
+        with self.assertNumQueries(0):
+            eq_([a.arguments for a in logs],
+                [[addon, version], [addon, review], ['hi']])
+            eq_([a.user for a in logs], [self.user] * 3)
+            eq_(logs[0].arguments[1].addon, addon)
+            assert version.version in logs[0].to_string()
+
+    def test_arguments_setter(self):
+        a = ActivityLog()
+        a.arguments = [(Addon, 3615)]
+        eq_(a.arguments[0].id, 3615)
+        a.arguments = ['hi']
+        eq_(a.arguments, ['hi'])
+
     def test_xss_arguments(self):
         addon = Addon.objects.get()
         au = AddonUser(addon=addon, user=self.user)
@@ -214,7 +214,8 @@ def _get_items(action, addons):
 
     filter = filters.get(action)
     items = (ActivityLog.objects.for_addons(addons).filter()
-                        .exclude(action__in=amo.LOG_HIDE_DEVELOPER))
+                        .exclude(action__in=amo.LOG_HIDE_DEVELOPER)
+                        .transform(ActivityLog.transformer))
     if filter:
         items = items.filter(action__in=[i.id for i in filter])
 
@@ -3,6 +3,7 @@ import json
 from django import test
 from django.core.cache import cache
 
+import mock
 from nose.tools import eq_
 from pyquery import PyQuery as pq
 import waffle
@@ -11,8 +12,10 @@ import amo
 import amo.tests
 from amo.tests import addon_factory
 import addons.signals
+import bandwagon.cron
 from amo.urlresolvers import reverse
 from addons.models import Addon, AddonDependency, AddonUpsell, Preview
+from addons.utils import RecsScorer
 from applications.models import Application, AppVersion
 from bandwagon.models import MonthlyPick, SyncedCollection
 from bandwagon.tests.test_models import TestRecommendations as Recs
@@ -34,6 +37,8 @@ class TestRecs(amo.tests.TestCase):
         test.Client().get('/')
 
     def setUp(self):
+        # Load the scorer again for the add-ons set up below.
+        RecsScorer.reset()
         self.url = reverse('discovery.recs', args=['3.6', 'Darwin'])
         self.guids = ('bettergcal@ginatrapani.org',
                       'foxyproxy@eric.h.jung',
@@ -167,6 +172,9 @@ class TestRecs(amo.tests.TestCase):
         response = self.client.post(self.url, self.json,
                                     content_type='application/json')
         one = json.loads(response.content)
+        # The collections are written by the cron.
+        eq_(SyncedCollection.objects.count(), 0)
+        bandwagon.cron.flush_synced_collections()
 
         post_data = json.dumps(dict(guids=self.guids[:1],
                                     token2=one['token2']))
@@ -178,10 +186,31 @@ class TestRecs(amo.tests.TestCase):
         # Tokens are based on guid list, so these should be different.
         assert one['token2'] != two['token2']
         assert one['addons'] != two['addons']
-        eq_(SyncedCollection.objects.filter(addon_index=one['token2']).count(),
-            1)
-        eq_(SyncedCollection.objects.filter(addon_index=two['token2']).count(),
-            1)
+        bandwagon.cron.flush_synced_collections()
+        eq_(SyncedCollection.objects.get(addon_index=one['token2']).count, 0)
+        eq_(SyncedCollection.objects.get(addon_index=two['token2']).count, 1)
+
+    def test_store_collection(self):
+        waffle.models.Sample.objects.create(
+            name='disco-pane-store-collections', percent='100.0')
+        for _ in range(2):
+            response = self.client.post(self.url, self.json,
+                                        content_type='application/json')
+        bandwagon.cron.flush_synced_collections()
+        c = SyncedCollection.objects.get()
+        eq_(c.addon_index, json.loads(response.content)['token2'])
+        eq_(c.count, 2)
+        eq_(sorted(c.addons.values_list('id', flat=True)), sorted(self.ids))
+
+    @mock.patch('discovery.views.SyncedCollectionQueue')
+    def test_store_collection_fails(self, queue):
+        waffle.models.Sample.objects.create(
+            name='disco-pane-store-collections', percent='100.0')
+        queue().add.side_effect = Exception
+        response = self.client.post(self.url, self.json,
+                                    content_type='application/json')
+        eq_(response.status_code, 200)
+        assert json.loads(response.content)['addons']
 
 
 class TestModuleAdmin(amo.tests.TestCase):
@@ -5,8 +5,6 @@ import urlparse
 
 from django import http
 from django.contrib import admin
-from django.db import IntegrityError
-from django.db.models import F
 from django.forms.models import modelformset_factory
 from django.shortcuts import get_object_or_404, redirect
 from django.views.decorators.csrf import csrf_exempt
@@ -24,9 +22,10 @@ from amo.models import manual_order
 from amo.urlresolvers import reverse
 from addons.decorators import addon_view_factory
 from addons.models import Addon, AddonRecommendation
-from addons.utils import FeaturedManager
+from addons.utils import FeaturedManager, RecsScorer
 from browse.views import personas_listing
-from bandwagon.models import Collection, SyncedCollection
+from bandwagon.models import Collection
+from bandwagon.utils import SyncedCollectionQueue
 from discovery.modules import PromoVideoCollection
 from reviews.models import Review
 from stats.models import GlobalStat
@@ -199,42 +198,33 @@ def recommendations(request, version, platform, limit=9, compat_mode=None):
     addon_ids = get_addon_ids(guids)
     index = Collection.make_index(addon_ids)
 
-    ids, recs = Collection.get_recs_from_ids(addon_ids, request.APP, version,
-                                             compat_mode)
+    # Only hydrate enough of the best recs to fill the response after
+    # addon_filter drops some.
+    ids = RecsScorer.get().score(addon_ids, request.APP, version, compat_mode,
+                                 limit=limit + api.views.BUFFER)
+    recs = Addon.objects.public().filter(id__in=ids)
     recs = _recommendations(request, version, platform, limit, index, ids,
                             recs, compat_mode)
 
-    # We're only storing a percentage of the collections we see because the db
-    # can't keep up with 100%.
+    # The counts are queued in redis and written by the
+    # flush_synced_collections cron, so the sample can go up to 100%.
     if not waffle.sample_is_active('disco-pane-store-collections'):
         return recs
 
     # Users have a token2 if they've been here before. The token matches
     # addon_index in their SyncedCollection.
-    if 'token2' in POST:
-        token = POST['token2']
-        if token == index:
-            # We've seen them before and their add-ons have not changed.
-            return recs
-        elif token != index:
-            # We've seen them before and their add-ons changed. Remove the
-            # reference to their old synced collection.
-            (SyncedCollection.objects.filter(addon_index=index)
-             .update(count=F('count') - 1))
-
-    # Try to create the SyncedCollection. There's a unique constraint on
-    # addon_index so it will fail if this addon_index already exists. If we
-    # checked for existence first and then created a collection there would
-    # be a race condition between multiple users with the same addon_index.
+    token = POST.get('token2')
+    if token == index:
+        # We've seen them before and their add-ons have not changed.
+        return recs
+
+    # Count them in the collection for their add-ons. If we've seen them
+    # before with different add-ons, their old collection loses them.
     try:
-        c = SyncedCollection.objects.create(addon_index=index, count=1)
-        c.set_addons(addon_ids)
-    except IntegrityError:
-        try:
-            (SyncedCollection.objects.filter(addon_index=index)
-             .update(count=F('count') + 1))
-        except Exception, e:
-            log.error(u'Could not count++ "%s" (%s).' % (index, e))
+        SyncedCollectionQueue().add(index, addon_ids, old_index=token)
+    except Exception, e:
+        # Don't crash me bro, counting them isn't worth failing the recs.
+        log.error('Could not queue synced collection %s: %s' % (index, e))
     return recs
 
 
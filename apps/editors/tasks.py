@@ -38,7 +38,9 @@ def add_versionlog(items, **kw):
     log.info('[%s@%s] Adding VersionLog starting with ActivityLog: %s' %
              (len(items), add_versionlog.rate_limit, items[0]))
 
-    for al in ActivityLog.objects.filter(pk__in=items):
+    logs = (ActivityLog.objects.filter(pk__in=items)
+            .transform(ActivityLog.attach_arguments))
+    for al in logs:
         # Delete existing entries:
         VersionLog.objects.filter(activity_log=al).delete()
 
@@ -89,7 +89,8 @@ def context(**kw):
 @reviewer_required
 def eventlog(request):
     form = forms.EventLogForm(request.GET)
-    eventlog = ActivityLog.objects.editor_events()
+    eventlog = (ActivityLog.objects.editor_events()
+                .transform(ActivityLog.transformer))
 
     if form.is_valid():
         if form.cleaned_data['start']:
@@ -123,7 +124,8 @@ def home(request):
     data = context(reviews_total=ActivityLog.objects.total_reviews()[:5],
                    reviews_monthly=ActivityLog.objects.monthly_reviews()[:5],
                    new_editors=EventLog.new_editors(),
-                   eventlog=ActivityLog.objects.editor_events()[:6],
+                   eventlog=(ActivityLog.objects.editor_events()
+                             .transform(ActivityLog.transformer)[:6]),
                    progress=progress, percentage=percentage,
                    durations=durations)
 
@@ -578,7 +580,8 @@ def reviewlog(request):
 
     form = forms.ReviewLogForm(data)
 
-    approvals = ActivityLog.objects.review_queue()
+    approvals = (ActivityLog.objects.review_queue()
+                 .transform(ActivityLog.transformer))
 
     if form.is_valid():
         data = form.cleaned_data
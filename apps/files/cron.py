@@ -1,4 +1,3 @@
-import hashlib
 import os
 import shutil
 import stat
@@ -10,6 +9,7 @@ from django.core.cache import cache
 import cronjobs
 import commonware.log
 
+from amo.utils import memoize_key
 from files.models import FileValidation
 
 log = commonware.log.getLogger('z.cron')
@@ -32,10 +32,7 @@ def cleanup_extracted_file():
             except ValueError:
                 continue
 
-            key = hashlib.md5()
-            key.update(str(id))
-            cache.delete('%s:memoize:%s:%s' % (settings.CACHE_PREFIX,
-                                               'file-viewer', key.hexdigest()))
+            cache.delete(memoize_key('file-viewer', id))
 
 
 @cronjobs.register
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+from datetime import datetime
+
 from django.db import models
 from django.dispatch import receiver
 from django.utils import translation
@@ -164,7 +166,8 @@ def create_addon_purchase(sender, instance, **kw):
         for p in purchases:
             log.debug('Changing addon purchase: %s, addon %s, user %s'
                       % (p.pk, instance.addon.pk, instance.user.pk))
-            p.update(type=instance.type)
+            # Bump modified so the receipt verifiers notice the refund.
+            p.update(type=instance.type, modified=datetime.now())
 
 
 class AddonPremium(amo.models.ModelBase):
@@ -1,6 +1,7 @@
 import datetime
 
 from django.core.management import call_command
+from django.db import connection
 from django.db.models import Sum, Max
 
 import commonware.log
@@ -10,7 +11,7 @@ import cronjobs
 from amo.utils import chunked
 from addons.models import Addon
 from .models import (AddonCollectionCount, CollectionCount,
-                     UpdateCount)
+                     DownloadCount, UpdateCount)
 from . import tasks
 
 task_log = commonware.log.getLogger('z.task')
@@ -46,15 +47,15 @@ def update_global_totals(date=None):
     """Update global statistics totals."""
 
     today = date or datetime.date.today()
-    today_jobs = [dict(job=job, date=today) for job in
-                  tasks._get_daily_jobs(date)]
+    today_jobs = dict(jobs=list(tasks._get_daily_jobs(date)), date=today)
 
     max_update = date or UpdateCount.objects.aggregate(max=Max('date'))['max']
-    metrics_jobs = [dict(job=job, date=max_update) for job in
-                    tasks._get_metrics_jobs(date)]
+    metrics_jobs = dict(jobs=list(tasks._get_metrics_jobs(date)),
+                        date=max_update)
 
-    ts = [tasks.update_global_totals.subtask(kwargs=kw)
-          for kw in today_jobs + metrics_jobs]
+    # One task per date so the jobs can share their queries.
+    ts = [tasks.update_global_stats.subtask(kwargs=kw)
+          for kw in (today_jobs, metrics_jobs)]
     TaskSet(ts).apply_async()
 
 
@@ -73,3 +74,50 @@ def index_latest_stats():
     date_range = '%s:%s' % (fmt(latest), fmt(datetime.date.today()))
     cron_log.info('index_stats --date=%s' % date_range)
     call_command('index_stats', addons=None, date=date_range)
+    _rollup_stats(datetime.date(*latest.timetuple()[:3]),
+                  datetime.date.today())
+
+
+@cronjobs.register
+def rollup_stats(start, end=None):
+    """
+    Recalculate the weekly and monthly stats rollups from `start` to `end`
+    (YYYY-MM-DD), e.g. to fill them in for old stats.
+    """
+    parse = lambda d: datetime.datetime.strptime(d, '%Y-%m-%d').date()
+    start = parse(start)
+    end = parse(end) if end else datetime.date.today()
+    _rollup_stats(start, end)
+
+
+def _rollup_stats(start, end):
+    # Only the add-ons with new daily stats need their rollups recalculated.
+    addons = set()
+    for model in DownloadCount, UpdateCount:
+        addons.update(model.objects.filter(date__range=(start, end))
+                      .values_list('addon', flat=True).distinct())
+    cron_log.info('Rolling up stats for %s add-ons from %s to %s.' %
+                  (len(addons), start, end))
+    ts = [tasks.update_rollups.subtask(args=[chunk, start, end])
+          for chunk in chunked(sorted(addons), 100)]
+    TaskSet(ts).apply_async()
+
+
+@cronjobs.register
+def stats_dicts_to_json():
+    """Rewrite the PHP serialized stats breakdowns as JSON in the background."""
+    step = 5000
+    for table in tasks.STATS_DICT_MODELS:
+        cursor = connection.cursor()
+        cursor.execute('SELECT MIN(id), MAX(id) FROM %s' % table)
+        low, high = cursor.fetchone()
+        if low is None:
+            continue
+        ranges = [(start, min(start + step - 1, high))
+                  for start in xrange(low, high + 1, step)]
+        cron_log.info('Converting %s to JSON in %s tasks.' %
+                      (table, len(ranges)))
+        for chunk in chunked(ranges, 1000):
+            ts = [tasks.stats_dicts_to_json.subtask(args=[table, start, end])
+                  for start, end in chunk]
+            TaskSet(ts).apply_async()
@@ -7,6 +7,57 @@ except ImportError:
     import json
 
 
+def php_unserialize(data):
+    """
+    Decodes the PHP serialized arrays we store, like phpserialize.unserialize
+    with decode_strings=True, but much faster. Arrays come back as dicts.
+
+    Only handles arrays, strings, ints, floats, booleans and nulls. Raises
+    ValueError for anything else so the caller can fall back to phpserialize.
+    """
+    try:
+        value, pos = _php_value(data, 0)
+    except (IndexError, KeyError, TypeError, UnicodeDecodeError):
+        raise ValueError('Unexpected PHP serialized data.')
+    if pos != len(data):
+        raise ValueError('Trailing PHP serialized data.')
+    return value
+
+
+def _php_value(data, pos):
+    # Returns the value starting at `pos` and where the next one starts.
+    kind = data[pos]
+    if kind == 'a':
+        # a:<count>:{<key><value>...}
+        end = data.index(':', pos + 2)
+        count = int(data[pos + 2:end])
+        if data[end + 1] != '{':
+            raise ValueError('Bad array.')
+        pos = end + 2
+        rv = {}
+        for _ in xrange(count):
+            key, pos = _php_value(data, pos)
+            rv[key], pos = _php_value(data, pos)
+        if data[pos] != '}':
+            raise ValueError('Bad array.')
+        return rv, pos + 1
+    elif kind == 's':
+        # s:<byte length>:"<string>";
+        end = data.index(':', pos + 2)
+        start = end + 2
+        stop = start + int(data[pos + 2:end])
+        if data[end + 1] != '"' or data[stop:stop + 2] != '";':
+            raise ValueError('Bad string.')
+        return data[start:stop].decode('utf-8'), stop + 2
+    elif kind == 'N':
+        return None, pos + 2
+    end = data.index(';', pos + 2)
+    return _php_scalars[kind](data[pos + 2:end]), end + 1
+
+
+_php_scalars = {'i': int, 'd': float, 'b': lambda x: bool(int(x))}
+
+
 class StatsDictField(models.TextField):
 
     description = 'A dictionary of counts stored as serialized php.'
@@ -31,12 +82,15 @@ class StatsDictField(models.TextField):
                 d = None
         else:
             # phpserialize data
+            if isinstance(value, unicode):
+                value = value.encode('utf8')
             try:
-                if isinstance(value, unicode):
-                    value = value.encode('utf8')
-                d = php.unserialize(value, decode_strings=True)
+                d = php_unserialize(value)
             except ValueError:
-                d = None
+                try:
+                    d = php.unserialize(value, decode_strings=True)
+                except ValueError:
+                    d = None
         if isinstance(d, dict):
             return d
         return None
@@ -45,7 +99,7 @@ class StatsDictField(models.TextField):
         if value is None or value == '':
             return value
         try:
-            value = json.dumps(dict(value))
+            value = json.dumps(dict(value), separators=(',', ':'))
         except TypeError:
             value = None
         return value
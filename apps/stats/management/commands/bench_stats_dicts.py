@@ -0,0 +1,95 @@
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+import phpserialize as php
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from stats.db import StatsDictField, php_unserialize
+
+HELP = """\
+Compare how fast the update_counts breakdowns decode as PHP serialized data
+(with phpserialize and with our decoder) and as JSON.
+
+Uses the latest `--rows` rows of update_counts, or made up rows shaped like
+them if the table is empty.
+"""
+
+COLUMNS = ('version', 'status', 'application', 'os', 'locale')
+
+
+def fake_rows(n):
+    """Rows shaped like update_counts: a few dozen keys per breakdown."""
+    rand = random.Random(1)
+    count = lambda: rand.randint(1, 100000)
+
+    def row():
+        versions = dict(('%s.%s' % (rand.randint(0, 5), rand.randint(0, 20)),
+                         count()) for _ in xrange(rand.randint(5, 40)))
+        apps = {'{ec8030f7-c20a-464f-9b0e-13a3a9e97384}':
+                dict(('%s.0' % v, count()) for v in xrange(3, 15))}
+        locales = dict((l, count()) for l in
+                       rand.sample(['en-US', 'de', 'fr', 'ja', 'pt-BR', 'ru',
+                                    'es-ES', 'pl', 'it', 'zh-CN', 'nl', 'sv',
+                                    'tr', 'cs', 'hu', 'fi', 'ko', 'el'], 12))
+        return (versions, {'userEnabled': count(), 'userDisabled': count()},
+                apps, dict((o, count()) for o in ('WINNT', 'Darwin', 'Linux')),
+                locales)
+    return [[php.serialize(d) for d in row()] for _ in xrange(n)]
+
+
+def latest_rows(n):
+    cursor = connection.cursor()
+    cursor.execute('SELECT %s FROM update_counts ORDER BY id DESC LIMIT %%s'
+                   % ', '.join(COLUMNS), [n])
+    # Only keep the PHP serialized values.
+    return [[v for v in row if v and v[0] not in '[{']
+            for row in cursor.fetchall()]
+
+
+def bench(rows):
+    """Returns {decoder: rows per second} for the PHP serialized `rows`."""
+    field = StatsDictField()
+    as_json = [[field.get_db_prep_value(php_unserialize(v), connection)
+                for v in row] for row in rows]
+    decoders = [
+        ('phpserialize', rows,
+         lambda v: php.unserialize(v, decode_strings=True)),
+        ('php_unserialize', rows, php_unserialize),
+        ('json', as_json, json.loads),
+        ('StatsDictField(php)', rows, field.to_python),
+        ('StatsDictField(json)', as_json, field.to_python),
+    ]
+    rv = []
+    for name, data, decode in decoders:
+        start = time.time()
+        for row in data:
+            for value in row:
+                decode(value)
+        rv.append((name, len(data) / (time.time() - start)))
+    return rv
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--rows', type='int', default=10000,
+                    help='The number of rows to decode.'),
+    )
+    help = HELP
+
+    def handle(self, *args, **kw):
+        rows = latest_rows(kw['rows'])
+        if not any(rows):
+            print 'No PHP serialized rows in update_counts, making some up.'
+            rows = fake_rows(kw['rows'])
+        rows = [row for row in rows if row]
+        print 'Decoding %s rows, %s values.' % (len(rows),
+                                               sum(map(len, rows)))
+        for name, rate in bench(rows):
+            print '%-22s %10.0f rows/s' % (name, rate)
@@ -0,0 +1,173 @@
+import logging
+import multiprocessing
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+import elasticutils
+import MySQLdb.cursors
+import redisutils
+
+from stats import search
+from stats.models import DownloadCount, UpdateCount
+
+log = logging.getLogger('z.stats')
+
+# Ids per range. A range is read with one query and checkpointed once it's
+# all in ES, so this is also how much work an interruption can lose.
+STEP = 20000
+# Rows sent to a worker to decode at a time.
+CHUNK = 500
+# Docs per ES bulk request.
+BATCH = 500
+
+MODELS = {
+    'update_counts': (UpdateCount, search.extract_update_count),
+    'download_counts': (DownloadCount, search.extract_download_count),
+}
+
+HELP = """\
+Reindex the update and download counts in bulk.
+
+The tables are read in ranges of ids. The StatsDictField blobs are decoded in
+a pool of processes and the docs are sent to ES in bulk batches. Finished
+ranges are remembered in redis, so running the command again after an
+interruption carries on where it stopped. Use `--restart` to start over.
+
+To limit the tables:
+
+    `--tables=update_counts`
+"""
+
+
+class Checkpoints(object):
+    """The id ranges of a table that are already in ES, kept in redis."""
+
+    def __init__(self, table):
+        self.redis = redisutils.connections['master']
+        self.key = 'amo:stats:bulk_index:%s' % table
+
+    def done(self):
+        return set(self.redis.smembers(self.key) or [])
+
+    def add(self, start, end):
+        self.redis.sadd(self.key, '%s:%s' % (start, end))
+
+    def clear(self):
+        self.redis.delete(self.key)
+
+
+def id_ranges(table, step):
+    cursor = connections['default'].cursor()
+    cursor.execute('SELECT MIN(id), MAX(id) FROM %s' % table)
+    low, high = cursor.fetchone()
+    if low is None:
+        return []
+    return [(start, min(start + step - 1, high))
+            for start in xrange(low, high + 1, step)]
+
+
+def read_range(model, start, end, chunk_size):
+    """
+    Yields the raw rows of `model` with ids from `start` to `end` in chunks.
+    A server side cursor streams them instead of buffering the whole result.
+    """
+    columns = ', '.join(f.column for f in model._meta.fields)
+    conn = connections['default']
+    conn.cursor()  # Make sure the connection is open.
+    cursor = conn.connection.cursor(MySQLdb.cursors.SSCursor)
+    try:
+        cursor.execute('SELECT %s FROM %s WHERE id BETWEEN %%s AND %%s'
+                       % (columns, model._meta.db_table), [start, end])
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def extract_docs(args):
+    """Decodes raw rows of `table` into (ES id, doc) pairs."""
+    table, rows = args
+    model, extract = MODELS[table]
+    attnames = [f.attname for f in model._meta.fields]
+    docs = []
+    for row in rows:
+        # The StatsDictFields are decoded when they're set on the model.
+        obj = model(**dict(zip(attnames, row)))
+        docs.append(('%s-%s' % (obj.addon_id, obj.date), extract(obj)))
+    return docs
+
+
+def send(model, docs, batch_size):
+    es = elasticutils.get_es()
+    for idx, (id, doc) in enumerate(docs, 1):
+        model.index(doc, bulk=True, id=id)
+        if idx % batch_size == 0:
+            es.flush_bulk(forced=True)
+    es.flush_bulk(forced=True)
+
+
+def index_table(table, pool, step=STEP, chunk_size=CHUNK, batch_size=BATCH,
+                restart=False):
+    model = MODELS[table][0]
+    checkpoints = Checkpoints(table)
+    if restart:
+        checkpoints.clear()
+    done = checkpoints.done()
+    ranges = [r for r in id_ranges(table, step) if '%s:%s' % r not in done]
+    log.info('%s: %s ranges of %s ids to index, %s already done.' %
+             (table, len(ranges), step, len(done)))
+
+    def decode(start, end):
+        chunks = ((table, rows)
+                  for rows in read_range(model, start, end, chunk_size))
+        return pool.map_async(extract_docs, list(chunks))
+
+    # Decode the next range while the current one goes to ES.
+    pending = decode(*ranges[0]) if ranges else None
+    for idx, (start, end) in enumerate(ranges):
+        started = time.time()
+        results = pending.get()
+        if idx + 1 < len(ranges):
+            pending = decode(*ranges[idx + 1])
+        docs = [doc for result in results for doc in result]
+        send(model, docs, batch_size)
+        checkpoints.add(start, end)
+        log.info('%s: indexed ids %s-%s (%s docs) in %.2fs.' %
+                 (table, start, end, len(docs), time.time() - started))
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--tables', default=','.join(sorted(MODELS)),
+                    help='The tables to index, separated by commas.'),
+        make_option('--step', type='int', default=STEP,
+                    help='The number of ids in each checkpointed range.'),
+        make_option('--batch', type='int', default=BATCH,
+                    help='The number of docs in each ES bulk request.'),
+        make_option('--processes', type='int',
+                    default=multiprocessing.cpu_count(),
+                    help='The number of processes decoding rows.'),
+        make_option('--restart', action='store_true',
+                    help='Forget the checkpoints and index everything.'),
+    )
+    help = HELP
+
+    def handle(self, *args, **kw):
+        tables = [t.strip() for t in kw['tables'].split(',')]
+        for table in tables:
+            if table not in MODELS:
+                raise CommandError('Unknown table: %s' % table)
+
+        pool = multiprocessing.Pool(kw['processes'])
+        try:
+            for table in tables:
+                index_table(table, pool, step=kw['step'],
+                            batch_size=kw['batch'], restart=kw['restart'])
+        finally:
+            pool.terminate()
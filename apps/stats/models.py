@@ -75,6 +75,24 @@ class UpdateCount(SearchMixin, models.Model):
         db_table = 'update_counts'
 
 
+class StatsRollup(models.Model):
+    """
+    The sum of an add-on's daily DownloadCount or UpdateCount rows over a
+    week or a month, see stats.rollups.
+    """
+    addon = models.ForeignKey('addons.Addon')
+    kind = models.CharField(max_length=16)  # 'downloads' or 'updates'.
+    period = models.CharField(max_length=5)  # 'week' or 'month'.
+    date = models.DateField()  # The first day of the period.
+    days = models.PositiveSmallIntegerField()  # Daily rows in the sum.
+    count = models.PositiveIntegerField()
+    data = StatsDictField(null=True)  # {breakdown: {key: count}}
+
+    class Meta:
+        db_table = 'stats_rollups'
+        unique_together = ('addon', 'kind', 'period', 'date')
+
+
 class AddonShareCount(models.Model):
     addon = models.ForeignKey('addons.Addon')
     count = models.PositiveIntegerField()
@@ -0,0 +1,149 @@
+"""
+Weekly and monthly rollups of the daily DownloadCount and UpdateCount rows.
+
+Weeks start on Sunday and months on the 1st, the same as the grouping in the
+stats dashboard. A rollup is recalculated from all the daily rows of its
+period, so recalculating one is always safe.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+
+import commonware.log
+
+from . import search
+from .models import DownloadCount, StatsRollup, UpdateCount
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+log = commonware.log.getLogger('z.stats')
+
+PERIODS = ('week', 'month')
+
+# kind: (model, how a daily row is cleaned up, the breakdowns to keep)
+KINDS = {
+    'downloads': (DownloadCount, search.extract_download_count,
+                  ('sources',)),
+    'updates': (UpdateCount, search.extract_update_count,
+                ('versions', 'os', 'locales', 'apps', 'status')),
+}
+# Update counts are daily users, they're averaged over the period instead of
+# summed.
+AVERAGED = ('updates',)
+
+
+def get_kind(model):
+    for kind, (kind_model, _, _) in KINDS.items():
+        if kind_model is model:
+            return kind
+
+
+def period_start(date, period):
+    if period == 'week':
+        return date - timedelta(days=(date.weekday() + 1) % 7)
+    return date.replace(day=1)
+
+
+def period_end(date, period):
+    """The last day of the period `date` is in."""
+    start = period_start(date, period)
+    if period == 'week':
+        return start + timedelta(days=6)
+    return (start + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+
+
+def periods(start, end, period):
+    """Yields (first day, last day) of every period overlapping start..end."""
+    first = period_start(start, period)
+    while first <= end:
+        last = period_end(first, period)
+        yield first, last
+        first = last + timedelta(days=1)
+
+
+def add(total, counts):
+    """Adds the (nested) dict of `counts` into `total`."""
+    for key, value in counts.items():
+        if hasattr(value, 'items'):
+            add(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def divide(counts, n):
+    return dict((key, divide(value, n) if hasattr(value, 'items')
+                      else int(round(value / float(n))))
+                for key, value in counts.items())
+
+
+def rollup(kind, addons, start, end):
+    """
+    Recalculates the weekly and monthly rollups of `kind` for `addons` in
+    every period that overlaps start..end.
+    """
+    model, extract_doc, fields = KINDS[kind]
+    for period in PERIODS:
+        for first, last in periods(start, end, period):
+            totals = {}
+            qs = model.objects.filter(addon__in=addons,
+                                      date__range=(first, last))
+            for row in qs:
+                total = totals.setdefault(row.addon_id,
+                                          {'days': 0, 'count': 0, 'data': {}})
+                doc = extract_doc(row)
+                total['days'] += 1
+                total['count'] += row.count
+                add(total['data'],
+                    dict((f, search.extract(doc[f] or {})) for f in fields))
+            if totals:
+                _save(kind, period, first, totals)
+
+
+def _save(kind, period, date, totals):
+    vals = [(addon, kind, period, date, t['days'], t['count'],
+             json.dumps(t['data'])) for addon, t in totals.items()]
+    cursor = connection.cursor()
+    cursor.executemany("""
+        INSERT INTO stats_rollups
+            (addon_id, kind, period, date, days, count, data)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            days=VALUES(days), count=VALUES(count), data=VALUES(data)""",
+                       vals)
+    transaction.commit_unless_managed()
+    log.info('Rolled up %s %s of %s for %s add-ons.' %
+             (period, date, kind, len(vals)))
+
+
+def get_series(model, group, extra_field=None, **filters):
+    """
+    Like stats.views.get_series, for the `group` rollups of `model`.
+
+    `filters` are the addon and date__range given to get_series. There's no
+    limit on the number of periods. Usage is averaged over the calendar days
+    of each period within the range.
+    """
+    kind = get_kind(model)
+    start, end = filters['date__range']
+    qs = (StatsRollup.objects.filter(kind=kind, period=group,
+                                     addon=filters['addon'],
+                                     date__range=(period_start(start, group),
+                                                  end))
+          .order_by('-date'))
+    # get_series is given the ES field, e.g. _source.versions.
+    field = extra_field.split('.')[-1] if extra_field else None
+    for row in qs:
+        count, data = row.count, (row.data or {}).get(field, {})
+        last = period_end(row.date, group)
+        if kind in AVERAGED:
+            # Like the dashboard's mean, days without a row count as 0.
+            days = (min(last, end) - max(row.date, start)).days + 1
+            count = int(round(count / float(days)))
+            data = divide(data, days)
+        rv = dict(count=count, date=row.date, end=last)
+        if field:
+            rv['data'] = data
+        yield rv
@@ -15,6 +15,19 @@ def es_dict(items):
         items = items.items()
     return [{'k': key, 'v': value} for key, value in items]
 
+
+def extract(dicts):
+    """Turn a list of dicts like we store in ES into one big dict.
+
+    Also works if the list of dicts is nested inside another dict.
+
+    >>> extract([{'k': 'a', 'v': 1}, {'k': 'b', 'v': 2}])
+    {'a': 1, 'b': 2}
+    """
+    if hasattr(dicts, 'items'):
+        return dict((k, extract(v)) for k, v in dicts.items())
+    return dict((d['k'], d['v']) for d in dicts)
+
 # We index all the key/value pairs as lists of {'k': key, 'v': value} dicts
 # so that ES doesn't include every single key in the update_counts mapping.
 """
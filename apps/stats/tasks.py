@@ -11,17 +11,20 @@ import amo
 from addons.models import Addon
 from bandwagon.models import Collection, CollectionAddon
 from mkt.webapps.models import Installed
-from stats.models import Contribution
-from reviews.models import Review
-from users.models import UserProfile
+from stats.models import Contribution, GlobalStat
 from versions.models import Version
 from .models import (AddonCollectionCount, CollectionCount, CollectionStats,
                      DownloadCount, UpdateCount)
 
-from . import search
+from . import rollups, search
+from .db import StatsDictField
 
 log = commonware.log.getLogger('z.task')
 
+# The tables with lots of PHP serialized StatsDictFields.
+STATS_DICT_MODELS = {'update_counts': UpdateCount,
+                     'download_counts': DownloadCount}
+
 
 @task
 def addon_total_contributions(*addons, **kw):
@@ -58,29 +61,104 @@ def update_collections_total(data, **kw):
 
 @task
 def update_global_totals(job, date, **kw):
-    log.info("Updating global statistics totals (%s) for (%s)" %
-                   (job, date))
+    update_global_stats([job], date)
+
+
+@task
+def update_global_stats(jobs, date, **kw):
+    """
+    Update the global statistics totals of `jobs` for `date`.
 
-    jobs = _get_daily_jobs(date)
-    jobs.update(_get_metrics_jobs(date))
+    The jobs are looked up together so the ones reading the same table share
+    one scan of it.
+    """
+    log.info("Updating global statistics totals (%s) for (%s)" %
+             (', '.join(jobs), date))
 
-    num = jobs[job]()
+    all_jobs = _get_daily_jobs(date)
+    all_jobs.update(_get_metrics_jobs(date))
 
     q = """REPLACE INTO
                 global_stats(`name`, `count`, `date`)
             VALUES
                 (%s, %s, %s)"""
-    p = [job, num or 0, date]
+    for job in jobs:
+        # Each total still fails on its own, as when they had a task each.
+        try:
+            num = all_jobs[job]()
+        except Exception, e:
+            log.critical("Failed to compute global stats: (%s) for (%s): %s"
+                         % (job, date, e))
+            continue
+        p = [job, num or 0, date]
+
+        try:
+            cursor = connection.cursor()
+            cursor.execute(q, p)
+            transaction.commit_unless_managed()
+        except Exception, e:
+            log.critical("Failed to update global stats: (%s): %s" % (p, e))
+
+        log.debug("Committed global stats details: (%s) has (%s) for (%s)"
+                  % tuple(p))
+
+
+def _grouped(sql, params):
+    """
+    Returns a function making a job for each column of the one row `sql`
+    returns. The query runs once, for the first of those jobs.
+    """
+    row = {}
 
-    try:
+    def get(column):
+        if not row:
+            cursor = connection.cursor()
+            cursor.execute(sql, params)
+            names = [c[0] for c in cursor.description]
+            row.update(zip(names, cursor.fetchone()))
+        return row[column]
+
+    return lambda column: lambda: get(column)
+
+
+# Rows for the last few days can still come in, so running totals only build
+# on a total that is at least this many days old.
+SETTLE_DAYS = 3
+
+
+def _running_total(name, date, between, total):
+    """
+    A job for a total over a history table.
+
+    `between(start, end)` sums the rows after `start` up to `end` and
+    `total(end)` sums the whole history up to `end`. A settled total,
+    `<name>_settled`, is kept SETTLE_DAYS behind `date` and moves forward a
+    day per run. The days after it are summed again every time so rows that
+    land late are still counted. The whole history only goes through `total`
+    when there isn't a settled total for the day before.
+    """
+    def job():
+        day = date
+        if isinstance(day, basestring):
+            day = datetime.datetime.strptime(day, '%Y-%m-%d').date()
+        settled_name = '%s_settled' % name
+        settled_day = day - datetime.timedelta(days=SETTLE_DAYS)
+        one_day = datetime.timedelta(days=1)
+        before = list(GlobalStat.objects.no_cache()
+                      .filter(name=settled_name, date=settled_day - one_day)
+                      .values_list('count', flat=True))
+        if before:
+            settled = before[0] + (between(settled_day - one_day,
+                                           settled_day) or 0)
+        else:
+            settled = total(settled_day) or 0
         cursor = connection.cursor()
-        cursor.execute(q, p)
+        cursor.execute("""
+            REPLACE INTO global_stats (`name`, `count`, `date`)
+            VALUES (%s, %s, %s)""", [settled_name, settled, settled_day])
         transaction.commit_unless_managed()
-    except Exception, e:
-        log.critical("Failed to update global stats: (%s): %s" % (p, e))
-
-    log.debug("Committed global stats details: (%s) has (%s) for (%s)"
-              % tuple(p))
+        return settled + (between(settled_day, day) or 0)
+    return job
 
 
 def _get_daily_jobs(date=None):
@@ -95,43 +173,80 @@ def _get_daily_jobs(date=None):
 
     extra = dict(where=['DATE(created)=%s'], params=[date])
 
+    # One scan of each of these tables for all their counts.
+    users = _grouped("""
+        SELECT SUM(created <= %s) AS total, SUM(DATE(created)=%s) AS new
+        FROM users""", [date, date])
+    # Non-editor reviews.
+    reviews = _grouped("""
+        SELECT SUM(created <= %s) AS total, SUM(DATE(created)=%s) AS new
+        FROM reviews WHERE editorreview=0""", [date, date])
+    collections = _grouped("""
+        SELECT SUM(created <= %s) AS total,
+               SUM(DATE(created)=%s) AS new,
+               SUM(created <= %s AND type=%s) AS autopublishers,
+               SUM(created <= %s AND listed=0) AS private,
+               SUM(created <= %s AND listed=1) AS public,
+               SUM(created <= %s AND type=%s) AS editorspicks,
+               SUM(created <= %s AND type=%s) AS normal
+        FROM collections""",
+        [date, date, date, amo.COLLECTION_SYNCHRONIZED, date, date,
+         date, amo.COLLECTION_FEATURED, date, amo.COLLECTION_NORMAL])
+    addons = _grouped("""
+        SELECT SUM(DATE(created)=%s) AS new,
+               SUM(created <= %s AND status=%s AND disabled_by_user=0)
+                   AS experimental,
+               SUM(created <= %s AND status=%s AND disabled_by_user=0)
+                   AS nominated,
+               SUM(created <= %s AND status=%s AND disabled_by_user=0)
+                   AS public
+        FROM addons WHERE status != %s""",
+        [date, date, amo.STATUS_UNREVIEWED, date, amo.STATUS_NOMINATED,
+         date, amo.STATUS_PUBLIC, amo.STATUS_DELETED])
+
+    downloads_new = lambda: DownloadCount.objects.filter(
+            date=date).aggregate(sum=Sum('count'))['sum']
+
     # If you're editing these, note that you are returning a function!  This
     # cheesy hackery was done so that we could pass the queries to celery
     # lazily and not hammer the db with a ton of these all at once.
     stats = {
         # Add-on Downloads
-        'addon_total_downloads': lambda: DownloadCount.objects.filter(
-                date__lte=date).aggregate(sum=Sum('count'))['sum'],
-        'addon_downloads_new': lambda: DownloadCount.objects.filter(
-                date=date).aggregate(sum=Sum('count'))['sum'],
+        'addon_total_downloads': _running_total(
+            'addon_total_downloads', date,
+            lambda start, end: DownloadCount.objects.filter(
+                date__gt=start, date__lte=end).aggregate(
+                    sum=Sum('count'))['sum'],
+            lambda end: DownloadCount.objects.filter(
+                date__lte=end).aggregate(sum=Sum('count'))['sum']),
+        'addon_downloads_new': downloads_new,
 
         # Add-on counts
-        'addon_count_new': Addon.objects.extra(**extra).count,
+        'addon_count_new': addons('new'),
 
         # Version counts
         'version_count_new': Version.objects.extra(**extra).count,
 
         # User counts
-        'user_count_total': UserProfile.objects.filter(
-                created__lte=date).count,
-        'user_count_new': UserProfile.objects.extra(**extra).count,
+        'user_count_total': users('total'),
+        'user_count_new': users('new'),
 
         # Review counts
-        'review_count_total': Review.objects.filter(created__lte=date,
-                                                    editorreview=0).count,
-        'review_count_new': Review.objects.filter(editorreview=0).extra(
-                **extra).count,
+        'review_count_total': reviews('total'),
+        'review_count_new': reviews('new'),
 
         # Collection counts
-        'collection_count_total': Collection.objects.filter(
-                created__lte=date).count,
-        'collection_count_new': Collection.objects.extra(**extra).count,
-        'collection_count_autopublishers': Collection.objects.filter(
-                created__lte=date, type=amo.COLLECTION_SYNCHRONIZED).count,
-
-        'collection_addon_downloads': (lambda:
-            AddonCollectionCount.objects.filter(date__lte=date).aggregate(
-                sum=Sum('count'))['sum']),
+        'collection_count_total': collections('total'),
+        'collection_count_new': collections('new'),
+        'collection_count_autopublishers': collections('autopublishers'),
+
+        'collection_addon_downloads': _running_total(
+            'collection_addon_downloads', date,
+            lambda start, end: AddonCollectionCount.objects.filter(
+                date__gt=start, date__lte=end).aggregate(
+                    sum=Sum('count'))['sum'],
+            lambda end: AddonCollectionCount.objects.filter(
+                date__lte=end).aggregate(sum=Sum('count'))['sum']),
     }
 
     # If we're processing today's stats, we'll do some extras.  We don't do
@@ -139,26 +254,16 @@ def _get_daily_jobs(date=None):
     # move from sandbox -> public
     if date == datetime.date.today():
         stats.update({
-        'addon_count_experimental': Addon.objects.filter(
-                created__lte=date, status=amo.STATUS_UNREVIEWED,
-                disabled_by_user=0).count,
-        'addon_count_nominated': Addon.objects.filter(
-                created__lte=date, status=amo.STATUS_NOMINATED,
-                disabled_by_user=0).count,
-        'addon_count_public': Addon.objects.filter(
-                created__lte=date, status=amo.STATUS_PUBLIC,
-                disabled_by_user=0).count,
+        'addon_count_experimental': addons('experimental'),
+        'addon_count_nominated': addons('nominated'),
+        'addon_count_public': addons('public'),
         'addon_count_pending': Version.objects.filter(
                 created__lte=date, files__status=amo.STATUS_PENDING).count,
 
-        'collection_count_private': Collection.objects.filter(
-                created__lte=date, listed=0).count,
-        'collection_count_public': Collection.objects.filter(
-                created__lte=date, listed=1).count,
-        'collection_count_editorspicks': Collection.objects.filter(
-                created__lte=date, type=amo.COLLECTION_FEATURED).count,
-        'collection_count_normal': Collection.objects.filter(
-                created__lte=date, type=amo.COLLECTION_NORMAL).count,
+        'collection_count_private': collections('private'),
+        'collection_count_public': collections('public'),
+        'collection_count_editorspicks': collections('editorspicks'),
+        'collection_count_normal': collections('normal'),
             })
 
     return stats
@@ -259,3 +364,43 @@ def index_installed_counts(ids, **kw):
     except Exception, exc:
         index_installed_counts.retry(args=[ids], exc=exc)
         raise
+
+
+@task
+def update_rollups(addons, start, end, **kw):
+    log.info('Rolling up stats for %s add-ons from %s to %s.' %
+             (len(addons), start, end))
+    for kind in rollups.KINDS:
+        rollups.rollup(kind, addons, start, end)
+
+
+@task
+def stats_dicts_to_json(table, start, end, **kw):
+    """
+    Rewrite the PHP serialized StatsDictFields of the rows of `table` with
+    ids from `start` to `end` as JSON, which is much faster to decode.
+    """
+    fields = [f for f in STATS_DICT_MODELS[table]._meta.fields
+              if isinstance(f, StatsDictField)]
+    cursor = connection.cursor()
+    cursor.execute('SELECT id, %s FROM %s WHERE id BETWEEN %%s AND %%s' %
+                   (', '.join(f.column for f in fields), table), [start, end])
+
+    def to_json(field, value):
+        if not value or value[0] in '[{':
+            return value
+        d = field.to_python(value)
+        # Leave anything we can't decode alone.
+        return value if d is None else field.get_db_prep_value(d, connection)
+
+    updates = []
+    for row in cursor.fetchall():
+        values = [to_json(f, v) for f, v in zip(fields, row[1:])]
+        if values != list(row[1:]):
+            updates.append(values + [row[0]])
+    if updates:
+        cursor.executemany('UPDATE %s SET %s WHERE id=%%s' % (
+            table, ', '.join('%s=%%s' % f.column for f in fields)), updates)
+        transaction.commit_unless_managed()
+    log.info('Converted %s %s rows to JSON (%s-%s).' %
+             (len(updates), table, start, end))
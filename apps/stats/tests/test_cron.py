@@ -1,6 +1,8 @@
 import datetime
+import json
 
 from django.core.management import call_command
+from django.db import connection
 
 import mock
 from nose.tools import eq_
@@ -9,8 +11,9 @@ import amo.tests
 from addons.models import Addon
 from mkt.webapps.models import Installed
 from stats.models import (Contribution, DownloadCount, GlobalStat,
-                          UpdateCount)
-from stats import cron, search, tasks
+                          StatsRollup, UpdateCount)
+from stats import cron, rollups, search, tasks
+from stats.management.commands import bulk_index_stats
 from users.models import UserProfile
 
 
@@ -28,6 +31,69 @@ class TestGlobalStats(amo.tests.TestCase):
         eq_(len(GlobalStat.objects.no_cache().filter(date=date,
                                                  name=job)), 1)
 
+    def total(self, job, date):
+        return GlobalStat.objects.no_cache().get(name=job, date=date).count
+
+    def test_running_total(self):
+        job = 'addon_total_downloads'
+        GlobalStat.objects.create(name=job + '_settled', date='2009-06-03',
+                                  count=100)
+        tasks.update_global_stats([job], '2009-06-07')
+        eq_(self.total(job, '2009-06-07'), 110)
+        eq_(self.total(job + '_settled', '2009-06-04'), 100)
+
+    def test_running_total_from_scratch(self):
+        job = 'addon_total_downloads'
+        tasks.update_global_stats([job], '2009-06-07')
+        eq_(self.total(job, '2009-06-07'), 20)
+        eq_(self.total(job + '_settled', '2009-06-04'), 10)
+
+    def test_running_total_late_rows(self):
+        job = 'addon_total_downloads'
+        tasks.update_global_stats([job], '2009-06-07')
+        # A row for a day that was already totalled comes in late.
+        DownloadCount.objects.create(addon_id=4, date='2009-06-06', count=5)
+        tasks.update_global_stats([job], '2009-06-08')
+        eq_(self.total(job, '2009-06-08'), 25)
+
+    def test_shared_scan(self):
+        jobs = tasks._get_daily_jobs(datetime.date(2009, 6, 1))
+        with self.assertNumQueries(1):
+            eq_(jobs['user_count_total'](), UserProfile.objects.filter(
+                created__lte=datetime.date(2009, 6, 1)).count())
+            jobs['user_count_new']()
+
+    def test_grouped_counts(self):
+        today = datetime.date.today()
+        Addon.objects.update(created=datetime.datetime.now())
+        jobs = tasks._get_daily_jobs(today)
+        eq_(jobs['addon_count_new'](), Addon.objects.count())
+        eq_(jobs['addon_count_public'](), 0)
+
+    def test_update_global_stats(self):
+        tasks.update_global_stats(['addon_downloads_new',
+                                   'addon_total_downloads'], '2009-06-01')
+        eq_(self.total('addon_downloads_new', '2009-06-01'), 10)
+        eq_(self.total('addon_total_downloads', '2009-06-01'), 10)
+
+    @mock.patch('stats.tasks._get_metrics_jobs')
+    def test_failing_job(self, metrics_jobs):
+        def fail():
+            raise Addon.DoesNotExist
+        metrics_jobs.return_value = {'broken': fail}
+        tasks.update_global_stats(['broken', 'addon_downloads_new'],
+                                  '2009-06-01')
+        eq_(GlobalStat.objects.no_cache().filter(name='broken').count(), 0)
+        eq_(self.total('addon_downloads_new', '2009-06-01'), 10)
+
+    @mock.patch('stats.tasks.update_global_stats')
+    def test_cron(self, update_global_stats):
+        cron.update_global_totals(datetime.date(2009, 6, 1))
+        calls = update_global_stats.subtask.call_args_list
+        eq_(len(calls), 2)
+        assert 'addon_total_downloads' in calls[0][1]['kwargs']['jobs']
+        assert 'addon_total_updatepings' in calls[1][1]['kwargs']['jobs']
+
 
 class TestTotalContributions(amo.tests.TestCase):
     fixtures = ['base/addon_3615']
@@ -122,6 +188,150 @@ class TestIndexStats(amo.tests.TestCase):
             1 + (downloads[0] - downloads[-1]).days / 5)
 
 
+class TestRollups(amo.tests.TestCase):
+    fixtures = ['stats/test_models']
+
+    def setUp(self):
+        self.start = datetime.date(2009, 6, 1)
+        self.end = datetime.date(2009, 6, 2)
+
+    def rollup(self, kind, period, date):
+        return StatsRollup.objects.get(addon=4, kind=kind, period=period,
+                                       date=date)
+
+    def test_periods(self):
+        eq_(rollups.period_start(self.start, 'week'),
+            datetime.date(2009, 5, 31))
+        eq_(rollups.period_end(self.start, 'week'), datetime.date(2009, 6, 6))
+        eq_(rollups.period_start(self.end, 'month'), self.start)
+        eq_(rollups.period_end(self.end, 'month'), datetime.date(2009, 6, 30))
+        eq_(list(rollups.periods(datetime.date(2009, 5, 31), self.end,
+                                 'month')),
+            [(datetime.date(2009, 5, 1), datetime.date(2009, 5, 31)),
+             (self.start, datetime.date(2009, 6, 30))])
+
+    def test_updates(self):
+        tasks.update_rollups([4], self.start, self.end)
+        week = self.rollup('updates', 'week', datetime.date(2009, 5, 31))
+        eq_((week.days, week.count), (2, 2500))
+        eq_(week.data['versions'], {'1.0': 750, '2.0': 1750})
+        eq_(week.data['os'], {'Linux': 700, 'Windows': 900})
+        month = self.rollup('updates', 'month', self.start)
+        eq_((month.days, month.count), (2, 2500))
+
+    def test_downloads(self):
+        tasks.update_rollups([4], self.start, self.end)
+        eq_(self.rollup('downloads', 'week', datetime.date(2009, 5, 31)).count,
+            10)
+        # The whole month is recalculated.
+        month = self.rollup('downloads', 'month', self.start)
+        eq_((month.days, month.count), (5, 50))
+        eq_(month.data['sources'], {'search': 15, 'api': 10})
+
+    def test_recalculate(self):
+        tasks.update_rollups([4], self.start, self.end)
+        tasks.update_rollups([4], self.start, self.end)
+        eq_(StatsRollup.objects.filter(kind='updates', period='week').count(),
+            1)
+        eq_(self.rollup('updates', 'week', datetime.date(2009, 5, 31)).count,
+            2500)
+
+    @mock.patch('stats.tasks.update_rollups')
+    def test_cron(self, update_rollups):
+        cron.rollup_stats('2009-06-01', '2009-06-30')
+        eq_(update_rollups.subtask.call_args[1]['args'],
+            [[4], self.start, datetime.date(2009, 6, 30)])
+
+
+class TestStatsDictsToJSON(amo.tests.TestCase):
+    fixtures = ['stats/test_models']
+
+    def raw(self, pk):
+        cursor = connection.cursor()
+        cursor.execute('SELECT version, os FROM update_counts WHERE id=%s',
+                       [pk])
+        return cursor.fetchone()
+
+    def test_convert(self):
+        before = UpdateCount.objects.get(pk=1)
+        tasks.stats_dicts_to_json('update_counts', 1, 2)
+        version, os = self.raw(1)
+        eq_(json.loads(version), {'1.0': 200, '2.0': 800})
+        eq_(json.loads(os), {'Linux': 300, 'WINNT': 400})
+        after = UpdateCount.objects.get(pk=1)
+        eq_((after.versions, after.oses, after.locales),
+            (before.versions, before.oses, before.locales))
+        # Outside the range.
+        assert not self.raw(3)[0].startswith('{')
+
+    def test_leave_bad_data(self):
+        connection.cursor().execute(
+            "UPDATE update_counts SET version='a:1:{junk' WHERE id=1")
+        tasks.stats_dicts_to_json('update_counts', 1, 1)
+        eq_(self.raw(1)[0], 'a:1:{junk')
+
+    @mock.patch('stats.tasks.stats_dicts_to_json')
+    def test_cron(self, stats_dicts_to_json):
+        cron.stats_dicts_to_json()
+        args = [c[1]['args'] for c in
+                stats_dicts_to_json.subtask.call_args_list]
+        assert ['update_counts', 1, 3] in args, args
+
+
+class FakePool(object):
+
+    def map_async(self, func, iterable):
+        result = map(func, iterable)
+        return mock.Mock(get=lambda: result)
+
+
+@mock.patch('stats.management.commands.bulk_index_stats.send')
+class TestBulkIndexStats(amo.tests.TestCase):
+    fixtures = ['stats/test_models']
+
+    def index(self, **kw):
+        bulk_index_stats.index_table('update_counts', FakePool(), step=2,
+                                     chunk_size=2, **kw)
+
+    def indexed(self, send):
+        return sorted(id for call in send.call_args_list
+                         for id, doc in call[0][1])
+
+    def test_extract_docs(self, send):
+        row = UpdateCount.objects.get(pk=1)
+        rows = list(bulk_index_stats.read_range(UpdateCount, 1, 1, 10))[0]
+        eq_(bulk_index_stats.extract_docs(('update_counts', rows)),
+            [('4-2009-06-01', search.extract_update_count(row))])
+
+    def test_index_table(self, send):
+        self.index()
+        eq_(self.indexed(send), ['4-2007-01-01', '4-2009-06-01',
+                                 '4-2009-06-02'])
+        eq_(send.call_args[0][0], UpdateCount)
+
+    def test_resume(self, send):
+        self.index()
+        send.reset_mock()
+        self.index()
+        assert not send.called
+
+    def test_resume_after_failure(self, send):
+        send.side_effect = [None, Exception]
+        with self.assertRaises(Exception):
+            self.index()
+        send.side_effect = None
+        send.reset_mock()
+        self.index()
+        # Only the range that failed is indexed again.
+        eq_(len(send.call_args_list), 1)
+
+    def test_restart(self, send):
+        self.index()
+        send.reset_mock()
+        self.index(restart=True)
+        eq_(len(self.indexed(send)), 3)
+
+
 class TestIndexLatest(amo.tests.ESTestCase):
     es = True
 
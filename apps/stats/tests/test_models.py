@@ -14,7 +14,7 @@ import amo
 import amo.tests
 from addons.models import Addon
 from stats.models import Contribution
-from stats.db import StatsDictField
+from stats.db import StatsDictField, php_unserialize
 from users.models import UserProfile
 
 
@@ -34,6 +34,31 @@ class TestStatsDictField(amo.tests.TestCase):
         val = {'a': 1}
         eq_(StatsDictField().to_python(json.dumps(val)), val)
 
+    def test_to_python_php_nested(self):
+        val = {u'f\xfc': {'4.0': 10, 3: 1.5}, 'b': True, 'n': None}
+        eq_(StatsDictField().to_python(php.serialize(val)), val)
+
+    def test_to_python_php_unicode(self):
+        val = php.serialize({u'\u0440\u0443': 1}).decode('utf8')
+        eq_(StatsDictField().to_python(val), {u'\u0440\u0443': 1})
+
+    def test_to_python_bad_php(self):
+        eq_(StatsDictField().to_python('a:1:{s:1:"a";i:1;'), None)
+
+    def test_php_unserialize(self):
+        for val in [{}, {'a': 1}, {'a': {'b': {'c': 'd'}}}, {1: 2, 'x': -1.5}]:
+            data = php.serialize(val)
+            eq_(php_unserialize(data), php.unserialize(data,
+                                                       decode_strings=True))
+
+    def test_php_unserialize_unsupported(self):
+        # Objects are left to phpserialize.
+        with self.assertRaises(ValueError):
+            php_unserialize('O:8:"stdClass":0:{}')
+
+    def test_get_db_prep_value(self):
+        eq_(StatsDictField().get_db_prep_value({'a': 1}, None), '{"a":1}')
+
 
 class TestContributionModel(amo.tests.TestCase):
     fixtures = ['stats/test_models.json']
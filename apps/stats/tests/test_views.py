@@ -735,6 +735,67 @@ class TestResponses(ESStatsTest):
                           2009-06-01,1,5.0,5.0""")
 
 
+class TestRollupSeries(amo.tests.TestCase):
+    fixtures = ['stats/test_models']
+
+    def setUp(self):
+        self.range = (datetime.date(2009, 6, 1), datetime.date(2009, 6, 30))
+        tasks.update_rollups([4], *self.range)
+
+    def test_week_averages_updates(self):
+        series = list(views.get_series(UpdateCount, group='week',
+                                       extra_field='_source.versions',
+                                       addon=4, date__range=self.range))
+        # Two days of rows over the six days of the week in the range.
+        eq_(series, [{'date': datetime.date(2009, 5, 31),
+                      'end': datetime.date(2009, 6, 6), 'count': 417,
+                      'data': {'1.0': 125, '2.0': 292}}])
+
+    def test_month_sums_downloads(self):
+        series = list(views.get_series(DownloadCount, group='month', addon=4,
+                                       date__range=self.range))
+        eq_(series, [{'date': datetime.date(2009, 6, 1),
+                      'end': datetime.date(2009, 6, 30), 'count': 50}])
+
+    def test_weeks_newest_first(self):
+        series = views.get_series(DownloadCount, group='week', addon=4,
+                                  date__range=self.range)
+        eq_([s['date'].day for s in series], [28, 14, 7, 31])
+
+
+class TestStreaming(amo.tests.TestCase):
+
+    def setUp(self):
+        self.rows = [{'date': datetime.date(2012, 1, 1 + i), 'count': i,
+                      'data': {u'caf\xe9': Decimal(i)}} for i in range(7)]
+
+    def test_json(self):
+        for n in (0, 1, 3, 7):
+            eq_(json.loads(''.join(views.stream_json(self.rows[:n], 3))),
+                json.loads(json.dumps(self.rows[:n],
+                                      cls=views.DjangoJSONEncoder)))
+
+    def test_csv(self):
+        rows = [dict(r['data'], count=r['count'], date=r['date'])
+                for r in self.rows]
+        content = ''.join(views.stream_csv(rows, ['date', 'count', u'caf\xe9',
+                                                  'other'], 3))
+        lines = list(csv.reader(content.splitlines()))
+        eq_(lines[0], ['date', 'count', 'caf\xc3\xa9', 'other'])
+        eq_(lines[1:3], [['2012-01-01', '0', '0', '0'],
+                         ['2012-01-02', '1', '1', '0']])
+        eq_(len(lines), 8)
+
+    def test_csv_empty(self):
+        eq_(''.join(views.stream_csv([], ['date', 'count'])), 'date,count\r\n')
+
+    def test_peek(self):
+        empty, stats = views.peek(iter([]))
+        eq_((empty, list(stats)), (True, []))
+        empty, stats = views.peek(iter([1, 2]))
+        eq_((empty, list(stats)), (False, [1, 2]))
+
+
 # Test the SQL query by using known dates, for weeks and months etc.
 class TestSiteQuery(amo.tests.TestCase):
 
@@ -2,13 +2,11 @@ import csv
 import cStringIO
 import itertools
 import time
-from types import GeneratorType
 from datetime import date, timedelta
 
 from django import http
 from django.db import connection
 from django.db.models import Avg, Count, Sum, Q
-from django.utils import simplejson
 from django.utils.cache import add_never_cache_headers, patch_cache_control
 from django.utils.datastructures import SortedDict
 from django.core.serializers.json import DjangoJSONEncoder
@@ -28,10 +26,12 @@ from zadmin.models import SiteEvent
 import amo
 from amo.decorators import json_view, login_required
 from amo.urlresolvers import reverse
-from amo.utils import memoize
+from amo.utils import chunked, memoize
 
+from . import rollups
 from .decorators import allow_cross_site_request
 from .models import CollectionCount, Contribution, DownloadCount, UpdateCount
+from .search import extract
 
 SERIES_GROUPS = ('day', 'week', 'month')
 SERIES_GROUPS_DATE = ('date', 'week', 'month')  # Backwards compat.
@@ -42,6 +42,8 @@ COLLECTION_SERIES = ('downloads', 'subscribers', 'ratings')
 GLOBAL_SERIES = ('addons_in_use', 'addons_updated', 'addons_downloaded',
                  'collections_created', 'reviews_created', 'addons_created',
                  'users_created')
+# Rows per chunk of a streamed CSV or JSON response.
+STREAM_CHUNK_SIZE = 100
 
 
 def dashboard(request):
@@ -53,14 +55,20 @@ def dashboard(request):
                          'stats_base_url': stats_base_url})
 
 
-def get_series(model, extra_field=None, **filters):
+def get_series(model, extra_field=None, group='day', **filters):
     """
     Get a generator of dicts for the stats model given by the filters.
 
     Returns {'date': , 'count': } by default. Add an extra field (such as
     application faceting) by passing `extra_field=apps`. `apps` should be in
-    the query result.
+    the query result. Weeks and months are read from the rollups when the
+    model has them, one dict per `group`.
     """
+    if group in rollups.PERIODS and rollups.get_kind(model):
+        for row in rollups.get_series(model, group, extra_field, **filters):
+            yield row
+        return
+
     extra = () if extra_field is None else (extra_field,)
     # Put a slice on it so we get more than 10 (the default), but limit to 365.
     qs = (model.search().order_by('-date').filter(**filters)
@@ -90,19 +98,6 @@ def csv_fields(series):
     return rv, fields
 
 
-def extract(dicts):
-    """Turn a list of dicts like we store in ES into one big dict.
-
-    Also works if the list of dicts is nested inside another dict.
-
-    >>> extract([{'k': 'a', 'v': 1}, {'k': 'b', 'v': 2}])
-    {'a': 1, 'b': 2}
-    """
-    if hasattr(dicts, 'items'):
-        return dict((k, extract(v)) for k, v in dicts.items())
-    return dict((d['k'], d['v']) for d in dicts)
-
-
 @addon_view
 def overview_series(request, addon, group, start, end, format):
     """Combines downloads_series and updates_series into one payload."""
@@ -154,7 +149,8 @@ def downloads_series(request, addon, group, start, end, format):
     date_range = check_series_params_or_404(group, start, end, format)
     check_stats_permission(request, addon)
 
-    series = get_series(DownloadCount, addon=addon.id, date__range=date_range)
+    series = get_series(DownloadCount, group=group, addon=addon.id,
+                        date__range=date_range)
 
     if format == 'csv':
         return render_csv(request, addon, series, ['date', 'count'])
@@ -169,7 +165,7 @@ def sources_series(request, addon, group, start, end, format):
     check_stats_permission(request, addon)
 
     series = get_series(DownloadCount, extra_field='_source.sources',
-                        addon=addon.id, date__range=date_range)
+                        group=group, addon=addon.id, date__range=date_range)
 
     if format == 'csv':
         series, fields = csv_fields(series)
@@ -185,7 +181,8 @@ def usage_series(request, addon, group, start, end, format):
     date_range = check_series_params_or_404(group, start, end, format)
     check_stats_permission(request, addon)
 
-    series = get_series(UpdateCount, addon=addon.id, date__range=date_range)
+    series = get_series(UpdateCount, group=group, addon=addon.id,
+                        date__range=date_range)
 
     if format == 'csv':
         return render_csv(request, addon, series, ['date', 'count'])
@@ -207,7 +204,7 @@ def usage_breakdown_series(request, addon, group,
         'versions': '_source.versions',
         'statuses': '_source.status',
     }
-    series = get_series(UpdateCount, extra_field=fields[field],
+    series = get_series(UpdateCount, extra_field=fields[field], group=group,
                         addon=addon.id, date__range=date_range)
     if field == 'locales':
         series = process_locales(series)
@@ -615,14 +612,7 @@ def fudge_headers(response, stats):
 
 
 class UnicodeCSVDictWriter(csv.DictWriter):
-    """A DictWriter that writes a unicode stream."""
-
-    def __init__(self, stream, fields, **kw):
-        # We have the csv module write into our buffer as bytes and then we
-        # dump the buffer to the real stream as unicode.
-        self.buffer = cStringIO.StringIO()
-        csv.DictWriter.__init__(self, self.buffer, fields, **kw)
-        self.stream = stream
+    """A DictWriter that writes unicode rows to the stream as utf-8."""
 
     def writeheader(self):
         self.writerow(dict(zip(self.fieldnames, self.fieldnames)))
@@ -632,18 +622,55 @@ class UnicodeCSVDictWriter(csv.DictWriter):
 
     def writerow(self, rowdict):
         row = self._dict_to_list(rowdict)
-        # Write to the buffer as ascii.
         self.writer.writerow(map(self.try_encode, row))
-        # Dump the buffer to the real stream as utf-8.
-        self.stream.write(self.buffer.getvalue().decode('utf-8'))
-        # Clear the buffer.
-        self.buffer.truncate(0)
 
     def writerows(self, rowdicts):
         for rowdict in rowdicts:
             self.writerow(rowdict)
 
 
+def peek(stats):
+    """
+    Returns (empty, stats) without losing the first item of a generator, so
+    the cache headers can be set before the series is streamed.
+    """
+    stats = iter(stats)
+    try:
+        first = next(stats)
+    except StopIteration:
+        return True, iter([])
+    return False, itertools.chain([first], stats)
+
+
+def stream_csv(stats, fields, chunk_size=STREAM_CHUNK_SIZE):
+    """Yields the CSV for `stats` every `chunk_size` rows."""
+    buf = cStringIO.StringIO()
+    writer = UnicodeCSVDictWriter(buf, fields, restval=0,
+                                  extrasaction='ignore')
+    writer.writeheader()
+    for rows in chunked(stats, chunk_size):
+        writer.writerows(rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        # Only the header, there was nothing in the series.
+        yield buf.getvalue()
+
+
+def stream_json(stats, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yields the JSON list of `stats` every `chunk_size` rows, the same as
+    simplejson.dump would write it.
+    """
+    # Django's encoder supports date and datetime.
+    encode = DjangoJSONEncoder().encode
+    yield '['
+    for idx, rows in enumerate(chunked(stats, chunk_size)):
+        yield (', ' if idx else '') + ', '.join(map(encode, rows))
+    yield ']'
+
+
 @allow_cross_site_request
 def render_csv(request, addon, stats, fields,
                title=None, show_disclaimer=None):
@@ -652,28 +679,20 @@ def render_csv(request, addon, stats, fields,
     ts = time.strftime('%c %z')
     context = {'addon': addon, 'timestamp': ts, 'title': title,
                'show_disclaimer': show_disclaimer}
-    response = jingo.render(request, 'stats/csv_header.txt', context)
-
-    writer = UnicodeCSVDictWriter(response, fields, restval=0,
-                                  extrasaction='ignore')
-    writer.writeheader()
-    writer.writerows(stats)
+    header = jingo.render_to_string(request, 'stats/csv_header.txt', context)
 
-    fudge_headers(response, list)
-    response['Content-Type'] = 'text/csv; charset=utf-8'
+    empty, stats = peek(stats)
+    response = http.HttpResponse(
+        itertools.chain([header], stream_csv(stats, fields)),
+        content_type='text/csv; charset=utf-8')
+    fudge_headers(response, not empty)
     return response
 
 
 @allow_cross_site_request
 def render_json(request, addon, stats):
     """Render a stats series in JSON."""
-    response = http.HttpResponse(mimetype='text/json')
-
-    # XXX: Subclass DjangoJSONEncoder to handle generators.
-    if isinstance(stats, GeneratorType):
-        stats = list(stats)
-
-    # Django's encoder supports date and datetime.
-    fudge_headers(response, stats)
-    simplejson.dump(stats, response, cls=DjangoJSONEncoder)
+    empty, stats = peek(stats)
+    response = http.HttpResponse(stream_json(stats), mimetype='text/json')
+    fudge_headers(response, not empty)
     return response
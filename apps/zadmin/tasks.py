@@ -211,6 +211,7 @@ def get_context(addon, version, job, results, fileob=None):
 
 @task
 @write
+@amo.log_batch()
 def notify_success(version_pks, job_pk, data, **kw):
     log.info('[%s@%s] Updating max version for job %s.'
              % (len(version_pks), notify_success.rate_limit, job_pk))
@@ -291,6 +292,7 @@ def notify_success(version_pks, job_pk, data, **kw):
 
 @task
 @write
+@amo.log_batch()
 def notify_failed(file_pks, job_pk, data, **kw):
     log.info('[%s@None] Notifying failed for job %s.'
              % (len(file_pks), job_pk))
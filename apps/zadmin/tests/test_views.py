@@ -1769,6 +1769,17 @@ class TestElastic(amo.tests.ESTestCase):
         assert search.setup_mapping.called
         index in es.get_es().create_index_if_missing.call_args_list[0][0]
 
+    @mock.patch('zadmin.views.elasticutils')
+    @mock.patch('zadmin.views.addons.search')
+    def test_recreate_addons_index(self, search, es):
+        search.timestamped_index.return_value = 'amo_addons-1'
+        search.point_alias.return_value = ['amo_addons-0']
+        self.client.post(self.url, {'recreate': 1})
+        eq_(search.setup_mapping.call_args_list[0][0], ('amo_addons-1',))
+        search.point_alias.assert_called_with(settings.ES_INDEXES['addons'],
+                                              'amo_addons-1')
+        es.get_es().delete_index.assert_called_with('amo_addons-0')
+
     def test_reindex_addons(self):
         eq_(list(Addon.search()), [])
         self.client.post(self.url, {'reindex': 'addons'})
@@ -534,6 +534,7 @@ def monthly_pick(request):
 @admin.site.admin_view
 def elastic(request):
     INDEX = site_settings.ES_INDEXES['default']
+    ADDONS = site_settings.ES_INDEXES['addons']
     es = elasticutils.get_es()
     mappings = {'addons': addons.cron.reindex_addons,
                 'apps': addons.cron.reindex_apps,
@@ -544,11 +545,17 @@ def elastic(request):
     if request.method == 'POST':
         if request.POST.get('recreate'):
             es.delete_index_if_exists(INDEX)
+            # Add-ons are behind an alias, point it at a new empty index.
+            new = addons.search.timestamped_index(ADDONS)
+            addons.search.setup_mapping(new)
+            for old in addons.search.point_alias(ADDONS, new):
+                es.delete_index(old)
             # We must set up the mappings before we create the index again.
             addons.search.setup_mapping()
             stats.search.setup_indexes()
             es.create_index_if_missing(INDEX)
-            messages.info(request, 'Deleting %s index.' % INDEX)
+            messages.info(request, 'Deleting %s and %s indexes.' %
+                          (INDEX, ADDONS))
         if request.POST.get('reindex') in mappings:
             name = request.POST['reindex']
             # Reindex.
@@ -648,7 +655,8 @@ def addon_name_blocklist(request):
 
 @admin.site.admin_view
 def index(request):
-    log = ActivityLog.objects.admin_events()[:5]
+    log = (ActivityLog.objects.admin_events()
+           .transform(ActivityLog.transformer)[:5])
     return jingo.render(request, 'zadmin/index.html', {'log': log})
 
 
@@ -4,6 +4,11 @@ items.
 
 Check the function docs, they expect specific preconditions.
 """
+from collections import defaultdict
+import heapq
+import itertools
+import multiprocessing
+import operator
 
 # Placeholders for the fast functions implemented in C.
 
@@ -20,3 +25,92 @@ try:
     from _recommend import symmetric_diff_count, similarity
 except ImportError:
     pass
+
+
+class Similarities(object):
+    """
+    Finds the most similar items by `similarity` without comparing every pair.
+
+    `items` is a dict of {item: [group]}, e.g. add-ons and the collections
+    they're in. The symmetric difference of two items is
+    len(xs) + len(ys) - 2 * len(xs & ys), so only the size of the overlap is
+    needed. Walking an inverted index of {group: [item]} counts the overlap
+    with every item sharing a group, which is the sparse product of the
+    item x group matrix with its transpose, one row at a time. Items that
+    share nothing score by their size alone, the smallest ones score best.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.sizes = dict((item, len(groups))
+                          for item, groups in items.iteritems())
+        self.index = defaultdict(list)
+        for item, groups in items.iteritems():
+            for group in groups:
+                self.index[group].append(item)
+        self.by_size = sorted(self.sizes, key=self.sizes.get)
+
+    def top(self, item, n):
+        """
+        The `n` most similar items to `item`, as [(other, similarity)].
+
+        Like taking the top `n` + 1 of all the items, `item` included, and
+        dropping `item`.
+        """
+        overlap = defaultdict(int)
+        for group in self.items[item]:
+            for other in self.index[group]:
+                overlap[other] += 1
+
+        size, sizes = self.sizes[item], self.sizes
+        scores = [(other, 1. / (1 + size + sizes[other] - 2 * count))
+                  for other, count in overlap.iteritems()]
+        disjoint = (other for other in self.by_size if other not in overlap)
+        scores.extend((other, 1. / (1 + size + sizes[other]))
+                      for other in itertools.islice(disjoint, n + 1))
+
+        best = heapq.nlargest(n + 1, scores, key=operator.itemgetter(1))
+        return [(k, v) for k, v in best if k != item]
+
+    def chunk(self, items, n):
+        return [(item, self.top(item, n)) for item in items]
+
+
+# Set before the pool forks so the workers share it instead of pickling it.
+_similarities = None
+
+
+def _top_chunk(args):
+    items, n = args
+    return _similarities.chunk(items, n)
+
+
+def top_similar(items, n=10, processes=1, chunk_size=500, keys=None):
+    """
+    Yields (item, [(other, similarity)]) with the `n` most similar items for
+    every item in `items`, a dict of {item: [group]}. Pass `keys` to only
+    yield those items, still compared against all of `items`.
+
+    With more than one process the items are split in chunks of
+    `chunk_size` and spread over a pool of `processes` workers.
+    """
+    global _similarities
+    sims = Similarities(items)
+    keys = list(items if keys is None else keys)
+
+    if processes <= 1:
+        for item in keys:
+            yield item, sims.top(item, n)
+        return
+
+    _similarities = sims
+    pool = multiprocessing.Pool(processes)
+    try:
+        chunks = ((keys[i:i + chunk_size], n)
+                  for i in xrange(0, len(keys), chunk_size))
+        for results in pool.imap_unordered(_top_chunk, chunks):
+            for result in results:
+                yield result
+    finally:
+        pool.terminate()
+        _similarities = None
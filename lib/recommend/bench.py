@@ -0,0 +1,67 @@
+"""
+Compares `top_similar` with the pairwise `similarity` loop the recs cron used
+to run, on a synthetic data set shaped like synced_addons_collections.
+
+    python -m recommend.bench [addons] [processes]
+
+The pairwise loop is quadratic, so it's timed on a sample of add-ons and
+extrapolated to the full set.
+"""
+import array
+import random
+import sys
+import time
+
+import recommend
+
+
+def synthetic(num_addons, num_collections=None, seed=42):
+    """
+    {addon: array of collection ids}. Every collection is the add-ons of one
+    profile, a handful of them, picked so that a few add-ons are in most
+    collections and most add-ons in a few.
+    """
+    rand = random.Random(seed)
+    num_collections = num_collections or num_addons * 2
+    addons = {}
+    for collection in xrange(num_collections):
+        size = rand.randint(3, 20)
+        for _ in xrange(size):
+            addon = int(num_addons * rand.random() ** 3)
+            addons.setdefault(addon, set()).add(collection)
+    # The cron skips add-ons in 3 collections or less.
+    return dict((addon, array.array('l', sorted(cs)))
+                for addon, cs in addons.iteritems() if len(cs) > 3)
+
+
+def pairwise(addons, sample):
+    sim = recommend.similarity
+    for addon in sample:
+        collections = addons[addon]
+        xs = sorted(((other, sim(collections, cs))
+                     for other, cs in addons.iteritems()),
+                    key=lambda x: x[1], reverse=True)
+        [(k, v) for k, v in xs[:11] if k != addon]
+
+
+def main(num_addons=100000, processes=1):
+    addons = synthetic(num_addons)
+    print '%s add-ons, %s memberships' % (
+        len(addons), sum(len(cs) for cs in addons.itervalues()))
+
+    sample = random.Random(0).sample(list(addons), min(100, num_addons))
+    start = time.time()
+    pairwise(addons, sample)
+    per_addon = (time.time() - start) / len(sample)
+    print 'pairwise: %.4fs per add-on, ~%.0fs for all' % (
+        per_addon, per_addon * len(addons))
+
+    start = time.time()
+    for _ in recommend.top_similar(addons, 10, processes=processes):
+        pass
+    print 'top_similar (%s processes): %.2fs for all' % (
+        processes, time.time() - start)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
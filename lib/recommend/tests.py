@@ -31,3 +31,39 @@ def test_symmetric_diff_count():
 # The algorithm is in flux so this is minimal coverage.
 def test_similarity():
     eq_(1/2., recommend.similarity([1], [1, 2]))
+
+
+def brute_force(items, item, n):
+    xs = sorted(((other, recommend.similarity(items[item], cs))
+                 for other, cs in items.items()),
+                key=lambda x: x[1], reverse=True)
+    return [(k, v) for k, v in xs[:n + 1] if k != item]
+
+
+def test_top_similar():
+    items = {1: [1, 2, 3], 2: [1, 2], 3: [2, 3, 4, 5], 4: [6], 5: [7, 8],
+             6: [1, 2, 3, 9]}
+    top = dict(recommend.top_similar(items, 3))
+    eq_(sorted(top), sorted(items))
+    for item in items:
+        eq_(sorted(v for k, v in top[item]),
+            sorted(v for k, v in brute_force(items, item, 3)))
+
+
+def test_top_similar_disjoint():
+    # Items that share nothing still fill up the list, smallest first.
+    items = {1: [1, 2], 2: [3], 3: [4, 5, 6], 4: [7, 8]}
+    eq_(dict(recommend.top_similar(items, 2))[1], [(2, 1 / 4.), (4, 1 / 5.)])
+
+
+def test_top_similar_processes():
+    items = dict((i, range(i % 7, i % 7 + i % 5 + 1)) for i in range(50))
+    eq_(dict(recommend.top_similar(items, 5)),
+        dict(recommend.top_similar(items, 5, processes=2, chunk_size=7)))
+
+
+def test_top_similar_keys():
+    items = dict((i, range(i % 7, i % 7 + i % 5 + 1)) for i in range(50))
+    top = dict(recommend.top_similar(items, 5))
+    some = dict(recommend.top_similar(items, 5, keys=[3, 10, 42]))
+    eq_(some, dict((k, top[k]) for k in [3, 10, 42]))
@@ -83,6 +83,32 @@ SERVICES_DATABASE = {
     'HOST': '',
 }
 
+# Keep an in-process index of add-on versions and files in every update
+# service worker and answer update pings from it instead of MySQL.
+SERVICES_UPDATE_INDEX = False
+# How often, in seconds, update workers pull changed add-ons into the index.
+SERVICES_UPDATE_INDEX_REFRESH = 60
+# How often, in seconds, update workers rebuild the index from scratch. This
+# is what picks up deleted versions and files.
+SERVICES_UPDATE_INDEX_REBUILD = 60 * 60
+# How often, in seconds, update workers check compat overrides for changes.
+SERVICES_UPDATE_OVERRIDES_REFRESH = 60
+# How many rendered update responses each update service worker keeps. Set
+# to 0 to turn the response cache off.
+SERVICES_UPDATE_CACHE = 0
+# How often, in seconds, update workers check for add-ons whose cached
+# responses went stale. With the update index on, its refreshes do this.
+SERVICES_UPDATE_CACHE_REFRESH = 60
+# The most add-ons a client can ask about in one bulk update request.
+SERVICES_BULK_UPDATE_LIMIT = 100
+# How many verified receipts each receipt verification worker remembers.
+# Set to 0 to turn the receipt cache off.
+SERVICES_VERIFY_CACHE = 0
+# The longest, in seconds, a receipt is answered from the cache.
+SERVICES_VERIFY_CACHE_TIMEOUT = 60 * 10
+# How often, in seconds, receipt workers check for refunds and chargebacks.
+SERVICES_VERIFY_CACHE_REFRESH = 30
+
 DATABASE_ROUTERS = ('multidb.PinningMasterSlaveRouter',)
 
 # For use django-mysql-pool backend.
@@ -1236,6 +1262,9 @@ DEFAULT_SUGGESTED_CONTRIBUTION = 5
 # Path to `ps`.
 PS_BIN = '/bin/ps'
 
+# How many processes the recs cron spreads the similarity calculations over.
+RECS_PROCESSES = 1
+
 BLOCKLIST_COOKIE = 'BLOCKLIST_v1'
 
 # The maximum file size that is shown inside the file viewer.
@@ -1330,12 +1359,18 @@ BUILDER_VERSIONS_URL = ('https://builder.addons.mozilla.org/repackage/' +
 ## Elastic Search
 ES_HOSTS = ['127.0.0.1:9200']
 ES_INDEXES = {'default': 'amo',
+              # An alias, see `./manage.py cron reindex_addons aliased`.
+              'addons': 'amo_addons',
               'update_counts': 'amo_stats',
               'download_counts': 'amo_stats',
               'stats_collections_counts': 'amo_stats',
               'users_install': 'amo_stats'}
 ES_TIMEOUT = 30
 
+# Seconds to collect add-on saves before reindexing them in one batch. Set to
+# 0 to reindex each save right away.
+ADDON_REINDEX_DEBOUNCE = 5
+
 # Default AMO user id to use for tasks.
 TASK_USER_ID = 4757633
 
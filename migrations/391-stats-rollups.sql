@@ -0,0 +1,14 @@
+CREATE TABLE `stats_rollups` (
+    `id` int(11) unsigned AUTO_INCREMENT NOT NULL PRIMARY KEY,
+    `addon_id` int(11) unsigned NOT NULL,
+    `kind` varchar(16) NOT NULL,
+    `period` varchar(5) NOT NULL,
+    `date` date NOT NULL,
+    `days` smallint unsigned NOT NULL,
+    `count` int(11) unsigned NOT NULL,
+    `data` longtext,
+    UNIQUE KEY `addon_kind_period_date` (`addon_id`, `kind`, `period`, `date`)
+) ENGINE=InnoDB CHARACTER SET utf8 COLLATE utf8_general_ci;
+
+ALTER TABLE `stats_rollups` ADD CONSTRAINT `stats_rollups_addon_id_key`
+    FOREIGN KEY (`addon_id`) REFERENCES `addons` (`id`) ON DELETE CASCADE;
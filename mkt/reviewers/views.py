@@ -237,7 +237,8 @@ def logs(request):
 
     form = forms.ReviewAppLogForm(data)
 
-    approvals = ActivityLog.objects.review_queue(webapp=True)
+    approvals = (ActivityLog.objects.review_queue(webapp=True)
+                 .transform(ActivityLog.transformer))
 
     if form.is_valid():
         data = form.cleaned_data
@@ -1,5 +1,6 @@
 # -*- coding: utf8 -*-
 import calendar
+import datetime
 import json
 from urllib import urlencode
 import time
@@ -251,6 +252,13 @@ class TestVerify(amo.tests.TestCase):
         self.assertRaises(M2Crypto.RSA.RSAError, verify.decode_receipt,
                           receipt + 'x')
 
+    def test_premium_addon_queries(self):
+        self.addon.update(premium_type=amo.ADDON_PREMIUM)
+        self.make_install()
+        self.make_purchase()
+        with self.assertNumQueries(1):
+            eq_(self.get(3615, self.user_data)['status'], 'ok')
+
     @mock.patch.object(verify, 'decode_receipt')
     def get_headers(self, decode_receipt):
         decode_receipt.return_value = ''
@@ -266,3 +274,78 @@ class TestVerify(amo.tests.TestCase):
     def test_no_cache(self):
         hdrs = self.get_headers()
         assert ('Cache-Control', 'no-cache') in hdrs, 'No cache header needed'
+
+
+@mock.patch.object(utils.settings, 'SERVICES_VERIFY_CACHE_TIMEOUT', 600)
+class TestReceiptCache(amo.tests.TestCase):
+    fixtures = ['base/addon_3615', 'base/users']
+
+    def setUp(self):
+        self.addon = Addon.objects.get(pk=3615)
+        self.user = UserProfile.objects.get(email='regular@mozilla.com')
+        self.install = Installed.objects.create(addon=self.addon,
+                                                user=self.user)
+        self.install.update(uuid='some-uuid')
+        self.user_data = {'user': {'type': 'directed-identifier',
+                                   'value': 'some-uuid'},
+                          'product': {'url': 'http://f.com',
+                                      'storedata': urlencode({'id': 3615})},
+                          'exp': calendar.timegm(time.gmtime()) + 1000}
+        self.cache = verify.ReceiptCache(10)
+
+    @mock.patch.object(verify, 'decode_receipt')
+    def get(self, receipt, decode_receipt):
+        decode_receipt.return_value = self.user_data
+        v = verify.Verify(3615, receipt, {}, cache=self.cache)
+        v.cursor = connection.cursor()
+        return json.loads(v())
+
+    def test_hit(self):
+        eq_(self.get('receipt')['status'], 'ok')
+        with mock.patch.object(verify, 'decode_receipt') as decode_receipt:
+            v = verify.Verify(3615, 'receipt', {}, cache=self.cache)
+            eq_(json.loads(v())['status'], 'ok')
+            assert not decode_receipt.called
+
+    def test_different_receipt(self):
+        self.get('receipt')
+        self.get('other')
+        eq_(len(self.cache.entries), 2)
+
+    def test_invalid_not_cached(self):
+        self.install.delete()
+        eq_(self.get('receipt')['status'], 'invalid')
+        eq_(len(self.cache.entries), 0)
+
+    def test_respects_exp(self):
+        self.user_data['exp'] = calendar.timegm(time.gmtime()) + 15
+        self.get('receipt')
+        key = self.cache.key(3615, 'receipt')
+        assert self.cache.entries[key][1] <= self.user_data['exp'] - 10
+        self.cache.entries[key] = self.cache.entries[key][:1] + (
+            time.time() - 1,) + self.cache.entries[key][2:]
+        eq_(self.cache.get(key), None)
+
+    def test_refund_invalidates(self):
+        self.addon.update(premium_type=amo.ADDON_PREMIUM)
+        purchase = AddonPurchase.objects.create(addon=self.addon,
+                                                user=self.user)
+        eq_(self.get('receipt')['status'], 'ok')
+        self.cache.refresh(connection.cursor())
+
+        Contribution.objects.create(addon=self.addon, user=self.user,
+                                    type=amo.CONTRIB_REFUND)
+        eq_(AddonPurchase.objects.get(pk=purchase.pk).type,
+            amo.CONTRIB_REFUND)
+        self.cache.since = self.cache.since.replace(
+            microsecond=0) - datetime.timedelta(seconds=1)
+        self.cache.refresh(connection.cursor())
+        eq_(len(self.cache.entries), 0)
+        eq_(self.get('receipt')['status'], 'refunded')
+
+    def test_lru(self):
+        for i in range(12):
+            self.cache.set(i, 'ok', time.time() + 100, 3615, i)
+        eq_(len(self.cache.entries), 10)
+        eq_(self.cache.get(0), None)
+        eq_(self.cache.get(11), 'ok')
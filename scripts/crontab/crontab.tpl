@@ -5,6 +5,7 @@ HOME=/tmp
 # Every minute!
 * * * * * {{ z_cron }} fast_current_version
 * * * * * {{ z_cron }} migrate_collection_users
+* * * * * {{ z_cron }} flush_synced_collections
 
 # Every 30 minutes.
 */30 * * * * {{ z_cron }} tag_jetpacks
@@ -27,6 +28,7 @@ HOME=/tmp
 20 */3 * * * {{ z_cron }} compatibility_report
 # clouserw commented this out
 #20 */3 * * * {{ remora }}; php -f compatibility_report.php
+50 */3 * * * {{ z_cron }} recs incremental
 
 #every 4 hours
 40 */4 * * * {{ django }} clean_redis
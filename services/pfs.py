@@ -55,6 +55,267 @@ quicktime_re = re.compile(r'^(application/(sdp|x-(mpeg|rtsp|sdp))|audio/(3gpp(2)
 java_re = re.compile(r'^application/x-java-((applet|bean)(;jpi-version=1\.5|;version=(1\.(1(\.[1-3])?|(2|4)(\.[1-2])?|3(\.1)?|5)))?|vm)$')
 wmp_re = re.compile(r'^(application/(asx|x-(mplayer2|ms-wmp))|video/x-ms-(asf(-plugin)?|wm(p|v|x)?|wvx)|audio/x-ms-w(ax|ma))$')
 
+
+def os_match(regex):
+    """A predicate matching the start of the clientOS against `regex`."""
+    if isinstance(regex, basestring):
+        regex = re.compile(regex)
+    return lambda g: regex.match(g['clientOS']) is not None
+
+
+# The predicates are shared between the rules so that each is only run once
+# per request.
+is_flash_os = os_match(flash_re)
+is_win = os_match(r'Win')
+is_win32 = os_match(r'(?!.*(Win64|x64))Win.*$')
+is_vista = os_match(r'Windows NT 6\.0')
+is_mac = os_match(r'(PPC|Intel) Mac OS X')
+is_win_or_ppc = os_match(r'(Win|PPC Mac OS X)')
+is_win_linux_or_ppc = os_match(r'(Win|Linux|PPC Mac OS X)')
+# We really want the regexp for Linux to be /Linux(?! x86_64)/ but for now we
+# can't tell 32-bit linux appart from 64-bit linux, so Acrobat is the only
+# one that tries.
+is_acrobat_os = os_match(r'(Win|PPC Mac OS X|Linux(?! x86_64))')
+is_ja = lambda g: g['chromeLocale'] == 'ja-JP'
+
+
+class Rule(object):
+    """
+    A plugin we know where to get, for some mimetypes on some platforms.
+
+    `mimetypes` is either a list of exact mimetypes or a compiled regex and
+    `os` a predicate on the request, or None to match all platforms. When
+    the rule matches, `plugin` is applied to the output and then, for each
+    of the `variants` groups, the first (predicate, plugin) pair whose
+    predicate is None or true.
+    """
+
+    def __init__(self, mimetypes, os, plugin, variants=()):
+        self.mimetypes = mimetypes
+        self.os = os
+        self.plugin = plugin
+        self.variants = variants
+
+    def matches_mimetype(self, mimetype):
+        if isinstance(self.mimetypes, list):
+            return mimetype in self.mimetypes
+        return self.mimetypes.match(mimetype) is not None
+
+    def predicates(self):
+        found = [self.os] if self.os else []
+        for group in self.variants:
+            found.extend(p for p, plugin in group if p)
+        return found
+
+    def apply(self, plugin, matched):
+        plugin.update(self.plugin)
+        for group in self.variants:
+            for predicate, updates in group:
+                if predicate is None or matched[predicate]:
+                    plugin.update(updates)
+                    break
+
+
+# The rules are tried in order, the first one matching both the mimetype and
+# the platform wins.
+RULES = [
+    # We've got flash plugin installers for Win and Linux (x86), present
+    # those to the user, and for Mac users, tell them where they can go to
+    # get the installer.
+    Rule(['application/x-shockwave-flash', 'application/futuresplash'],
+         is_flash_os,
+         # Don't use a https URL for the license here, per request from
+         # Macromedia.
+         dict(name='Adobe Flash Player',
+              manualInstallationURL='http://www.adobe.com/go/getflashplayer'),
+         [[(is_win, dict(
+              guid='{4cfaef8a-a6c9-41a0-8e6f-967eb8f49143}',
+              XPILocation=None,
+              iconUrl='http://fpdownload2.macromedia.com/pub/flashplayer/current/fp_win_installer.ico',
+              needsRestart='false',
+              InstallerShowsUI='true'))],
+          [(is_win32, dict(
+              version='11.1.102.62',
+              InstallerHash='sha256:02e42d4272ec2404b6063b67bfa851cc667826ae7ee8d2c69139e42fb48139bb',
+              InstallerLocation='http://download.macromedia.com/pub/flashplayer/current/FP_PL_PFS_INSTALLER_32bit.exe')),
+           (is_win, dict(
+              version='11.1.102.62 64-bit',
+              InstallerHash='sha256:6183182fa16b15b02950b2c6dc559cb54740958d662f98c1cc1128cff76dbf20',
+              InstallerLocation='http://download.macromedia.com/pub/flashplayer/current/FP_PL_PFS_INSTALLER_64bit.exe'))]]),
+
+    # Even though the shockwave installer is not a silent installer, we
+    # need to show its EULA here since we've got a slimmed down installer
+    # that doesn't do that itself.
+    Rule(['application/x-director'], is_win,
+         dict(name='Adobe Shockwave Player',
+              manualInstallationURL='http://get.adobe.com/shockwave/',
+              guid='{45f2a22c-4029-4209-8b3d-1421b989633f}',
+              XPILocation=None,
+              version='11.6.4.634',
+              InstallerHash='sha256:5eeaa6969ad812a827b827b0357dc32bcb8ca77757528cf44631b290cfcb4117',
+              InstallerLocation='http://fpdownload.macromedia.com/pub/shockwave/default/english/win95nt/latest/Shockwave_Installer_FF.exe',
+              needsRestart='false',
+              InstallerShowsUI='false'),
+         [[(is_ja, dict(
+              licenseURL='http://www.adobe.com/go/eula_shockwaveplayer_jp')),
+           (None, dict(
+              licenseURL='http://www.adobe.com/go/eula_shockwaveplayer'))]]),
+
+    Rule(['audio/x-pn-realaudio-plugin', 'audio/x-pn-realaudio'],
+         is_win_linux_or_ppc,
+         dict(name='Real Player',
+              version='10.5',
+              manualInstallationURL='http://www.real.com'),
+         [[(is_win, dict(
+              XPILocation='http://forms.real.com/real/player/download.html?type=firefox',
+              guid='{d586351c-cb55-41a7-8e7b-4aaac5172d39}')),
+           (None, dict(
+              guid='{269eb771-59de-4702-9209-ca97ce522f6d}'))]]),
+
+    # Well, we don't have a plugin that can handle any of those mimetypes,
+    # but the Apple Quicktime plugin can. Point the user to the Quicktime
+    # download page.
+    Rule(quicktime_re, is_win_or_ppc,
+         dict(name='Apple Quicktime',
+              guid='{a42bb825-7eee-420f-8ee7-834062b6fefd}',
+              InstallerShowsUI='true',
+              manualInstallationURL='http://www.apple.com/quicktime/download/')),
+
+    # We serve up the Java plugin for application/x-java-vm and for the
+    # applet and bean mimetypes, bare or with a version of 1.1 to 1.5 (see
+    # java_re).
+    #
+    # We don't have a Java plugin to offer here, but Sun's got one for
+    # Windows. For other platforms we know where to get one, point the user
+    # to the JRE download page.
+    Rule(java_re, is_win_linux_or_ppc,
+         dict(name='Java Runtime Environment',
+              version='1.6 u29',
+              manualInstallationURL='http://java.com/downloads',
+              InstallerShowsUI='false',
+              needsRestart='false'),
+         # For now, send Vista users to a manual download page.
+         #
+         # This is a temp fix for bug 366129 until vista has a non-manual
+         # solution.
+         [[(is_vista, dict(
+              guid='{fbe640ef-4375-4f45-8d79-767d60bf75b8}',
+              InstallerLocation='http://java.com/firefoxjre_exe',
+              InstallerHash='sha1:4951aadb74b69d5840c3a3fee6ae45e9cc064fe3')),
+           (is_win, dict(
+              guid='{92a550f2-dfd2-4d2f-a35d-a98cfda73595}',
+              InstallerLocation='http://java.com/firefoxjre_exe',
+              InstallerHash='sha1:4951aadb74b69d5840c3a3fee6ae45e9cc064fe3',
+              XPILocation='http://java.com/jre-install.xpi')),
+           (None, dict(
+              guid='{fbe640ef-4375-4f45-8d79-767d60bf75b8}'))]]),
+
+    Rule(['application/pdf', 'application/vnd.fdf',
+          'application/vnd.adobe.xfdf', 'application/vnd.adobe.xdp+xml',
+          'application/vnd.adobe.xfd+xml'],
+         is_acrobat_os,
+         dict(name='Adobe Acrobat Plug-In',
+              guid='{d87cd824-67cb-4547-8587-616c70318095}',
+              manualInstallationURL='http://www.adobe.com/products/acrobat/readstep.html')),
+
+    Rule(['application/x-mtx'], is_win_or_ppc,
+         dict(name='Viewpoint Media Player',
+              guid='{03f998b2-0e00-11d3-a498-00104b6eb52e}',
+              manualInstallationURL='http://www.viewpoint.com/pub/products/vmp.html')),
+
+    # For all windows users who don't have the WMP 11 plugin, give them a
+    # link for it. For OSX users -- added Intel to this since flip4mac is a
+    # UB. Contact at MS was okay w/ this, plus MS points to this anyway.
+    Rule(wmp_re, None, {},
+         [[(is_win, dict(
+              name='Windows Media Player',
+              version='11',
+              guid='{cff1240a-fd24-4b9f-8183-ccd96e5300d0}',
+              manualInstallationURL='http://port25.technet.com/pages/windows-media-player-firefox-plugin-download.aspx')),
+           (is_mac, dict(
+              name='Flip4Mac',
+              version='2.1',
+              guid='{cff0240a-fd24-4b9f-8183-ccd96e5300d0}',
+              manualInstallationURL='http://www.flip4mac.com/wmv_download.htm'))]]),
+
+    Rule(['application/x-xstandard'], is_win_or_ppc,
+         dict(name='XStandard XHTML WYSIWYG Editor',
+              guid='{3563d917-2f44-4e05-8769-47e655e92361}',
+              iconUrl='http://xstandard.com/images/xicon32x32.gif',
+              XPILocation='http://xstandard.com/download/xstandard.xpi',
+              InstallerShowsUI='false',
+              manualInstallationURL='http://xstandard.com/download/',
+              licenseURL='http://xstandard.com/license/')),
+
+    Rule(['application/x-dnl'], is_win,
+         dict(name='DNL Reader',
+              guid='{ce9317a3-e2f8-49b9-9b3b-a7fb5ec55161}',
+              version='5.5',
+              iconUrl='http://digitalwebbooks.com/reader/dwb16.gif',
+              XPILocation='http://digitalwebbooks.com/reader/xpinst.xpi',
+              InstallerShowsUI='false',
+              manualInstallationURL='http://digitalwebbooks.com/reader/')),
+
+    Rule(['application/x-videoegg-loader'], is_win,
+         dict(name='VideoEgg Publisher',
+              guid='{b8b881f0-2e07-11db-a98b-0800200c9a66}',
+              iconUrl='http://videoegg.com/favicon.ico',
+              XPILocation='http://update.videoegg.com/Install/Windows/Initial/VideoEggPublisher.xpi',
+              InstallerShowsUI='true',
+              manualInstallationURL='http://www.videoegg.com/')),
+
+    Rule(['video/divx'], is_win,
+         dict(name='DivX Web Player',
+              guid='{a8b771f0-2e07-11db-a98b-0800200c9a66}',
+              iconUrl='http://images.divx.com/divx/player/webplayer.png',
+              XPILocation='http://download.divx.com/player/DivXWebPlayer.xpi',
+              InstallerShowsUI='false',
+              licenseURL='http://go.divx.com/plugin/license/',
+              manualInstallationURL='http://go.divx.com/plugin/download/')),
+
+    Rule(['video/divx'], is_mac,
+         dict(name='DivX Web Player',
+              guid='{a8b771f0-2e07-11db-a98b-0800200c9a66}',
+              iconUrl='http://images.divx.com/divx/player/webplayer.png',
+              XPILocation='http://download.divx.com/player/DivXWebPlayerMac.xpi',
+              InstallerShowsUI='false',
+              licenseURL='http://go.divx.com/plugin/license/',
+              manualInstallationURL='http://go.divx.com/plugin/download/')),
+]
+
+
+def get_candidates(rules):
+    """
+    Maps every exact mimetype in `rules` to all the rules that match it, in
+    order, including any regex rules.
+    """
+    candidates = {}
+    for rule in rules:
+        if isinstance(rule.mimetypes, list):
+            for mimetype in rule.mimetypes:
+                candidates[mimetype] = [r for r in rules
+                                        if r.matches_mimetype(mimetype)]
+    return candidates
+
+
+exact_rules = get_candidates(RULES)
+regex_rules = [r for r in RULES if not isinstance(r.mimetypes, list)]
+
+output_template = Template(xml_template)
+
+# Rendered outputs, keyed on the mimetype and the outcome of every predicate
+# the candidate rules for it look at.
+outputs = {}
+OUTPUTS_SIZE = 1000
+
+
+def get_rules(mimetype):
+    rules = exact_rules.get(mimetype)
+    if rules is None:
+        rules = [r for r in regex_rules if r.matches_mimetype(mimetype)]
+    return rules
+
+
 def get_output(data):
     g = defaultdict(str, [(k, v) for k, v in data.iteritems()])
 
@@ -70,285 +331,31 @@ def get_output(data):
     # Special case for mimetype if they are provided.
     plugin['mimetype'] = g['mimetype'] or '-1'
 
-    output = Template(xml_template)
-
     for s in required:
         if s not in data:
             # A sort of 404, matching what was returned in the original PHP.
-            return output.substitute(plugin)
+            return output_template.substitute(plugin)
 
     # Figure out what plugins we've got, and what plugins we know where
     # to get.
-
-    # Begin our huge and embarrassing if-else statement.
-    if (g['mimetype'] in ['application/x-shockwave-flash',
-                          'application/futuresplash'] and
-        re.match(flash_re, g['clientOS'])):
-
-        # We really want the regexp for Linux to be /Linux(?! x86_64)/ but
-        # for now we can't tell 32-bit linux appart from 64-bit linux, so
-        # feed all x86_64 users the flash player, even if it's a 32-bit
-        # plugin.
-
-        # We've got flash plugin installers for Win and Linux (x86),
-        # present those to the user, and for Mac users, tell them where
-        # they can go to get the installer.
-
-        plugin.update(
-            name='Adobe Flash Player',
-            manualInstallationURL='http://www.adobe.com/go/getflashplayer')
-
-        # Don't use a https URL for the license here, per request from
-        # Macromedia.
-
-        if g['clientOS'].startswith('Win'):
-            plugin.update(
-                guid='{4cfaef8a-a6c9-41a0-8e6f-967eb8f49143}',
-                XPILocation=None,
-                iconUrl='http://fpdownload2.macromedia.com/pub/flashplayer/current/fp_win_installer.ico',
-                needsRestart='false',
-                InstallerShowsUI='true')
-
-            if re.match(r'^(?!.*(Win64|x64))Win.*$', g['clientOS']):
-                plugin.update(
-                    version='11.1.102.62',
-                    InstallerHash='sha256:02e42d4272ec2404b6063b67bfa851cc667826ae7ee8d2c69139e42fb48139bb',
-                    InstallerLocation='http://download.macromedia.com/pub/flashplayer/current/FP_PL_PFS_INSTALLER_32bit.exe')
-            else:
-                plugin.update(
-                    version='11.1.102.62 64-bit',
-                    InstallerHash='sha256:6183182fa16b15b02950b2c6dc559cb54740958d662f98c1cc1128cff76dbf20',
-                    InstallerLocation='http://download.macromedia.com/pub/flashplayer/current/FP_PL_PFS_INSTALLER_64bit.exe')
-
-    elif (g['mimetype'] == 'application/x-director' and
-          g['clientOS'].startswith('Win')):
-        plugin.update(
-            name='Adobe Shockwave Player',
-            manualInstallationURL='http://get.adobe.com/shockwave/')
-
-        # Even though the shockwave installer is not a silent installer, we
-        # need to show its EULA here since we've got a slimmed down
-        # installer that doesn't do that itself.
-        if g['chromeLocale'] != 'ja-JP':
-            plugin.update(
-                licenseURL='http://www.adobe.com/go/eula_shockwaveplayer')
-        else:
-            plugin.update(
-                licenseURL='http://www.adobe.com/go/eula_shockwaveplayer_jp')
-        plugin.update(
-            guid='{45f2a22c-4029-4209-8b3d-1421b989633f}',
-            XPILocation=None,
-            version='11.6.4.634',
-            InstallerHash='sha256:5eeaa6969ad812a827b827b0357dc32bcb8ca77757528cf44631b290cfcb4117',
-            InstallerLocation='http://fpdownload.macromedia.com/pub/shockwave/default/english/win95nt/latest/Shockwave_Installer_FF.exe',
-            needsRestart='false',
-            InstallerShowsUI='false')
-
-    elif (g['mimetype'] in ['audio/x-pn-realaudio-plugin',
-                            'audio/x-pn-realaudio'] and
-          re.match(r'^(Win|Linux|PPC Mac OS X)', g['clientOS'])):
-        plugin.update(
-            name='Real Player',
-            version='10.5',
-            manualInstallationURL='http://www.real.com')
-
-        if g['clientOS'].startswith('Win'):
-            plugin.update(
-                XPILocation='http://forms.real.com/real/player/download.html?type=firefox',
-                guid='{d586351c-cb55-41a7-8e7b-4aaac5172d39}')
-        else:
-            plugin.update(
-                guid='{269eb771-59de-4702-9209-ca97ce522f6d}')
-
-    elif (re.match(quicktime_re, g['mimetype']) and
-          re.match(r'^(Win|PPC Mac OS X)', g['clientOS'])):
-
-        # Well, we don't have a plugin that can handle any of those
-        # mimetypes, but the Apple Quicktime plugin can. Point the user to
-        # the Quicktime download page.
-
-        plugin.update(
-            name='Apple Quicktime',
-            guid='{a42bb825-7eee-420f-8ee7-834062b6fefd}',
-            InstallerShowsUI='true',
-            manualInstallationURL='http://www.apple.com/quicktime/download/')
-
-    elif (re.match(java_re, g['mimetype']) and
-          re.match(r'^(Win|Linux|PPC Mac OS X)', g['clientOS'])):
-
-        # We serve up the Java plugin for the following mimetypes:
-        #
-        # application/x-java-vm
-        # application/x-java-applet;jpi-version=1.5
-        # application/x-java-bean;jpi-version=1.5
-        # application/x-java-applet;version=1.3
-        # application/x-java-bean;version=1.3
-        # application/x-java-applet;version=1.2.2
-        # application/x-java-bean;version=1.2.2
-        # application/x-java-applet;version=1.2.1
-        # application/x-java-bean;version=1.2.1
-        # application/x-java-applet;version=1.4.2
-        # application/x-java-bean;version=1.4.2
-        # application/x-java-applet;version=1.5
-        # application/x-java-bean;version=1.5
-        # application/x-java-applet;version=1.3.1
-        # application/x-java-bean;version=1.3.1
-        # application/x-java-applet;version=1.4
-        # application/x-java-bean;version=1.4
-        # application/x-java-applet;version=1.4.1
-        # application/x-java-bean;version=1.4.1
-        # application/x-java-applet;version=1.2
-        # application/x-java-bean;version=1.2
-        # application/x-java-applet;version=1.1.3
-        # application/x-java-bean;version=1.1.3
-        # application/x-java-applet;version=1.1.2
-        # application/x-java-bean;version=1.1.2
-        # application/x-java-applet;version=1.1.1
-        # application/x-java-bean;version=1.1.1
-        # application/x-java-applet;version=1.1
-        # application/x-java-bean;version=1.1
-        # application/x-java-applet
-        # application/x-java-bean
-        #
-        #
-        # We don't have a Java plugin to offer here, but Sun's got one for
-        # Windows. For other platforms we know where to get one, point the
-        # user to the JRE download page.
-
-        plugin.update(
-            name='Java Runtime Environment',
-            version='1.6 u29',
-            manualInstallationURL='http://java.com/downloads',
-            InstallerShowsUI='false',
-            needsRestart='false')
-
-        # For now, send Vista users to a manual download page.
-        #
-        # This is a temp fix for bug 366129 until vista has a non-manual
-        # solution.
-        if g['clientOS'].startswith('Windows NT 6.0'):
-            plugin.update(
-                guid='{fbe640ef-4375-4f45-8d79-767d60bf75b8}',
-                InstallerLocation='http://java.com/firefoxjre_exe',
-                InstallerHash='sha1:4951aadb74b69d5840c3a3fee6ae45e9cc064fe3')
-        elif g['clientOS'].startswith('Win'):
-            plugin.update(
-                guid='{92a550f2-dfd2-4d2f-a35d-a98cfda73595}',
-                InstallerLocation='http://java.com/firefoxjre_exe',
-                InstallerHash='sha1:4951aadb74b69d5840c3a3fee6ae45e9cc064fe3',
-                XPILocation='http://java.com/jre-install.xpi')
-        else:
-            plugin.update(
-                guid='{fbe640ef-4375-4f45-8d79-767d60bf75b8}')
-
-    elif (g['mimetype'] in ['application/pdf', 'application/vnd.fdf',
-                            'application/vnd.adobe.xfdf',
-                            'application/vnd.adobe.xdp+xml',
-                            'application/vnd.adobe.xfd+xml'] and
-          re.match(r'^(Win|PPC Mac OS X|Linux(?! x86_64))', g['clientOS'])):
-        plugin.update(
-            name='Adobe Acrobat Plug-In',
-            guid='{d87cd824-67cb-4547-8587-616c70318095}',
-            manualInstallationURL='http://www.adobe.com/products/acrobat/readstep.html')
-
-    elif (g['mimetype'] == 'application/x-mtx' and
-          re.match(r'^(Win|PPC Mac OS X)', g['clientOS'])):
-        plugin.update(
-            name='Viewpoint Media Player',
-            guid='{03f998b2-0e00-11d3-a498-00104b6eb52e}',
-            manualInstallationURL='http://www.viewpoint.com/pub/products/vmp.html')
-
-    elif re.match(wmp_re, g['mimetype']):
-        # We serve up the Windows Media Player plugin for the following
-        # mimetypes:
-        #
-        # application/asx
-        # application/x-mplayer2
-        # audio/x-ms-wax
-        # audio/x-ms-wma
-        # video/x-ms-asf
-        # video/x-ms-asf-plugin
-        # video/x-ms-wm
-        # video/x-ms-wmp
-        # video/x-ms-wmv
-        # video/x-ms-wmx
-        # video/x-ms-wvx
-        #
-        # For all windows users who don't have the WMP 11 plugin, give them
-        # a link for it.
-        if g['clientOS'].startswith('Win'):
-            plugin.update(
-                name='Windows Media Player',
-                version='11',
-                guid='{cff1240a-fd24-4b9f-8183-ccd96e5300d0}',
-                manualInstallationURL='http://port25.technet.com/pages/windows-media-player-firefox-plugin-download.aspx')
-
-        # For OSX users -- added Intel to this since flip4mac is a UB.
-        # Contact at MS was okay w/ this, plus MS points to this anyway.
-        elif re.match(r'^(PPC|Intel) Mac OS X', g['clientOS']):
-            plugin.update(
-                name='Flip4Mac',
-                version='2.1',
-                guid='{cff0240a-fd24-4b9f-8183-ccd96e5300d0}',
-                manualInstallationURL='http://www.flip4mac.com/wmv_download.htm')
-
-    elif (g['mimetype'] == 'application/x-xstandard' and
-          re.match(r'^(Win|PPC Mac OS X)', g['clientOS'])):
-        plugin.update(
-            name='XStandard XHTML WYSIWYG Editor',
-            guid='{3563d917-2f44-4e05-8769-47e655e92361}',
-            iconUrl='http://xstandard.com/images/xicon32x32.gif',
-            XPILocation='http://xstandard.com/download/xstandard.xpi',
-            InstallerShowsUI='false',
-            manualInstallationURL='http://xstandard.com/download/',
-            licenseURL='http://xstandard.com/license/')
-
-    elif (g['mimetype'] == 'application/x-dnl' and
-          g['clientOS'].startswith('Win')):
-        plugin.update(
-            name='DNL Reader',
-            guid='{ce9317a3-e2f8-49b9-9b3b-a7fb5ec55161}',
-            version='5.5',
-            iconUrl='http://digitalwebbooks.com/reader/dwb16.gif',
-            XPILocation='http://digitalwebbooks.com/reader/xpinst.xpi',
-            InstallerShowsUI='false',
-            manualInstallationURL='http://digitalwebbooks.com/reader/')
-
-    elif (g['mimetype'] == 'application/x-videoegg-loader' and
-          g['clientOS'].startswith('Win')):
-        plugin.update(
-            name='VideoEgg Publisher',
-            guid='{b8b881f0-2e07-11db-a98b-0800200c9a66}',
-            iconUrl='http://videoegg.com/favicon.ico',
-            XPILocation='http://update.videoegg.com/Install/Windows/Initial/VideoEggPublisher.xpi',
-            InstallerShowsUI='true',
-            manualInstallationURL='http://www.videoegg.com/')
-
-    elif (g['mimetype'] == 'video/divx' and
-          g['clientOS'].startswith('Win')):
-        plugin.update(
-            name='DivX Web Player',
-            guid='{a8b771f0-2e07-11db-a98b-0800200c9a66}',
-            iconUrl='http://images.divx.com/divx/player/webplayer.png',
-            XPILocation='http://download.divx.com/player/DivXWebPlayer.xpi',
-            InstallerShowsUI='false',
-            licenseURL='http://go.divx.com/plugin/license/',
-            manualInstallationURL='http://go.divx.com/plugin/download/')
-
-    elif (g['mimetype'] == 'video/divx' and
-          re.match(r'^(PPC|Intel) Mac OS X', g['clientOS'])):
-        plugin.update(
-            name='DivX Web Player',
-            guid='{a8b771f0-2e07-11db-a98b-0800200c9a66}',
-            iconUrl='http://images.divx.com/divx/player/webplayer.png',
-            XPILocation='http://download.divx.com/player/DivXWebPlayerMac.xpi',
-            InstallerShowsUI='false',
-            licenseURL='http://go.divx.com/plugin/license/',
-            manualInstallationURL='http://go.divx.com/plugin/download/')
-
-    # End ridiculously huge and embarrassing if-else block.
-
-    return output.substitute(plugin)
+    rules = get_rules(g['mimetype'])
+    predicates = []
+    for rule in rules:
+        predicates.extend(p for p in rule.predicates() if p not in predicates)
+    matched = dict((p, p(g)) for p in predicates)
+
+    key = (g['mimetype'], tuple(matched[p] for p in predicates))
+    output = outputs.get(key)
+    if output is None:
+        for rule in rules:
+            if rule.os is None or matched[rule.os]:
+                rule.apply(plugin, matched)
+                break
+        output = output_template.substitute(plugin)
+        if len(outputs) >= OUTPUTS_SIZE:
+            outputs.clear()
+        outputs[key] = output
+    return output
 
 
 def format_date(secs):
@@ -1,7 +1,11 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from email.Utils import formatdate
 from email.mime.text import MIMEText
+import json
 import smtplib
 import sys
+import threading
 from time import time
 import traceback
 from urlparse import parse_qsl
@@ -30,10 +34,18 @@ from utils import (get_mirror, log_configure, APP_GUIDS, PLATFORMS,
 # Go configure the log.
 log_configure()
 
-good_rdf = """<?xml version="1.0"?>
+rdf_header = """<?xml version="1.0"?>
 <RDF:RDF xmlns:RDF="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
          xmlns:em="http://www.mozilla.org/2004/em-rdf#">
-    <RDF:Description about="urn:mozilla:%(type)s:%(guid)s">
+"""
+
+
+rdf_footer = """</RDF:RDF>"""
+
+
+# The bodies are the part of a response for one add-on. Bulk responses put
+# one after the other into the same document.
+good_rdf_body = """    <RDF:Description about="urn:mozilla:%(type)s:%(guid)s">
         <em:updates>
             <RDF:Seq>
                 <RDF:li resource="urn:mozilla:%(type)s:%(guid)s:%(version)s"/>
@@ -54,25 +66,25 @@ good_rdf = """<?xml version="1.0"?>
             </RDF:Description>
         </em:targetApplication>
     </RDF:Description>
-</RDF:RDF>"""
+"""
 
 
-bad_rdf = """<?xml version="1.0"?>
-<RDF:RDF xmlns:RDF="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
-         xmlns:em="http://www.mozilla.org/2004/em-rdf#">
-</RDF:RDF>"""
-
-
-no_updates_rdf = """<?xml version="1.0"?>
-<RDF:RDF xmlns:RDF="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
-         xmlns:em="http://www.mozilla.org/2004/em-rdf#">
-    <RDF:Description about="urn:mozilla:%(type)s:%(guid)s">
+no_updates_rdf_body = """    <RDF:Description about="urn:mozilla:%(type)s:%(guid)s">
         <em:updates>
             <RDF:Seq>
             </RDF:Seq>
         </em:updates>
     </RDF:Description>
-</RDF:RDF>"""
+"""
+
+
+good_rdf = rdf_header + good_rdf_body + rdf_footer
+
+
+bad_rdf = rdf_header + rdf_footer
+
+
+no_updates_rdf = rdf_header + no_updates_rdf_body + rdf_footer
 
 
 timing_log = commonware.log.getLogger('z.timer')
@@ -88,10 +100,514 @@ def getconn():
 mypool = pool.QueuePool(getconn, max_overflow=10, pool_size=5, recycle=300)
 
 
-class Update(object):
+# The columns of an update lookup, in the order `Update.get_update` and
+# `UpdateIndex.get_update` return them.
+UPDATE_COLUMNS = ['guid', 'type', 'disabled_by_user', 'appguid', 'min', 'max',
+                  'file_id', 'file_status', 'hash', 'filename', 'version_id',
+                  'datestatuschanged', 'strict_compat', 'releasenotes',
+                  'version', 'premium_type']
+
+
+def in_clause(column, ids):
+    """An `AND column IN (...)` filter for integer `ids`, if there are any."""
+    if ids is None:
+        return ''
+    return 'AND %s IN (%s)' % (column, ','.join(str(int(i)) for i in ids))
+
+
+class CompatOverrides(object):
+    """
+    The ranges of `incompatible_versions`, kept per app and add-on.
+
+    Each row is normalized into a closed `version_int` interval so the
+    "normal" compat mode can drop overridden versions in Python, or push
+    them down to MySQL as a plain id list, instead of having MySQL evaluate
+    a subquery for every candidate version. Any change to the table, found
+    by polling its row count and newest `modified`, reloads it as a whole.
+    """
+    sql = """
+        SELECT incompatible_versions.app_id, versions.addon_id,
+               incompatible_versions.version_id,
+               min_app_version, max_app_version,
+               min_app_version_int, max_app_version_int
+        FROM incompatible_versions
+        INNER JOIN versions
+            ON versions.id = incompatible_versions.version_id
+        WHERE 1 %(where)s"""
+
+    state_sql = """
+        SELECT COUNT(*), MAX(modified) FROM incompatible_versions"""
+
+    def __init__(self):
+        self.ranges = {}
+        self.state = None
+        self.lock = threading.Lock()
+        self.ready = False
+        self.checked = 0
+
+    def load(self, cursor, ids=None):
+        """Loads the ranges of the add-ons in `ids`, or of all add-ons."""
+        cursor.execute(self.state_sql)
+        state = cursor.fetchone()
+
+        ranges = {}
+        cursor.execute(self.sql % {
+            'where': in_clause('versions.addon_id', ids)})
+        for (app_id, addon_id, version_id, min_ver, max_ver,
+             min_int, max_int) in cursor.fetchall():
+            low = 0 if min_ver == '0' else min_int
+            high = float('inf') if max_ver == '*' else max_int
+            if low is None or high is None:
+                # An unparseable version never matches, as in MySQL.
+                continue
+            (ranges.setdefault((app_id, addon_id), {})
+                   .setdefault(version_id, []).append((low, high)))
+
+        self.ranges = ranges
+        self.state = state
+        self.ready = True
+
+    def refresh(self, cursor):
+        """Reloads the ranges if the table changed, returns True if so."""
+        cursor.execute(self.state_sql)
+        if cursor.fetchone() == self.state:
+            return False
+        self.load(cursor)
+        return True
+
+    def maybe_refresh(self):
+        """
+        Loads or refreshes the ranges if it's due, returns True if they
+        changed.
+        """
+        now = time()
+        if now - self.checked < settings.SERVICES_UPDATE_OVERRIDES_REFRESH:
+            return False
+        if not self.lock.acquire(False):
+            return False
+
+        try:
+            conn = mypool.connect()
+            cursor = conn.cursor()
+            try:
+                changed = self.refresh(cursor)
+                self.checked = now
+                return changed
+            finally:
+                cursor.close()
+                conn.close()
+        finally:
+            self.lock.release()
+
+    def incompatible(self, app_id, addon_id, version_int):
+        """The ids of the versions of the add-on overridden for the app."""
+        versions = self.ranges.get((app_id, addon_id), {})
+        return [version_id for version_id, ranges in versions.items()
+                if any(low <= version_int <= high for low, high in ranges)]
+
+    def is_incompatible(self, app_id, addon_id, version_id, version_int):
+        versions = self.ranges.get((app_id, addon_id), {})
+        return any(low <= version_int <= high
+                   for low, high in versions.get(version_id, ()))
+
+
+class UpdateIndex(object):
+    """
+    An in-process copy of everything `Update` needs to answer a ping.
+
+    The index is built from one bulk query and refreshed incrementally: any
+    add-on whose row, versions or files changed since the last refresh is
+    reloaded as a whole. Deleted versions and files don't leave a trace, so
+    the index is also rebuilt from scratch every
+    `SERVICES_UPDATE_INDEX_REBUILD` seconds.
+
+    Files are kept in lists keyed by (app_id, platform_id, status) per add-on,
+    each list sorted newest version first, so a lookup walks at most a
+    couple of short lists.
+    """
+    addons_sql = """
+        SELECT id, status, addontype_id, guid FROM addons
+        WHERE inactive = 0 AND status != %(STATUS_DELETED)s %(where)s"""
+
+    files_sql = """
+        SELECT
+            addons.guid as guid, addons.addontype_id as type,
+            addons.inactive as disabled_by_user,
+            applications.guid as appguid, appmin.version as min,
+            appmax.version as max, files.id as file_id,
+            files.status as file_status, files.hash,
+            files.filename, versions.id as version_id,
+            files.datestatuschanged as datestatuschanged,
+            files.strict_compatibility as strict_compat,
+            versions.releasenotes, versions.version as version,
+            addons.premium_type,
+            addons.id, applications.id, files.platform_id,
+            appmin.version_int, appmax.version_int,
+            files.binary_components
+        FROM versions
+        INNER JOIN addons
+            ON addons.id = versions.addon_id
+        INNER JOIN applications_versions
+            ON applications_versions.version_id = versions.id
+        INNER JOIN applications
+            ON applications_versions.application_id = applications.id
+        INNER JOIN appversions appmin
+            ON appmin.id = applications_versions.min
+        INNER JOIN appversions appmax
+            ON appmax.id = applications_versions.max
+        INNER JOIN files
+            ON files.version_id = versions.id
+        WHERE addons.inactive = 0 AND addons.status != %(STATUS_DELETED)s
+              %(where)s
+        ORDER BY versions.id DESC, files.id"""
+
+    releases_sql = """
+        SELECT versions.addon_id, versions.version, files.status
+        FROM files INNER JOIN versions
+        ON files.version_id = versions.id
+        WHERE 1 %(where)s
+        ORDER BY files.id"""
+
+    changed_sql = """
+        SELECT id FROM addons WHERE modified >= %(since)s
+        UNION
+        SELECT addon_id FROM versions WHERE modified >= %(since)s
+        UNION
+        SELECT versions.addon_id FROM files
+        INNER JOIN versions ON files.version_id = versions.id
+        WHERE files.modified >= %(since)s
+              OR files.datestatuschanged >= %(since)s"""
+
+    def __init__(self, on_change=None):
+        # Called with the ids of the add-ons that changed on every refresh,
+        # or with None when everything may have changed.
+        self.on_change = on_change
+        self.addons = {}
+        self.files = {}
+        self.releases = {}
+        self.overrides = CompatOverrides()
+        self.statuses = set()
+        self.lock = threading.Lock()
+        self.ready = False
+        # Database time of the last build or refresh.
+        self.since = None
+        # Local times of the last build and of the last refresh.
+        self.built, self.checked = 0, 0
+
+    def load(self, cursor, ids=None):
+        """
+        Loads the add-ons in `ids`, or every add-on if `ids` is None, and
+        returns the loaded (addons, files, releases) dicts.
+        """
+        addons, files, releases = {}, {}, {}
+
+        cursor.execute(self.addons_sql % {
+            'STATUS_DELETED': int(base.STATUS_DELETED),
+            'where': in_clause('id', ids)})
+        for row in cursor.fetchall():
+            addons[row[0]] = row
+
+        cursor.execute(self.files_sql % {
+            'STATUS_DELETED': int(base.STATUS_DELETED),
+            'where': in_clause('addons.id', ids)})
+        for row in cursor.fetchall():
+            addon_id, app_id, platform_id = row[16:19]
+            file_status = row[7]
+            self.statuses.add(file_status)
+            (files.setdefault(addon_id, {})
+                  .setdefault((app_id, platform_id, file_status), [])
+                  .append(row))
+
+        cursor.execute(self.releases_sql % {
+            'where': in_clause('versions.addon_id', ids)})
+        for addon_id, version, file_status in cursor.fetchall():
+            releases.setdefault(addon_id, {}).setdefault(version, file_status)
+
+        return addons, files, releases
+
+    def now(self, cursor):
+        cursor.execute('SELECT NOW()')
+        return cursor.fetchone()[0]
+
+    def build(self, cursor):
+        since = self.now(cursor)
+        addons, self.files, self.releases = self.load(cursor)
+        # MySQL compares guids case insensitively, so does the index.
+        self.addons = dict((row[3].lower(), row) for row in addons.values()
+                           if row[3])
+        self.overrides.load(cursor)
+        self.since = since
+        self.ready = True
+        if self.on_change:
+            self.on_change(None)
+
+    def build_for(self, cursor, guids):
+        """
+        Builds an index of just the add-ons with `guids`, for answering
+        a bulk request.
+        """
+        cursor.execute('SELECT id FROM addons WHERE guid IN (%s)' %
+                       ','.join(['%s'] * len(guids)), list(guids))
+        ids = [row[0] for row in cursor.fetchall()]
+        if ids:
+            addons, self.files, self.releases = self.load(cursor, ids)
+            self.addons = dict((row[3].lower(), row)
+                               for row in addons.values() if row[3])
+            self.overrides.load(cursor, ids)
+        self.ready = True
+
+    def refresh(self, cursor):
+        since = self.now(cursor)
+        cursor.execute(self.changed_sql, {'since': self.since})
+        ids = set(row[0] for row in cursor.fetchall())
+        if ids:
+            addons, files, releases = self.load(cursor, ids)
+            for guid, row in self.addons.items():
+                if row[0] in ids and row[0] not in addons:
+                    del self.addons[guid]
+            for addon_id in ids:
+                self.files[addon_id] = files.get(addon_id, {})
+                self.releases[addon_id] = releases.get(addon_id, {})
+            for row in addons.values():
+                if row[3]:
+                    self.addons[row[3].lower()] = row
+
+        if self.overrides.refresh(cursor):
+            ids = None
+        self.since = since
+        if self.on_change and (ids is None or ids):
+            self.on_change(ids)
+
+    def maybe_refresh(self):
+        """
+        Builds or refreshes the index if it's due. Only one thread does the
+        work, the others keep serving from the current copy.
+        """
+        now = time()
+        if now - self.checked < settings.SERVICES_UPDATE_INDEX_REFRESH:
+            return
+        if not self.lock.acquire(False):
+            return
+
+        try:
+            conn = mypool.connect()
+            cursor = conn.cursor()
+            try:
+                with statsd.timer('services.update.index'):
+                    if (not self.ready or now - self.built >
+                        settings.SERVICES_UPDATE_INDEX_REBUILD):
+                        self.build(cursor)
+                        self.built = now
+                    else:
+                        self.refresh(cursor)
+                self.checked = now
+            finally:
+                cursor.close()
+                conn.close()
+        except:
+            error_log.error(u'Failed to refresh the update index: %s' %
+                            (sys.exc_info()[1],))
+        finally:
+            self.lock.release()
+
+    def get_addon(self, guid):
+        """The same (id, status, type, guid) `Update.is_valid` looks up."""
+        return self.addons.get(guid.lower())
+
+    def get_release_status(self, addon_id, version):
+        """The status of a file of `version`, or None if it has no files."""
+        return self.releases.get(addon_id, {}).get(version)
+
+    def matches(self, row, data, flags, compat_mode, version_int):
+        min_int, max_int, binary = row[19:22]
+        if flags['use_version'] and row[14] != data['version']:
+            return False
+        if min_int is None or min_int > version_int:
+            return False
+
+        if compat_mode == 'ignore':
+            return True
+        elif compat_mode == 'normal':
+            if ((row[12] or binary) and
+                (max_int is None or max_int < version_int)):
+                return False
+            return not self.overrides.is_incompatible(
+                data['app_id'], data['id'], row[10], version_int)
+        return max_int is not None and max_int >= version_int
+
+    def get_update(self, data, flags, compat_mode):
+        """
+        Returns the same row as the SQL in `Update.get_update` would, or
+        None if there is no update.
+        """
+        files = self.files.get(data['id'], {})
+        version_int = int(data['version_int'])
+
+        if flags['use_version']:
+            statuses = [s for s in self.statuses if s > data['status']]
+        elif flags['multiple_status']:
+            statuses = STATUSES_PUBLIC.values()
+        else:
+            statuses = [data['status']]
+
+        platforms = [1]
+        if data.get('appOS'):
+            platforms.append(data['appOS'])
+
+        best = None
+        for platform in platforms:
+            for status in statuses:
+                for row in files.get((data['app_id'], platform, status), ()):
+                    if best and row[10] <= best[10]:
+                        break
+                    if self.matches(row, data, flags, compat_mode,
+                                    version_int):
+                        best = row
+                        break
+
+        return best[:len(UPDATE_COLUMNS)] if best else None
+
+
+class ResponseCache(object):
+    """
+    An LRU of rendered update responses.
+
+    Responses are keyed on what they depend on once the ping is resolved:
+    the add-on, app, platform, `version_int` of the app version, compat mode
+    and channel. Clients that send different but equivalent query strings
+    share an entry. Entries for an add-on are dropped when its files or
+    versions change, either through the update index or, when that is off,
+    by polling for changes every `SERVICES_UPDATE_CACHE_REFRESH` seconds.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.refreshing = threading.Lock()
+        self.since, self.checked = None, 0
+
+    def get(self, key):
+        with self.lock:
+            rdf = self.entries.pop(key, None)
+            if rdf is not None:
+                self.entries[key] = rdf
+        statsd.incr('services.update.cache.%s' %
+                    ('miss' if rdf is None else 'hit'))
+        return rdf
+
+    def set(self, key, rdf):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = rdf
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, ids):
+        """Drops the entries of the add-ons in `ids`, or all if it's None."""
+        with self.lock:
+            if ids is None:
+                self.entries.clear()
+                return
+            for key in self.entries.keys():
+                if key[0] in ids:
+                    del self.entries[key]
+
+    def refresh(self, cursor):
+        cursor.execute('SELECT NOW()')
+        since = cursor.fetchone()[0]
+        if self.since is None:
+            self.invalidate(None)
+        else:
+            cursor.execute(UpdateIndex.changed_sql, {'since': self.since})
+            ids = set(row[0] for row in cursor.fetchall())
+            if ids:
+                self.invalidate(ids)
+        self.since = since
+
+    def maybe_refresh(self):
+        now = time()
+        if now - self.checked < settings.SERVICES_UPDATE_CACHE_REFRESH:
+            return
+        if not self.refreshing.acquire(False):
+            return
+
+        try:
+            conn = mypool.connect()
+            cursor = conn.cursor()
+            try:
+                self.refresh(cursor)
+                self.checked = now
+            finally:
+                cursor.close()
+                conn.close()
+        finally:
+            self.refreshing.release()
+
+
+cache = None
+if getattr(settings, 'SERVICES_UPDATE_CACHE', 0):
+    cache = ResponseCache(settings.SERVICES_UPDATE_CACHE)
+
+overrides = CompatOverrides()
+
+index = None
+if getattr(settings, 'SERVICES_UPDATE_INDEX', False):
+    index = UpdateIndex(on_change=cache.invalidate if cache else None)
+
+
+def get_index():
+    """Returns the update index if it's enabled and built, or None."""
+    if index is None:
+        return None
+    index.maybe_refresh()
+    return index if index.ready else None
+
+
+def get_overrides():
+    """
+    Returns the compat override ranges, or None if they aren't loaded yet.
+    Not needed when the update index answers the ping, it keeps its own.
+    """
+    if overrides.maybe_refresh() and cache and index is None:
+        cache.invalidate(None)
+    return overrides if overrides.ready else None
+
+
+def get_cache():
+    """Returns the response cache if it's enabled, or None."""
+    if cache is None:
+        return None
+    if index is None:
+        cache.maybe_refresh()
+    return cache
+
+
+class RDFResponse(object):
+
+    def get_bad_rdf(self):
+        return bad_rdf
+
+    def format_date(self, secs):
+        return '%s GMT' % formatdate(time() + secs)[:25]
+
+    def get_headers(self, length):
+        return [('Content-Type', 'text/xml'),
+                ('Cache-Control', 'public, max-age=3600'),
+                ('Last-Modified', self.format_date(0)),
+                ('Expires', self.format_date(3600)),
+                ('Content-Length', str(length))]
+
 
-    def __init__(self, data, compat_mode='strict'):
+class Update(RDFResponse):
+
+    def __init__(self, data, compat_mode='strict', index=None, cache=None,
+                 overrides=None):
         self.conn, self.cursor = None, None
+        self.index = index
+        self.overrides = overrides
+        self.cache = cache
+        self.channel = None
         self.data = data.copy()
         self.data['row'] = {}
         self.flags = {'use_version': False, 'multiple_status': False}
@@ -102,7 +618,7 @@ class Update(object):
     def is_valid(self):
         # If you accessing this from unit tests, then before calling
         # is valid, you can assign your own cursor.
-        if not self.cursor:
+        if not self.cursor and not self.index:
             self.conn = mypool.connect()
             self.cursor = self.conn.cursor()
 
@@ -117,14 +633,17 @@ class Update(object):
         if not data['app_id']:
             return False
 
-        sql = """SELECT id, status, addontype_id, guid FROM addons
-                 WHERE guid = %(guid)s AND
-                       inactive = 0 AND
-                       status != %(STATUS_DELETED)s
-                 LIMIT 1;"""
-        self.cursor.execute(sql, {'guid': self.data['id'],
-                                  'STATUS_DELETED': base.STATUS_DELETED})
-        result = self.cursor.fetchone()
+        if self.index:
+            result = self.index.get_addon(data['id'])
+        else:
+            sql = """SELECT id, status, addontype_id, guid FROM addons
+                     WHERE guid = %(guid)s AND
+                           inactive = 0 AND
+                           status != %(STATUS_DELETED)s
+                     LIMIT 1;"""
+            self.cursor.execute(sql, {'guid': self.data['id'],
+                                      'STATUS_DELETED': base.STATUS_DELETED})
+            result = self.cursor.fetchone()
         if result is None:
             return False
 
@@ -150,17 +669,21 @@ class Update(object):
             # Beta channel looks at the addon name to see if it's beta.
             if self.is_beta_version:
                 # For beta look at the status of the existing files.
-                sql = """
-                    SELECT versions.id, status
-                    FROM files INNER JOIN versions
-                    ON files.version_id = versions.id
-                    WHERE versions.addon_id = %(id)s
-                          AND versions.version = %(version)s LIMIT 1;"""
-                self.cursor.execute(sql, data)
-                result = self.cursor.fetchone()
+                if self.index:
+                    status = self.index.get_release_status(data['id'],
+                                                           data['version'])
+                else:
+                    sql = """
+                        SELECT versions.id, status
+                        FROM files INNER JOIN versions
+                        ON files.version_id = versions.id
+                        WHERE versions.addon_id = %(id)s
+                              AND versions.version = %(version)s LIMIT 1;"""
+                    self.cursor.execute(sql, data)
+                    result = self.cursor.fetchone()
+                    status = result[1] if result is not None else None
                 # Only change the status if there are files.
-                if result is not None:
-                    status = result[1]
+                if status is not None:
                     # If it's in Beta or Public, then we should be looking
                     # for similar. If not, find something public.
                     if status in (base.STATUS_BETA, base.STATUS_PUBLIC):
@@ -177,10 +700,38 @@ class Update(object):
             data['status'] = base.STATUS_NULL
             self.flags['use_version'] = True
 
+        self.channel = (data['status'], self.flags['use_version'],
+                        self.flags['multiple_status'],
+                        data['version'] if self.flags['use_version'] else None)
+
     def get_update(self):
-        self.get_beta()
+        if self.channel is None:
+            self.get_beta()
         data = self.data
 
+        if self.index:
+            result = self.index.get_update(data, self.flags, self.compat_mode)
+        else:
+            result = self.query_update()
+
+        if result:
+            row = dict(zip(UPDATE_COLUMNS, list(result)))
+            row['type'] = base.ADDON_SLUGS_UPDATE[row['type']]
+            if row['premium_type'] in base.ADDON_PREMIUMS:
+                qs = urlencode(dict((k, data.get(k, ''))
+                               for k in base.WATERMARK_KEYS))
+                row['url'] = (u'%s/downloads/watermarked/%s?%s' %
+                              (settings.SITE_URL, row['file_id'], qs))
+            else:
+                row['url'] = get_mirror(self.data['addon_status'],
+                                        self.data['id'], row)
+            data['row'] = row
+            return True
+
+        return False
+
+    def query_update(self):
+        data = self.data
         sql = ["""
             SELECT
                 addons.guid as guid, addons.addontype_id as type,
@@ -237,16 +788,23 @@ class Update(object):
                 THEN appmax.version_int >= %(version_int)s ELSE 1 END
             """)
             # Filter out versions found in compat overrides
-            sql.append("""AND
-                NOT versions.id IN (
-                SELECT version_id FROM incompatible_versions
-                WHERE app_id=%(app_id)s AND
-                  (min_app_version='0' AND
-                       max_app_version_int >= %(version_int)s) OR
-                  (min_app_version_int <= %(version_int)s AND
-                       max_app_version='*') OR
-                  (min_app_version_int <= %(version_int)s AND
-                       max_app_version_int >= %(version_int)s)) """)
+            if self.overrides:
+                ids = self.overrides.incompatible(
+                    data['app_id'], data['id'], int(data['version_int']))
+                if ids:
+                    sql.append('AND versions.id NOT IN (%s) ' %
+                               ','.join(str(int(i)) for i in ids))
+            else:
+                sql.append("""AND
+                    NOT versions.id IN (
+                    SELECT version_id FROM incompatible_versions
+                    WHERE app_id=%(app_id)s AND (
+                      (min_app_version='0' AND
+                           max_app_version_int >= %(version_int)s) OR
+                      (min_app_version_int <= %(version_int)s AND
+                           max_app_version='*') OR
+                      (min_app_version_int <= %(version_int)s AND
+                           max_app_version_int >= %(version_int)s))) """)
 
         else:  # Not defined or 'strict'.
             sql.append('AND appmax.version_int >= %(version_int)s ')
@@ -254,50 +812,56 @@ class Update(object):
         sql.append('ORDER BY versions.id DESC LIMIT 1;')
 
         self.cursor.execute(''.join(sql), data)
-        result = self.cursor.fetchone()
+        return self.cursor.fetchone()
 
-        if result:
-            row = dict(zip([
-                'guid', 'type', 'disabled_by_user', 'appguid', 'min', 'max',
-                'file_id', 'file_status', 'hash', 'filename', 'version_id',
-                'datestatuschanged', 'strict_compat', 'releasenotes',
-                'version', 'premium_type'],
-                list(result)))
-            row['type'] = base.ADDON_SLUGS_UPDATE[row['type']]
-            if row['premium_type'] in base.ADDON_PREMIUMS:
-                qs = urlencode(dict((k, data.get(k, ''))
-                               for k in base.WATERMARK_KEYS))
-                row['url'] = (u'%s/downloads/watermarked/%s?%s' %
-                              (settings.SITE_URL, row['file_id'], qs))
-            else:
-                row['url'] = get_mirror(self.data['addon_status'],
-                                        self.data['id'], row)
-            data['row'] = row
-            return True
-
-        return False
-
-    def get_bad_rdf(self):
-        return bad_rdf
+    def get_cache_key(self):
+        data = self.data
+        return (data['id'], data['app_id'], data.get('appOS'),
+                int(data['version_int']), self.compat_mode, self.channel)
+
+    def is_cacheable(self):
+        """
+        Whether the response found by `get_update` can be served to other
+        clients. Watermarked URLs are per user and files still within the
+        mirror delay will move to the mirrors.
+        """
+        row = self.data['row']
+        if row['premium_type'] in base.ADDON_PREMIUMS:
+            return False
+        return (not row['datestatuschanged'] or
+                datetime.now() - row['datestatuschanged'] >
+                timedelta(minutes=settings.MIRROR_DELAY))
 
     def get_rdf(self):
         if self.is_valid():
-            if self.get_update():
-                rdf = self.get_good_rdf()
-            else:
-                rdf = self.get_no_updates_rdf()
+            rdf, key = None, None
+            if self.cache:
+                self.get_beta()
+                key = self.get_cache_key()
+                rdf = self.cache.get(key)
+
+            if rdf is None:
+                if self.get_update():
+                    rdf = self.get_good_rdf()
+                    if not self.is_cacheable():
+                        key = None
+                else:
+                    rdf = self.get_no_updates_rdf()
+                if key:
+                    self.cache.set(key, rdf)
         else:
             rdf = self.get_bad_rdf()
-        self.cursor.close()
+        if self.cursor:
+            self.cursor.close()
         if self.conn:
             self.conn.close()
         return rdf
 
-    def get_no_updates_rdf(self):
+    def get_no_updates_rdf(self, template=no_updates_rdf):
         name = base.ADDON_SLUGS_UPDATE[self.data['type']]
-        return no_updates_rdf % ({'guid': self.data['guid'], 'type': name})
+        return template % ({'guid': self.data['guid'], 'type': name})
 
-    def get_good_rdf(self):
+    def get_good_rdf(self, template=good_rdf):
         data = self.data['row']
         data['if_hash'] = ''
         if data['hash']:
@@ -311,17 +875,76 @@ class Update(object):
                                  (settings.SITE_URL, '/versions/updateInfo/',
                                   data['version_id']))
 
-        return good_rdf % data
+        return template % data
 
-    def format_date(self, secs):
-        return '%s GMT' % formatdate(time() + secs)[:25]
 
-    def get_headers(self, length):
-        return [('Content-Type', 'text/xml'),
-                ('Cache-Control', 'public, max-age=3600'),
-                ('Last-Modified', self.format_date(0)),
-                ('Expires', self.format_date(3600)),
-                ('Content-Length', str(length))]
+class BulkUpdate(RDFResponse):
+    """
+    Answers the update pings of many add-ons in one request.
+
+    Every item is a dict of the parameters of a single ping, falling back
+    to `defaults` for the ones it doesn't have, usually the app ones. All
+    the add-ons are looked up with a handful of `guid IN (...)` queries and
+    the answers come back as one RDF document.
+    """
+
+    def __init__(self, items, defaults, compat_mode='strict', index=None):
+        self.conn, self.cursor = None, None
+        self.index = index
+        self.compat_mode = compat_mode
+        self.items = []
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            try:
+                item = dict((k, self.clean_value(v)) for k, v in item.items())
+            except ValueError:
+                continue
+            data = defaults.copy()
+            data.update(item)
+            self.items.append(data)
+
+    @staticmethod
+    def clean_value(value):
+        """Ping parameters are strings. Numbers are coerced, others fail."""
+        if isinstance(value, basestring):
+            return value
+        if isinstance(value, bool) or not isinstance(value,
+                                                     (int, long, float)):
+            raise ValueError(value)
+        return unicode(value)
+
+    def get_index(self):
+        if self.index:
+            return self.index
+        # If you accessing this from unit tests, then before calling
+        # get_rdf, you can assign your own cursor.
+        if not self.cursor:
+            self.conn = mypool.connect()
+            self.cursor = self.conn.cursor()
+        guids = set(data['id'] for data in self.items if data.get('id'))
+        index = UpdateIndex()
+        if guids:
+            index.build_for(self.cursor, guids)
+        return index
+
+    def get_rdf(self):
+        index = self.get_index()
+        bodies = []
+        for data in self.items:
+            compat_mode = data.pop('compatMode', self.compat_mode)
+            update = Update(data, compat_mode, index=index)
+            if update.is_valid():
+                if update.get_update():
+                    bodies.append(update.get_good_rdf(good_rdf_body))
+                else:
+                    bodies.append(update.get_no_updates_rdf(
+                        no_updates_rdf_body))
+        if self.cursor:
+            self.cursor.close()
+        if self.conn:
+            self.conn.close()
+        return rdf_header + ''.join(bodies) + rdf_footer
 
 
 def mail_exception(data):
@@ -351,7 +974,8 @@ def application(environ, start_response):
         data = dict(parse_qsl(environ['QUERY_STRING']))
         compat_mode = data.pop('compatMode', 'strict')
         try:
-            update = Update(data, compat_mode)
+            update = Update(data, compat_mode, index=get_index(),
+                            cache=get_cache(), overrides=get_overrides())
             output = update.get_rdf()
             start_response(status, update.get_headers(len(output)))
         except:
@@ -359,3 +983,30 @@ def application(environ, start_response):
             log_exception(data)
             raise
     return [output]
+
+
+def bulk_application(environ, start_response):
+    status = '200 OK'
+    with statsd.timer('services.update.bulk'):
+        data = dict(parse_qsl(environ['QUERY_STRING']))
+        compat_mode = data.pop('compatMode', 'strict')
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            items = json.loads(environ['wsgi.input'].read(length) or '[]')
+        except ValueError:
+            items = None
+
+        if (not isinstance(items, list) or
+            len(items) > settings.SERVICES_BULK_UPDATE_LIMIT):
+            start_response('400 Bad Request', [('Content-Type', 'text/plain'),
+                                               ('Content-Length', '0')])
+            return ['']
+
+        try:
+            update = BulkUpdate(items, data, compat_mode, index=get_index())
+            output = update.get_rdf()
+            start_response(status, update.get_headers(len(output)))
+        except:
+            log_exception(items)
+            raise
+    return [output]
@@ -1,8 +1,11 @@
 import calendar
+from collections import OrderedDict
 from datetime import datetime
 from email.Utils import formatdate
+import hashlib
 import json
 import re
+import threading
 from time import gmtime, time
 from urlparse import parse_qsl
 
@@ -28,17 +31,120 @@ class VerificationError(Exception):
     pass
 
 
+class ReceiptCache(object):
+    """
+    Verdicts of recently verified receipts, keyed on a digest of the add-on
+    and the receipt, so a hit skips decoding the receipt and the database.
+
+    Only "ok" verdicts are kept, never past the receipt's `exp` nor for more
+    than `SERVICES_VERIFY_CACHE_TIMEOUT` seconds. Refunds and chargebacks
+    drop the purchaser's entries, they are picked up by polling
+    `addon_purchase` every `SERVICES_VERIFY_CACHE_REFRESH` seconds.
+    """
+    refunds_sql = """SELECT addon_id, user_id FROM addon_purchase
+                     WHERE modified >= %(since)s
+                     AND type IN (%(refund)s, %(chargeback)s);"""
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.refreshing = threading.Lock()
+        self.since, self.checked = None, 0
+
+    def key(self, addon_id, receipt):
+        return hashlib.sha1('%s:%s' % (addon_id, receipt)).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry and entry[1] > time():
+                self.entries[key] = entry
+            else:
+                entry = None
+        statsd.incr('services.verify.cache.%s' %
+                    ('miss' if entry is None else 'hit'))
+        return entry[0] if entry else None
+
+    def set(self, key, verdict, expire, addon_id, user_id):
+        expire = min(expire, time() + settings.SERVICES_VERIFY_CACHE_TIMEOUT)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (verdict, expire, addon_id, user_id)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, purchases):
+        """Drops the entries of the (addon_id, user_id) in `purchases`."""
+        with self.lock:
+            for key, entry in self.entries.items():
+                if entry[2:] in purchases:
+                    del self.entries[key]
+
+    def refresh(self, cursor):
+        cursor.execute('SELECT NOW();')
+        since = cursor.fetchone()[0]
+        if self.since is not None:
+            cursor.execute(self.refunds_sql,
+                           {'since': self.since, 'refund': CONTRIB_REFUND,
+                            'chargeback': CONTRIB_CHARGEBACK})
+            purchases = set(tuple(row) for row in cursor.fetchall())
+            if purchases:
+                self.invalidate(purchases)
+        self.since = since
+
+    def maybe_refresh(self):
+        now = time()
+        if now - self.checked < settings.SERVICES_VERIFY_CACHE_REFRESH:
+            return
+        if not self.refreshing.acquire(False):
+            return
+
+        try:
+            conn = mypool.connect()
+            cursor = conn.cursor()
+            try:
+                self.refresh(cursor)
+                self.checked = now
+            finally:
+                cursor.close()
+                conn.close()
+        finally:
+            self.refreshing.release()
+
+
+cache = None
+if getattr(settings, 'SERVICES_VERIFY_CACHE', 0):
+    cache = ReceiptCache(settings.SERVICES_VERIFY_CACHE)
+
+
+def get_cache():
+    """Returns the receipt cache if it's enabled, or None."""
+    if cache is None:
+        return None
+    cache.maybe_refresh()
+    return cache
+
+
 class Verify:
 
-    def __init__(self, addon_id, receipt, environ):
+    def __init__(self, addon_id, receipt, environ, cache=None):
         # The regex should ensure that only sane ints get to this point.
         self.addon_id = int(addon_id)
         self.receipt = receipt
         self.environ = environ
+        self.cache = cache
+        self.user_id = None
         # This is so the unit tests can override the connection.
         self.conn, self.cursor = None, None
 
     def __call__(self):
+        if self.cache:
+            self.cache_key = self.cache.key(self.addon_id, self.receipt)
+            verdict = self.cache.get(self.cache_key)
+            if verdict:
+                return verdict
+
         if not self.cursor:
             self.conn = mypool.connect()
             self.cursor = self.conn.cursor()
@@ -85,9 +191,16 @@ class Verify:
             self.log('The addon_id in the receipt and the URL did not match.')
             return self.invalid()
 
-        sql = """SELECT id, user_id, premium_type FROM users_install
-                 WHERE addon_id = %(addon_id)s
-                 AND uuid = %(uuid)s LIMIT 1;"""
+        # Get the install and, if there is one, the purchase in one go.
+        sql = """SELECT users_install.id, users_install.user_id,
+                        users_install.premium_type,
+                        addon_purchase.id, addon_purchase.type
+                 FROM users_install
+                 LEFT JOIN addon_purchase
+                    ON addon_purchase.addon_id = users_install.addon_id
+                    AND addon_purchase.user_id = users_install.user_id
+                 WHERE users_install.addon_id = %(addon_id)s
+                 AND users_install.uuid = %(uuid)s LIMIT 1;"""
         self.cursor.execute(sql, {'addon_id': self.addon_id,
                                   'uuid': uuid})
         result = self.cursor.fetchone()
@@ -96,7 +209,7 @@ class Verify:
             self.log('No entry in users_install for uuid: %s' % uuid)
             return self.invalid()
 
-        rid, user_id, premium = result
+        rid, self.user_id, premium, purchase_id, purchase_type = result
 
         # If it's a premium addon, then we need to get that the purchase
         # information.
@@ -105,21 +218,15 @@ class Verify:
             return self.ok_or_expired(receipt)
 
         else:
-            sql = """SELECT id, type FROM addon_purchase
-                     WHERE addon_id = %(addon_id)s
-                     AND user_id = %(user_id)s LIMIT 1;"""
-            self.cursor.execute(sql, {'addon_id': self.addon_id,
-                                      'user_id': user_id})
-            result = self.cursor.fetchone()
-            if not result:
+            if purchase_id is None:
                 self.log('Invalid receipt, no purchase')
                 return self.invalid()
 
-            if result[-1] in [CONTRIB_REFUND, CONTRIB_CHARGEBACK]:
+            if purchase_type in [CONTRIB_REFUND, CONTRIB_CHARGEBACK]:
                 self.log('Valid receipt, but refunded')
                 return self.refund()
 
-            elif result[-1] == CONTRIB_PURCHASE:
+            elif purchase_type == CONTRIB_PURCHASE:
                 self.log('Valid receipt')
                 return self.ok_or_expired(receipt)
 
@@ -161,6 +268,10 @@ class Verify:
                                     datetime.utcfromtimestamp(now)))
             return self.expired(receipt)
 
+        if self.cache:
+            # Hand out the cached verdict only while this one would stand.
+            self.cache.set(self.cache_key, self.ok(), expire - 10,
+                           self.addon_id, self.user_id)
         return self.ok()
 
     def ok(self):
@@ -213,7 +324,7 @@ def application(environ, start_response):
             return [output]
 
         try:
-            verify = Verify(addon_id, data, environ)
+            verify = Verify(addon_id, data, environ, cache=get_cache())
             output = verify()
             start_response(status, verify.get_headers(len(output)))
             cef(environ, addon_id, 'verify', 'Receipt verification')
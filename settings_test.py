@@ -44,6 +44,8 @@ SEND_REAL_EMAIL = True
 
 # Turn off search engine indexing.
 USE_ELASTIC = False
+# Reindex on save right away, without the redis queue.
+ADDON_REINDEX_DEBOUNCE = 0
 
 # Ensure all validation code runs in tests:
 VALIDATE_ADDONS = True